@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+
+import data_manager
+import evogym_arrays
+import headless
+import utils
+
+# Headless batch processing of exported environments. No viewer or GUI modules are
+# imported, so this runs without a display, GLFW or Tk:
+#
+#   python src/batch.py validate exported/ --jobs 8 --report report.json
+#   python src/batch.py convert exported/ --to .npz --out converted/
+#   python src/batch.py resave exported/
+#   python src/batch.py stats exported/ --report stats.json
+#   python src/batch.py export exported/ --out arrays/
+#   python src/batch.py render exported/ --out thumbnails/ --size 128x128
+#
+# Finished files are appended to a progress journal together with the command and options
+# they were processed with. --resume skips files that are already in it, have not changed
+# since and were processed the same way, with their output still in place.
+
+EXTENSIONS = ('.json', data_manager.BINARY_EXTENSION, '.egw')
+OUTPUT_COMMANDS = ('convert', 'resave', 'export', 'render')
+TYPE_NAMES = {
+    utils.CELL_RIGID: 'rigid',
+    utils.CELL_SOFT: 'soft',
+    utils.CELL_ACT_H: 'act_h',
+    utils.CELL_ACT_V: 'act_v',
+    utils.CELL_FIXED: 'fixed'}
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.endswith(EXTENSIONS) and not name.endswith(evogym_arrays.EXPORT_SUFFIX):
+                        files.append(os.path.join(root, name))
+        else:
+            files.append(path)
+    return files
+
+def file_key(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def journal_options(options):
+    # options as they are stored in the journal, tuples become lists
+    return json.loads(json.dumps(options))
+
+def is_done(previous, path, command, options):
+    if previous == None or previous['command'] != command or previous.get('options') != journal_options(options):
+        return False
+    if not os.path.exists(path) or previous['key'] != file_key(path):
+        return False
+    return previous.get('output') == None or os.path.exists(previous['output'])
+
+def check_state(grid, objects):
+    errors = []
+
+    types = grid.types
+    if (types > utils.CELL_FIXED).any():
+        errors.append(f'{int((types > utils.CELL_FIXED).sum())} cells have an unknown voxel type')
+
+    empty = types == utils.CELL_EMPTY
+    dangling = (grid.right[:, :-1] & (empty[:, :-1] | empty[:, 1:])).sum() + (grid.down[:-1, :] & (empty[:-1, :] | empty[1:, :])).sum()
+    if dangling > 0:
+        errors.append(f'{int(dangling)} connections touch empty cells')
+
+    names = {}
+    for object_id, obj in objects.items():
+        names[obj.name] = names.get(obj.name, 0) + 1
+    for name, count in names.items():
+        if count > 1:
+            errors.append(f'object name {name!r} is used {count} times')
+
+    # every stored object must be exactly one connected component
+    labels, components = utils.label_components(grid)
+    flat_labels = labels.reshape(-1)
+    covered = 0
+    for object_id, obj in objects.items():
+        nodes = np.fromiter(obj.nodes, dtype=np.int64, count=len(obj.nodes))
+        covered += len(nodes)
+        object_labels = np.unique(flat_labels[nodes])
+        if (object_labels == -1).any():
+            errors.append(f'object {obj.name!r} contains empty cells')
+        elif len(object_labels) > 1:
+            errors.append(f'object {obj.name!r} is split into {len(object_labels)} disconnected pieces')
+        elif len(components[object_labels[0]]) != len(nodes):
+            errors.append(f'object {obj.name!r} is connected to voxels of another object')
+    if covered != int((~empty).sum()):
+        errors.append(f'{int((~empty).sum()) - covered} voxels do not belong to any object')
+
+    return errors
+
+def get_stats(grid, objects):
+    counts = np.bincount(grid.types.reshape(-1), minlength=utils.CELL_FIXED+1)
+    sizes = [len(obj.nodes) for obj in objects.values()]
+    return {
+        'grid_width': grid.width,
+        'grid_height': grid.height,
+        'objects': len(objects),
+        'voxels': int(counts[1:].sum()),
+        'voxel_types': {name: int(counts[cell_type]) for cell_type, name in TYPE_NAMES.items()},
+        'connections': int(grid.right.sum() + grid.down.sum()),
+        'largest_object': max(sizes, default=0)}
+
+def output_path(path, options):
+    root, ext = os.path.splitext(path)
+    ext = options['to'] or ext
+    if options['out'] == None:
+        return root + ext
+    rel = os.path.relpath(root, options['base']) if options['base'] != None else os.path.basename(root)
+    return os.path.join(options['out'], rel + ext)
+
+def find_collisions(files, command, options):
+
+    # inputs whose output path is also the output of another input, like big.json and
+    # big.egw under convert --to .npz, mapped to those other inputs
+    if not command in OUTPUT_COMMANDS:
+        return {}
+    by_output = {}
+    for path in files:
+        by_output.setdefault(os.path.abspath(output_path(path, options)), []).append(path)
+    collisions = {}
+    for paths in by_output.values():
+        if len(paths) > 1:
+            for path in paths:
+                collisions[path] = [other for other in paths if other != path]
+    return collisions
+
+def process_file(task):
+    path, command, options = task
+    result = {'path': path, 'command': command, 'options': journal_options(options), 'key': None, 'ok': False, 'errors': []}
+    start = time.time()
+
+    try:
+        result['key'] = file_key(path)
+
+        dm = data_manager.DataManager()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            loaded_state = dm.load(path)
+        result['errors'].extend(str(warning.message) for warning in caught)
+        if loaded_state == None:
+            if len(result['errors']) == 0:
+                result['errors'].append('could not load file')
+            return result
+
+        grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count = loaded_state
+        result['stats'] = get_stats(grid, objects)
+
+        if command == 'validate':
+            result['errors'].extend(check_state(grid, objects))
+
+        if command in ('convert', 'resave', 'export'):
+            out_path = output_path(path, options)
+            out_dir = os.path.dirname(out_path)
+            if out_dir != '':
+                os.makedirs(out_dir, exist_ok=True)
+            dm.save(out_path, grid, objects)
+            result['output'] = out_path
+            if os.path.abspath(out_path) == os.path.abspath(path):
+                # resave rewrote the input, --resume compares against the new file
+                result['key'] = file_key(path)
+
+        if command == 'render':
+            out_path = output_path(path, options)
+            out_dir = os.path.dirname(out_path)
+            if out_dir != '':
+                os.makedirs(out_dir, exist_ok=True)
+            width, height = options['size']
+            headless.write_png(out_path, headless.render_image(grid, objects, width, height))
+            result['output'] = out_path
+
+        result['ok'] = len(result['errors']) == 0
+    except Exception as e:
+        result['errors'].append(f'{type(e).__name__}: {e}')
+    finally:
+        result['seconds'] = round(time.time() - start, 4)
+
+    return result
+
+def read_journal(journal_path):
+    done = {}
+    if journal_path == None or not os.path.exists(journal_path):
+        return done
+    with open(journal_path, 'r') as infile:
+        for line in infile:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # a line cut off by an interruption
+                continue
+            done[result['path']] = result
+    return done
+
+def summarize(command, results, seconds):
+    summary = {
+        'command': command,
+        'files': len(results),
+        'ok': sum(1 for result in results if result['ok']),
+        'failed': sum(1 for result in results if not result['ok']),
+        'seconds': round(seconds, 3),
+        'objects': 0,
+        'voxels': 0,
+        'voxel_types': {name: 0 for name in TYPE_NAMES.values()}}
+    for result in results:
+        stats = result.get('stats')
+        if stats == None:
+            continue
+        summary['objects'] += stats['objects']
+        summary['voxels'] += stats['voxels']
+        for name, count in stats['voxel_types'].items():
+            summary['voxel_types'][name] += count
+    summary['results'] = sorted(results, key=lambda result: result['path'])
+    return summary
+
+def run(command, files, options, jobs=None, chunk_size=8, journal_path=None, resume=False, progress=True):
+    start = time.time()
+    if resume and journal_path == None:
+        raise ValueError('resuming needs a journal')
+
+    done = read_journal(journal_path) if resume else {}
+    files = list(dict.fromkeys(files))
+    collisions = find_collisions(files, command, options)
+    results = []
+    tasks = []
+    for path in files:
+        if path in collisions:
+            others = ', '.join(collisions[path])
+            results.append({'path': path, 'command': command, 'key': None, 'ok': False,
+                'errors': [f'output {output_path(path, options)} would also be written by {others}']})
+            continue
+        previous = done.get(path)
+        if is_done(previous, path, command, options):
+            results.append(previous)
+        else:
+            tasks.append((path, command, options))
+
+    journal = None
+    if journal_path != None:
+        journal = open(journal_path, 'a' if resume else 'w')
+
+    try:
+        with Pool(jobs) as pool:
+            for count, result in enumerate(pool.imap_unordered(process_file, tasks, chunksize=chunk_size)):
+                results.append(result)
+                if journal != None:
+                    journal.write(json.dumps(result) + '\n')
+                    journal.flush()
+                if progress:
+                    status = 'ok' if result['ok'] else 'FAILED'
+                    print(f'[{count+1}/{len(tasks)}] {status} {result["path"]}', file=sys.stderr)
+    finally:
+        if journal != None:
+            journal.close()
+
+    return summarize(command, results, time.time() - start)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Validate, convert and inspect exported environments without the GUI.')
+    parser.add_argument('command', choices=['validate', 'convert', 'resave', 'stats', 'export', 'render'])
+    parser.add_argument('paths', nargs='*', help='files or directories to process (default: exported)')
+    parser.add_argument('--files-from', default=None, help='read the work list from a file, one path per line')
+    parser.add_argument('--to', default=None, choices=list(EXTENSIONS), help='output format for convert')
+    parser.add_argument('--out', default=None, help='output directory for convert/resave/export/render (default: next to the input)')
+    parser.add_argument('--size', default='256x256', help='image size for render, WIDTHxHEIGHT')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=8, help='files handed to a worker at a time')
+    parser.add_argument('--report', default=None, help='write a JSON summary report to this path')
+    parser.add_argument('--journal', default=None, help='progress journal (default: <report>.progress.jsonl)')
+    parser.add_argument('--resume', action='store_true', help='skip files already finished in the journal')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(args)
+
+    if args.command == 'convert' and args.to == None:
+        parser.error('convert needs --to')
+    if args.command == 'export':
+        # evogym body and connection arrays, one archive per world
+        args.to = evogym_arrays.EXPORT_SUFFIX
+    if args.command == 'render':
+        args.to = '.png'
+
+    try:
+        size = tuple(int(value) for value in args.size.lower().split('x'))
+    except ValueError:
+        size = ()
+    if len(size) != 2 or min(size) < 1:
+        parser.error(f'--size must look like 256x256, got {args.size!r}')
+
+    if len(args.paths) == 0 and args.files_from == None:
+        args.paths = ['exported']
+    files = find_files(args.paths)
+    if args.files_from != None:
+        with open(args.files_from, 'r') as infile:
+            files.extend(line.strip() for line in infile if line.strip() != '')
+
+    journal_path = args.journal
+    if journal_path == None and args.report != None:
+        journal_path = args.report + '.progress.jsonl'
+    if args.resume and journal_path == None:
+        parser.error('--resume needs --report or --journal to know which files are done')
+
+    base = args.paths[0] if len(args.paths) == 1 and os.path.isdir(args.paths[0]) else None
+    options = {'to': args.to, 'out': args.out, 'base': base, 'size': size}
+
+    summary = run(args.command, files, options, args.jobs, max(args.chunk_size, 1), journal_path, args.resume, not args.quiet)
+
+    if args.report != None:
+        with open(args.report, 'w') as outfile:
+            json.dump(summary, outfile, indent=4)
+
+    print(f'{summary["command"]}: {summary["ok"]}/{summary["files"]} ok, {summary["objects"]} objects, {summary["voxels"]} voxels in {summary["seconds"]}s')
+    return 0 if summary['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+import json
+import mmap
+import struct
+import numpy as np
+
+import utils
+from grid_core import Grid
+
+# Tiled on-disk world format for very long terrains.
+#
+#   header      magic, version, world size, chunk size and the location of the name table
+#   chunk index one uint64 file offset per chunk in row-major chunk order, 0 if the chunk
+#               has never been written (all empty)
+#   chunks      fixed-size payloads: cell types (uint8), object ids (int32), packed right
+#               edge bits and packed down edge bits, each chunk_size x chunk_size cells
+#   name table  JSON with object names, merged object id aliases and id counters
+#
+# The file is opened with mmap so only the chunks that are read get paged in. Chunks that
+# are written are kept in memory and marked dirty, flush() writes back only those.
+#
+# flush() never overwrites data the index or the header on disk refer to. Dirty chunks are
+# written copy-on-write to free slots, a changed name table is appended at the end of the
+# file, then the index and last the header are written. A crash part way through leaves
+# the previous version of every chunk and the previous table readable. A crash while the
+# index itself is written can leave some chunks at their new and some at their old
+# version, each of them complete. Slots given up by a flush are reused by the next ones
+# while the world is open. Slots and tables left over when it is closed stay unused,
+# rewriting the world with DataManager.convert drops them.
+
+CHUNKED_EXTENSION = '.egw'
+CHUNKED_MAGIC = b'EGCW'
+CHUNKED_VERSION = 1
+
+HEADER = struct.Struct('<4sIQQIQQ')
+HEADER_SIZE = 64
+
+class ChunkedWorld:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+        try:
+            self.read_header()
+        except BaseException:
+            self.close()
+            raise
+
+        self.chunks = {}
+        self.dirty = set()
+
+        # (cx, cy) -> object ids stored in the chunk, for pruning the name table
+        self.chunk_ids = {}
+
+        # chunk slots no longer referred to by the index on disk
+        self.free_slots = []
+        self.saved_table = self.encode_table(self.names, self.aliases, self.next_object_id, self.unnamed_obj_count)
+
+    def read_header(self,):
+        try:
+            magic, version, width, height, chunk_size, names_offset, names_length = HEADER.unpack_from(self.map, 0)
+        except struct.error:
+            raise ValueError(f'{self.file_path} is too short for a chunked world header.')
+        if magic != CHUNKED_MAGIC or version != CHUNKED_VERSION:
+            raise ValueError(f'{self.file_path} is not a chunked world file.')
+
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.chunks_x = -(-width//chunk_size)
+        self.chunks_y = -(-height//chunk_size)
+
+        cells = chunk_size*chunk_size
+        self.chunk_bytes = cells*5 + cells//4
+        self.data_offset = HEADER_SIZE + 8*self.chunks_x*self.chunks_y
+        if self.data_offset > len(self.map) or names_offset+names_length > len(self.map):
+            raise ValueError(f'{self.file_path} is truncated, the chunk index or name table is missing.')
+        self.index = np.frombuffer(self.map, dtype='<u8', count=self.chunks_x*self.chunks_y, offset=HEADER_SIZE).copy()
+        self.names_offset = names_offset
+
+        try:
+            table = json.loads(self.map[names_offset:names_offset+names_length].decode('utf-8'))
+            self.names = {int(key): value for key, value in table['names'].items()}
+            self.aliases = {int(key): value for key, value in table['aliases'].items()}
+            self.next_object_id = table['next_object_id']
+            self.unnamed_obj_count = table['unnamed_obj_count']
+        except (KeyError, ValueError, AttributeError) as e:
+            raise ValueError(f'{self.file_path} has an invalid name table: {type(e).__name__}: {e}')
+
+    @classmethod
+    def create(cls, file_path, width, height, chunk_size=64):
+        if chunk_size <= 0 or chunk_size%8 != 0:
+            raise ValueError('Chunk size must be a positive multiple of 8.')
+
+        chunks = -(-width//chunk_size) * -(-height//chunk_size)
+        names_offset = HEADER_SIZE + 8*chunks
+        table = cls.encode_table({}, {}, 0, 1)
+
+        with open(file_path, 'wb') as outfile:
+            outfile.write(HEADER.pack(CHUNKED_MAGIC, CHUNKED_VERSION, width, height, chunk_size, names_offset, len(table)).ljust(HEADER_SIZE, b'\0'))
+            # the index is all zeros, leave it as a hole in the file
+            outfile.seek(names_offset)
+            outfile.write(table)
+        return cls(file_path)
+
+    @staticmethod
+    def encode_table(names, aliases, next_object_id, unnamed_obj_count):
+        return json.dumps({
+            'names': names,
+            'aliases': aliases,
+            'next_object_id': next_object_id,
+            'unnamed_obj_count': unnamed_obj_count}).encode('utf-8')
+
+    def close(self,):
+        self.map.close()
+        self.file.close()
+
+    ### chunks ###
+
+    def get_chunk(self, cx, cy):
+        key = (cx, cy)
+        if key in self.chunks:
+            return self.chunks[key]
+
+        cs = self.chunk_size
+        cells = cs*cs
+        offset = int(self.index[cy*self.chunks_x + cx])
+        if offset == 0:
+            chunk = {
+                'types': np.zeros((cs, cs), dtype=np.uint8),
+                'ids': np.full((cs, cs), -1, dtype=np.int32),
+                'right': np.zeros((cs, cs), dtype=bool),
+                'down': np.zeros((cs, cs), dtype=bool)}
+        else:
+            data = np.frombuffer(self.map, dtype=np.uint8, count=self.chunk_bytes, offset=offset)
+            chunk = {
+                'types': data[:cells].reshape(cs, cs).copy(),
+                'ids': data[cells:cells*5].view('<i4').reshape(cs, cs).astype(np.int32),
+                'right': np.unpackbits(data[cells*5:cells*5+cells//8]).reshape(cs, cs).astype(bool),
+                'down': np.unpackbits(data[cells*5+cells//8:]).reshape(cs, cs).astype(bool)}
+        self.chunks[key] = chunk
+        return chunk
+
+    def chunk_ranges(self, x0, y0, width, height):
+        cs = self.chunk_size
+        for cy in range(y0//cs, (y0+height-1)//cs + 1):
+            for cx in range(x0//cs, (x0+width-1)//cs + 1):
+                # overlap of the region and the chunk in world coordinates
+                lx, hx = max(x0, cx*cs), min(x0+width, (cx+1)*cs)
+                ly, hy = max(y0, cy*cs), min(y0+height, (cy+1)*cs)
+                yield cx, cy, (slice(ly-cy*cs, hy-cy*cs), slice(lx-cx*cs, hx-cx*cs)), (slice(ly-y0, hy-y0), slice(lx-x0, hx-x0))
+
+    def evict(self, x0, y0, width, height):
+        # drop clean chunks that do not overlap the given region
+        keep = set((cx, cy) for cx, cy, _, _ in self.chunk_ranges(x0, y0, width, height))
+        for key in list(self.chunks):
+            if not key in keep and not key in self.dirty:
+                del self.chunks[key]
+
+    ### regions ###
+
+    def clip(self, x0, y0, x1, y1):
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        return x0, y0, max(x1-x0, 0), max(y1-y0, 0)
+
+    def read_region(self, x0, y0, width, height):
+        types = np.zeros((height, width), dtype=np.uint8)
+        ids = np.full((height, width), -1, dtype=np.int32)
+        right = np.zeros((height, width), dtype=bool)
+        down = np.zeros((height, width), dtype=bool)
+        if width == 0 or height == 0:
+            return types, right, down, ids
+
+        for cx, cy, src, dst in self.chunk_ranges(x0, y0, width, height):
+            chunk = self.get_chunk(cx, cy)
+            types[dst] = chunk['types'][src]
+            ids[dst] = chunk['ids'][src]
+            right[dst] = chunk['right'][src]
+            down[dst] = chunk['down'][src]
+
+        ids[types == utils.CELL_EMPTY] = -1
+        if len(self.aliases) > 0:
+            unique, inverse = np.unique(ids, return_inverse=True)
+            ids = np.array([self.resolve(object_id) for object_id in unique.tolist()], dtype=np.int32)[inverse].reshape(height, width)
+
+        # edges leaving the region are not part of it
+        if width > 0:
+            right[:, -1] = False
+        if height > 0:
+            down[-1, :] = False
+        return types, right, down, ids
+
+    def write_region(self, x0, y0, types, right, down, ids):
+        # edges on the last column/row of the region lead out of it and are left untouched
+        self.write_layer('types', x0, y0, types)
+        self.write_layer('ids', x0, y0, ids)
+        self.write_layer('right', x0, y0, right[:, :-1])
+        self.write_layer('down', x0, y0, down[:-1, :])
+
+    def write_layer(self, key, x0, y0, values):
+        height, width = values.shape
+        if width == 0 or height == 0:
+            return
+        for cx, cy, src, dst in self.chunk_ranges(x0, y0, width, height):
+            chunk = self.get_chunk(cx, cy)
+            if not np.array_equal(chunk[key][src], values[dst]):
+                chunk[key][src] = values[dst]
+                self.dirty.add((cx, cy))
+
+    ### objects ###
+
+    def resolve(self, object_id):
+        root = object_id
+        while root in self.aliases:
+            root = self.aliases[root]
+        while object_id in self.aliases and self.aliases[object_id] != root:
+            self.aliases[object_id], object_id = root, self.aliases[object_id]
+        return root
+
+    def merge_ids(self, object_id, target_id):
+        if object_id != target_id:
+            self.aliases[object_id] = target_id
+            self.names.pop(object_id, None)
+
+    def read_grid(self, x0, y0, width, height):
+        types, right, down, ids = self.read_region(x0, y0, width, height)
+
+        grid = Grid(width, height)
+        grid.types[:], grid.right[:], grid.down[:] = types, right, down
+        grid.origin_x, grid.origin_y = x0, y0
+        grid.world_shape = (self.width, self.height)
+
+        nodes = np.flatnonzero(ids.reshape(-1) != -1)
+        node_ids = ids.reshape(-1)[nodes]
+        node_to_object = dict(zip(nodes.tolist(), node_ids.tolist()))
+
+        objects = {}
+        for node_id, object_id in node_to_object.items():
+            if not object_id in objects:
+                objects[object_id] = utils.Object()
+                objects[object_id].name = self.names.get(object_id)
+                if objects[object_id].name == None:
+                    objects[object_id].name = f'new_object_{self.unnamed_obj_count}'
+                    self.unnamed_obj_count += 1
+            objects[object_id].nodes[node_id] = True
+
+        return grid, objects, node_to_object
+
+    def write_grid(self, grid, objects, node_to_object):
+        ids = np.full(grid.size, -1, dtype=np.int32)
+        if len(node_to_object) > 0:
+            ids[np.fromiter(node_to_object.keys(), dtype=np.int64)] = np.fromiter(node_to_object.values(), dtype=np.int64)
+        self.write_region(grid.origin_x, grid.origin_y, grid.types, grid.right, grid.down, ids.reshape(grid.height, grid.width))
+
+        for object_id, obj in objects.items():
+            self.names[object_id] = obj.name
+
+    ### saving ###
+
+    def get_chunk_ids(self, cx, cy):
+        key = (cx, cy)
+        if key in self.chunk_ids and not key in self.dirty:
+            return self.chunk_ids[key]
+
+        chunk = self.chunks.get(key)
+        offset = int(self.index[cy*self.chunks_x + cx])
+        if chunk != None:
+            types, ids = chunk['types'], chunk['ids']
+        elif offset != 0:
+            # read straight from the file, without keeping the chunk in memory
+            cells = self.chunk_size*self.chunk_size
+            data = np.frombuffer(self.map, dtype=np.uint8, count=cells*5, offset=offset)
+            types, ids = data[:cells], data[cells:].view('<i4')
+        else:
+            return set()
+        self.chunk_ids[key] = set(np.unique(ids.reshape(-1)[types.reshape(-1) != utils.CELL_EMPTY]).tolist())
+        return self.chunk_ids[key]
+
+    def prune_table(self,):
+
+        # names and aliases of object ids that are no longer stored in any chunk
+        stored = set()
+        for cy in range(self.chunks_y):
+            for cx in range(self.chunks_x):
+                stored |= self.get_chunk_ids(cx, cy)
+        self.aliases = {object_id: self.resolve(object_id) for object_id in list(self.aliases) if object_id in stored}
+        live = set(self.resolve(object_id) for object_id in stored)
+        self.names = {object_id: name for object_id, name in self.names.items() if object_id in live}
+
+    def flush(self,):
+        table = self.encode_table(self.names, self.aliases, self.next_object_id, self.unnamed_obj_count)
+        if len(self.dirty) == 0 and table == self.saved_table:
+            return
+        self.prune_table()
+        table = self.encode_table(self.names, self.aliases, self.next_object_id, self.unnamed_obj_count)
+
+        # dirty chunks go to free slots or after everything in the file, the table after them
+        end = len(self.map)
+        index = self.index.copy()
+        replaced = []
+        for cx, cy in sorted(self.dirty):
+            slot = cy*self.chunks_x + cx
+            if index[slot] != 0:
+                replaced.append(int(index[slot]))
+            if len(self.free_slots) > 0:
+                index[slot] = self.free_slots.pop()
+            else:
+                index[slot] = end
+                end += self.chunk_bytes
+        names_offset = self.names_offset
+        if table != self.saved_table:
+            names_offset = end
+            end += len(table)
+
+        if end != len(self.map):
+            self.map.close()
+            self.file.truncate(end)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+
+        for cx, cy in self.dirty:
+            chunk = self.chunks[(cx, cy)]
+            offset = int(index[cy*self.chunks_x + cx])
+            payload = b''.join((
+                chunk['types'].tobytes(),
+                chunk['ids'].astype('<i4').tobytes(),
+                np.packbits(chunk['right']).tobytes(),
+                np.packbits(chunk['down']).tobytes()))
+            self.map[offset:offset+self.chunk_bytes] = payload
+        if names_offset != self.names_offset:
+            self.map[names_offset:names_offset+len(table)] = table
+        self.map.flush()
+
+        # the new chunks and table are on disk, now point the index and the header at them
+        self.map[HEADER_SIZE:self.data_offset] = index.astype('<u8').tobytes()
+        self.map.flush()
+        if names_offset != self.names_offset:
+            HEADER.pack_into(self.map, 0, CHUNKED_MAGIC, CHUNKED_VERSION, self.width, self.height, self.chunk_size, names_offset, len(table))
+            self.map.flush()
+
+        self.index = index
+        self.names_offset = names_offset
+        self.free_slots.extend(replaced)
+        for key in self.dirty:
+            self.chunk_ids.pop(key, None)
+        self.dirty = set()
+        self.saved_table = table
@@ -1,120 +1,611 @@
+import array
 import json
+import numpy as np
 import utils
+import chunked_world
+import evogym_arrays
+import robot_import
 import os
+import struct
+import threading
 import warnings
+import zipfile
+import zlib
 
-class DataManager():
+# Binary worlds are .npz archives. The type array is stored once in editor orientation
+# (row 0 at the top), each edge is stored once as a packed right/down bit mask and the
+# object table is kept separately as names plus concatenated node indices.
+BINARY_EXTENSION = '.npz'
+BINARY_MAGIC = b'PK\x03\x04'
+BINARY_VERSION = 1
+
+# Delta saves append one JSON line per save to <file>.delta with the objects that were
+# removed (by name) and the objects that changed since the previous save. Loading applies
+# the lines in order on top of the full file, a full save removes the delta file again.
+# Each line records the size and modification time of the full file it was written
+# against. Lines for another version of the full file, left behind when a full save was
+# interrupted before it could remove the delta file, are ignored.
+DELTA_SUFFIX = '.delta'
+
+class JsonStreamReader():
+
+    # incremental parser for the top level of an environment file. Scalar entries are
+    # decoded as they come and the entries of "objects" are handed to a callback one at
+    # a time, so only a single object is ever held in memory.
+    def __init__(self, infile, chunk_size=1<<16):
+        self.infile = infile
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        chunk = self.infile.read(size)
+        if chunk == '':
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self,):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                break
+            self.fill(self.chunk_size)
+        if self.pos < len(self.buffer):
+            return self.buffer[self.pos]
+        return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} at offset {self.pos} of the read buffer.')
+        self.pos += 1
+
+    def decode(self,):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # numbers and literals can be cut off at the end of the buffer
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # read geometrically more so a large value is not re-parsed too often
+            self.fill(size)
+            size *= 2
+
+    def read(self, handle_object):
+        state = {}
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            self.expect_end()
+            return state
+        while True:
+            key = self.decode()
+            self.expect(':')
+            if key == 'objects':
+                state['objects'] = self.read_objects(state, handle_object)
+            else:
+                state[key] = self.decode()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            self.expect_end()
+            return state
+
+    def expect_end(self,):
+        if self.peek() != '':
+            raise ValueError(f'unexpected data after the end of the environment: {self.buffer[self.pos:self.pos+20]!r}')
+
+    def read_objects(self, state, handle_object):
+        count = 0
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return count
+        while True:
+            name = self.decode()
+            self.expect(':')
+            handle_object(state, name, self.decode())
+            count += 1
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return count
+
+class JsonObjectBuffer():
+
+    # objects of an environment file are appended to flat int64 arrays while the file is
+    # streamed in, then validated and scattered into the grid with a few vectorized passes.
+    # Indices stay in file orientation (row 0 at the bottom) until build.
     def __init__(self):
-        pass
+        self.names = []
+        self.sizes = array.array('q')
+        self.indices = array.array('q')
+        self.types = array.array('q')
+        self.degrees = array.array('q')
+        self.targets = array.array('q')
+
+    def add(self, name, obj_data):
+        if not isinstance(obj_data, dict) or not all(key in obj_data for key in ('indices', 'types', 'neighbors')):
+            raise ValueError(f'object {name!r} needs "indices", "types" and "neighbors"')
+        indices, types, neighbors = obj_data['indices'], obj_data['types'], obj_data['neighbors']
+        if not isinstance(indices, list) or not isinstance(types, list) or not isinstance(neighbors, dict):
+            raise ValueError(f'object {name!r} needs lists of indices and types and a mapping of neighbor lists')
+
+        # lists of same length
+        if len(types) != len(indices) or len(neighbors) != len(indices):
+            raise ValueError(f'object {name!r} has {len(indices)} indices, {len(types)} types and {len(neighbors)} neighbor lists')
+
+        try:
+            neighbor_lists = [neighbors[str(index)] for index in indices]
+        except KeyError as e:
+            raise ValueError(f'object {name!r} has no neighbor list for index {e.args[0]}')
+
+        try:
+            self.indices.extend(indices)
+            self.types.extend(types)
+            self.degrees.extend(map(len, neighbor_lists))
+            for neighbor_list in neighbor_lists:
+                self.targets.extend(neighbor_list)
+        except (TypeError, OverflowError):
+            raise ValueError(f'object {name!r} indices, types and neighbors must be integers')
+
+        self.names.append(name)
+        self.sizes.append(len(indices))
+
+    def build(self, grid):
+        width, height = grid.width, grid.height
+        sizes = np.frombuffer(self.sizes, dtype=np.int64)
+        raw_indices = np.frombuffer(self.indices, dtype=np.int64)
+        types = np.frombuffer(self.types, dtype=np.int64)
+        degrees = np.frombuffer(self.degrees, dtype=np.int64)
+        raw_targets = np.frombuffer(self.targets, dtype=np.int64)
+
+        # owner[i] is the object that lists raw_indices[i]
+        owner = np.repeat(np.arange(len(sizes)), sizes)
+        raw_sources = np.repeat(raw_indices, degrees)
+        source_owner = np.repeat(owner, degrees)
+
+        bad = np.flatnonzero((raw_indices < 0) | (raw_indices >= grid.size))
+        if len(bad) > 0:
+            raise ValueError(f'{self.where(owner, bad[0])} index {raw_indices[bad[0]]} is outside the {width}x{height} grid')
+        bad = np.flatnonzero((types < 0) | (types > 255))
+        if len(bad) > 0:
+            raise ValueError(f'{self.where(owner, bad[0])} index {raw_indices[bad[0]]} has invalid voxel type {types[bad[0]]}')
+
+        order = np.argsort(raw_indices, kind='stable')
+        repeated = np.flatnonzero(raw_indices[order[1:]] == raw_indices[order[:-1]])
+        if len(repeated) > 0:
+            first, second = order[repeated[0]], order[repeated[0]+1]
+            if owner[first] == owner[second]:
+                raise ValueError(f'{self.where(owner, first)} lists index {raw_indices[first]} more than once')
+            raise ValueError(f'index {raw_indices[first]} is listed by both {self.where(owner, first)} and {self.where(owner, second)}')
+
+        bad = np.flatnonzero((raw_targets < 0) | (raw_targets >= grid.size))
+        if len(bad) > 0:
+            raise ValueError(f'{self.where(source_owner, bad[0])} index {raw_sources[bad[0]]} has neighbor {raw_targets[bad[0]]} outside the grid')
+        # flipping y keeps adjacency, check it in file coordinates
+        step = raw_targets - raw_sources
+        horizontal = (np.abs(step) == 1) & (raw_targets//width == raw_sources//width)
+        bad = np.flatnonzero(~horizontal & (np.abs(step) != width))
+        if len(bad) > 0:
+            raise ValueError(f'{self.where(source_owner, bad[0])} index {raw_sources[bad[0]]} has neighbor {raw_targets[bad[0]]} that is not adjacent to it')
+
+        # every edge has to be listed by both of its nodes, mark each side per edge slot
+        lower = np.minimum(raw_sources, raw_targets)
+        slots = 2*lower + ~horizontal
+        from_lower = np.zeros(2*grid.size, dtype=bool)
+        from_lower[slots[raw_sources == lower]] = True
+        from_higher = np.zeros(2*grid.size, dtype=bool)
+        from_higher[slots[raw_sources != lower]] = True
+        one_sided = np.flatnonzero(from_lower != from_higher)
+        if len(one_sided) > 0:
+            bad = np.flatnonzero(slots == one_sided[0])[0]
+            raise ValueError(f'{len(one_sided)} connections are listed by only one of their nodes, e.g. {self.where(source_owner, bad)} index {raw_sources[bad]} lists {raw_targets[bad]} but not the other way around')
+
+        # flip y in bulk and scatter into the grid
+        indices = (height-1 - raw_indices//width)*width + raw_indices%width
+        bad = np.flatnonzero(grid.types.reshape(-1)[indices] != utils.CELL_EMPTY)
+        if len(bad) > 0:
+            raise ValueError(f'{self.where(owner, bad[0])} index {raw_indices[bad[0]]} is already used by another object')
+        grid.types.reshape(-1)[indices] = types
+        # file row r is editor row height-1-r, so the file edge from lower to lower+width is
+        # the editor edge down from the cell above it
+        edges = (height-1 - lower//width)*width + lower%width
+        grid.right.reshape(-1)[edges[horizontal]] = True
+        grid.down.reshape(-1)[edges[~horizontal] - width] = True
+
+        objects = {}
+        bounds = [0] + np.cumsum(sizes).tolist()
+        index_list = indices.tolist()
+        for object_id, name in enumerate(self.names):
+            objects[object_id] = utils.Object()
+            objects[object_id].name = name
+            objects[object_id].nodes = dict.fromkeys(index_list[bounds[object_id]:bounds[object_id+1]], True)
+        return objects
+
+    def where(self, owner, position):
+        return f'object {self.names[owner[position]]!r}'
+
+class DataManager():
+    def __init__(self, cache=None):
+        # optional load_cache.LoadCache for parsed JSON and binary files
+        self.cache = cache
+
+    def get_format(self, file_path):
+        if file_path.endswith(evogym_arrays.EXPORT_SUFFIX):
+            return 'evogym'
+        if file_path.endswith(BINARY_EXTENSION):
+            return 'binary'
+        if file_path.endswith(chunked_world.CHUNKED_EXTENSION):
+            return 'chunked'
+        with open(file_path, 'rb') as infile:
+            magic = infile.read(4)
+        if magic == BINARY_MAGIC:
+            return 'binary'
+        if magic == chunked_world.CHUNKED_MAGIC:
+            return 'chunked'
+        return 'json'
 
     def load(self, file_path):
         if not os.path.exists(file_path):
             return None
 
+        file_format = self.get_format(file_path)
+        if file_format == 'chunked':
+            return self.load_chunked(file_path)
+        load_func = {'binary': self.load_binary, 'evogym': self.load_export, 'json': self.load_json}[file_format]
+        if self.cache != None:
+            loaded_state = self.cache.load(file_path, load_func)
+        else:
+            loaded_state = load_func(file_path)
+
+        if loaded_state != None and os.path.exists(self.get_delta_path(file_path)):
+            loaded_state = self.load_delta(file_path, loaded_state)
+        return loaded_state
+
+    def save(self, file_path, grid, objects, compress=True, progress=None):
+
+        # write to a temporary file next to the target and rename it over the target, so
+        # readers never see a partially written file and a failed save keeps the old one
+        temp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
         try:
+            if file_path.endswith(evogym_arrays.EXPORT_SUFFIX):
+                evogym_arrays.save_world_arrays(temp_path, grid, objects, compress)
+            elif file_path.endswith(BINARY_EXTENSION):
+                self.save_binary(temp_path, grid, objects, compress)
+            elif file_path.endswith(chunked_world.CHUNKED_EXTENSION):
+                self.save_chunked(temp_path, grid, objects)
+            else:
+                self.save_json(temp_path, grid, objects, progress)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        # the full file supersedes any deltas written against the old one
+        if os.path.exists(self.get_delta_path(file_path)):
+            os.remove(self.get_delta_path(file_path))
+        if progress != None:
+            progress(len(objects), len(objects))
+
+    def convert(self, in_path, out_path, compress=True):
+        loaded_state = self.load(in_path)
+        if loaded_state == None:
+            return False
+        grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count = loaded_state
+        self.save(out_path, grid, objects, compress)
+        return True
+
+    def load_json(self, file_path):
+
+        try:
+            buffer = JsonObjectBuffer()
             with open(file_path, 'r') as infile:
-                state = json.load(infile)
+                state = JsonStreamReader(infile).read(lambda state, name, obj_data: buffer.add(name, obj_data))
 
-            grid_width = state['grid_width']
-            grid_height = state['grid_height']
+            for key in ('grid_width', 'grid_height', 'objects'):
+                if not key in state:
+                    raise ValueError(f'missing "{key}"')
+            for key in ('grid_width', 'grid_height'):
+                if type(state[key]) != int or state[key] <= 0:
+                    raise ValueError(f'"{key}" must be a positive integer, got {state[key]!r}')
 
-            grid = utils.make_blank_grid(grid_width, grid_height)
-            utils.set_ids(grid)
+            grid = utils.make_blank_grid(state['grid_width'], state['grid_height'])
+            objects = buffer.build(grid)
+            node_to_object = self.get_node_to_object(objects)
+            unnamed_obj_count = self.get_unnamed_obj_count(objects, len(objects)+1)
+
+        except (OSError, ValueError) as e:
+            warnings.warn(f'Could not load {file_path}: {e}')
+            return None
+
+        return grid.width, grid.height, grid, objects, node_to_object, unnamed_obj_count
+
+    def get_delta_path(self, file_path):
+        return file_path + DELTA_SUFFIX
+
+    def get_delta_base(self, file_path):
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def read_delta(self, file_path):
+
+        # the records written against the current full file
+        base = self.get_delta_base(file_path)
+        records = []
+        stale = 0
+        with open(self.get_delta_path(file_path), 'r') as infile:
+            for line in infile:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut off by an interrupted save
+                    continue
+                if type(record) != dict or record.get('base') != base:
+                    stale += 1
+                    continue
+                records.append(record)
+        if stale > 0:
+            warnings.warn(f'Ignoring {stale} records of {self.get_delta_path(file_path)} written for another version of {file_path}')
+        return records
+
+    def load_delta(self, file_path, loaded_state):
+        grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count = loaded_state
+
+        try:
+            by_name = {obj.name: object_id for object_id, obj in objects.items()}
+            for record in self.read_delta(file_path):
+                for name in record['removed'] + list(record['objects']):
+                    object_id = by_name.pop(name, None)
+                    if object_id != None:
+                        obj = objects.pop(object_id)
+                        grid.clear_cells(np.fromiter(obj.nodes, dtype=np.int64, count=len(obj.nodes)))
+
+                buffer = JsonObjectBuffer()
+                for name, obj_data in record['objects'].items():
+                    buffer.add(name, obj_data)
+                next_id = max(objects, default=-1) + 1
+                for i, obj in buffer.build(grid).items():
+                    objects[next_id + i] = obj
+                    by_name[obj.name] = next_id + i
+
+            node_to_object = self.get_node_to_object(objects)
+            unnamed_obj_count = self.get_unnamed_obj_count(objects, unnamed_obj_count)
+
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            warnings.warn(f'Could not apply {self.get_delta_path(file_path)}: {type(e).__name__}: {e}')
+            return None
+
+        return grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count
+
+    def get_delta_record(self, grid, objects, removed_names):
+        return {
+            'removed': removed_names,
+            'objects': {obj.name: self.get_object_dict(grid, obj) for obj in objects}}
+
+    def append_delta(self, file_path, record):
+        if len(record['removed']) == 0 and len(record['objects']) == 0:
+            return
+        record = dict(record, base=self.get_delta_base(file_path))
+        delta_path = self.get_delta_path(file_path)
+        with open(delta_path, 'ab+') as outfile:
+            outfile.seek(0, os.SEEK_END)
+            if outfile.tell() > 0:
+                # start on a fresh line if an earlier save was interrupted mid-line
+                outfile.seek(-1, os.SEEK_END)
+                if outfile.read(1) != b'\n':
+                    outfile.write(b'\n')
+            outfile.write(json.dumps(record).encode('utf-8') + b'\n')
+
+    def get_node_to_object(self, objects):
+        node_to_object = {}
+        for object_id, obj in objects.items():
+            for node_id in obj.nodes:
+                node_to_object[node_id] = object_id
+        return node_to_object
+
+    def get_unnamed_obj_count(self, objects, unnamed_obj_count):
+        for object_id, obj in objects.items():
+            if 'new_object_' in obj.name:
+                remaining_name = obj.name[obj.name.index('new_object_')+len('new_object_'):]
+                try:
+                    existing_int = int(remaining_name)
+                    if unnamed_obj_count <= existing_int:
+                        unnamed_obj_count = existing_int+1
+                except:
+                    pass
+        return unnamed_obj_count
+
+    def load_binary(self, file_path):
+
+        # entry is the archive entry being read, for the error message
+        entry = None
+        try:
+            with np.load(file_path, allow_pickle=False) as state:
+                entry = 'grid_size'
+                grid_width, grid_height = state['grid_size'].tolist()
+
+                grid = utils.make_blank_grid(grid_width, grid_height)
+                entry = 'types'
+                grid.types[:] = state['types'].reshape(grid_height, grid_width)
+                entry = 'right'
+                grid.right[:] = np.unpackbits(state['right'], count=grid.size).reshape(grid_height, grid_width)
+                entry = 'down'
+                grid.down[:] = np.unpackbits(state['down'], count=grid.size).reshape(grid_height, grid_width)
+
+                entry = 'object_names'
+                names = state['object_names'].tolist()
+                entry = 'object_offsets'
+                offsets = state['object_offsets'].tolist()
+                if len(offsets) != len(names) + 1:
+                    raise ValueError(f'expected {len(names) + 1} offsets, got {len(offsets)}')
+                entry = 'object_nodes'
+                nodes = state['object_nodes'].tolist()
+            entry = None
 
             objects = {}
-            node_to_object = {}
-            unnamed_obj_count = 1
-
-            # read in objects
-            for name, obj_data in state['objects'].items():
-
-                # assert lists of same length
-                assert len(obj_data['indices'])  == len(obj_data['types'])
-                assert len(obj_data['indices'])  == len(obj_data['neighbors'])
-
-                objects[unnamed_obj_count-1] = utils.Object()
-                curr_object = objects[unnamed_obj_count-1]
-                curr_object.name = name
-
-                # read in indices and types
-                for i in range(len(obj_data['indices'])):
-                    index_curr = utils.flip_y(obj_data['indices'][i], grid_width, grid_height)
-                    type_curr = obj_data['types'][i]
-                    curr_object.nodes[index_curr] = True
-                    utils.get_node_by_index(grid, index_curr).type = type_curr
-
-                    # set node neighbors
-                    index_raw = obj_data['indices'][i]
-                    for nei in obj_data['neighbors'][f'{index_raw}']:
-                        utils.get_node_by_index(grid, index_curr).neighbors[utils.flip_y(nei, grid_width, grid_height)] = True
-
-                # set node neighbors
-                # for node in curr_object.nodes:
-                #     neighbors = [
-                #         utils.get_left(grid, node), 
-                #         utils.get_right(grid, node), 
-                #         utils.get_up(grid, node), 
-                #         utils.get_down(grid, node)]
-                #     for nei in neighbors:
-                #         if nei != None and nei.id in curr_object.nodes:
-                #             utils.get_node_by_index(grid, node).neighbors[nei.id] = True
-
-                #update object counts            
-                unnamed_obj_count += 1  
-
-            # set reverse dictionary
-            node_to_object = {}
-            for object_id, obj in objects.items():
-                for node_id in obj.nodes:
-                    node_to_object[node_id] = object_id
-
-            # set unnamed object numbering
-            for object_id, obj in objects.items():
-                if 'new_object_' in obj.name:
-                    remaining_name = obj.name[obj.name.index('new_object_')+len('new_object_'):]
-                    try:
-                        existing_int = int(remaining_name)
-                        if unnamed_obj_count <= existing_int:
-                            unnamed_obj_count = existing_int+1
-                    except:
-                        pass
-
-
-        except Exception as e:
-            warnings.warn("Could not load file. Please check that your file has not been corrupted.")
+            for object_id, name in enumerate(names):
+                objects[object_id] = utils.Object()
+                objects[object_id].name = name
+                objects[object_id].nodes = dict.fromkeys(nodes[offsets[object_id]:offsets[object_id+1]], True)
+
+            node_to_object = self.get_node_to_object(objects)
+            unnamed_obj_count = self.get_unnamed_obj_count(objects, len(objects)+1)
+
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile, zlib.error) as e:
+            where = f' (entry "{entry}")' if entry != None else ''
+            warnings.warn(f'Could not load {file_path}{where}: {type(e).__name__}: {e}')
             return None
 
         return grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count
 
+    def load_export(self, file_path):
 
-    def save(self, file_path, grid, objects):
-        grid_height = len(grid)
-        grid_width = len(grid[0])
+        # evogym exports hold each object as a body and connections array at a position, they
+        # are placed into a blank grid like imported robots
+        try:
+            (grid_width, grid_height), robots = evogym_arrays.load_world_arrays(file_path)
+            grid = utils.make_blank_grid(grid_width, grid_height)
+            pieces = robot_import.place_robots(grid, robots)
+            objects = robot_import.get_objects(pieces)
+            node_to_object = self.get_node_to_object(objects)
+            unnamed_obj_count = self.get_unnamed_obj_count(objects, len(objects)+1)
+
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile, zlib.error) as e:
+            warnings.warn(f'Could not load {file_path}: {type(e).__name__}: {e}')
+            return None
 
-        out = {
-            'grid_width': grid_width,
-            'grid_height': grid_height,
-            'objects': None}
+        return grid.width, grid.height, grid, objects, node_to_object, unnamed_obj_count
 
-        objects_dict = {}
+    def save_binary(self, file_path, grid, objects, compress=True):
+
+        names = []
+        offsets = [0]
+        nodes = []
         for object_id, obj in objects.items():
-            indices = []
-            types = []
-            neighbors = {}
-            for idx in obj.nodes:
-                indices.append(utils.flip_y(idx, grid_width, grid_height))
-                types.append(utils.get_node_by_index(grid, idx).type)
+            names.append(obj.name)
+            nodes.extend(obj.nodes)
+            offsets.append(len(nodes))
+
+        state = {
+            'format_version': np.array(BINARY_VERSION),
+            'grid_size': np.array([grid.width, grid.height], dtype=np.int64),
+            'types': grid.types,
+            'right': np.packbits(grid.right),
+            'down': np.packbits(grid.down),
+            'object_names': np.array(names, dtype=str),
+            'object_offsets': np.array(offsets, dtype=np.int64),
+            'object_nodes': np.array(nodes, dtype=np.int64)}
+
+        # np.savez appends .npz to paths without it, so write through a file object
+        with open(file_path, 'wb') as outfile:
+            if compress:
+                np.savez_compressed(outfile, **state)
+            else:
+                np.savez(outfile, **state)
+
+    def load_chunked(self, file_path):
+
+        try:
+            world = chunked_world.ChunkedWorld(file_path)
+            try:
+                loaded_state = self.read_world(world)
+            finally:
+                world.close()
+        except (OSError, KeyError, ValueError, struct.error) as e:
+            warnings.warn(f'Could not load {file_path}: {type(e).__name__}: {e}')
+            return None
+
+        return loaded_state
+
+    def read_world(self, world):
+
+        # materialize a whole chunked world. Objects are relabeled from connectivity, ids stored
+        # in the chunks only carry the names over.
+        grid, stored_objects, stored_node_to_object = world.read_grid(0, 0, world.width, world.height)
+        grid.world_shape = None
+
+        objects = {}
+        used_ids = {}
+        unnamed_obj_count = world.unnamed_obj_count
+        for object_id, obj in utils.get_objects(grid).items():
+            stored_id = stored_node_to_object[next(iter(obj.nodes))]
+            if not stored_id in used_ids:
+                used_ids[stored_id] = True
+                obj.name = stored_objects[stored_id].name
+            else:
+                obj.name = f'new_object_{unnamed_obj_count}'
+                unnamed_obj_count += 1
+            objects[object_id] = obj
+
+        node_to_object = self.get_node_to_object(objects)
+        unnamed_obj_count = self.get_unnamed_obj_count(objects, unnamed_obj_count)
+        return grid.width, grid.height, grid, objects, node_to_object, unnamed_obj_count
 
-                ns = list(utils.get_node_by_index(grid, idx).neighbors.keys())
-                for i in range(len(ns)):
-                    ns[i] = utils.flip_y(ns[i], grid_width, grid_height)
-                neighbors[utils.flip_y(idx, grid_width, grid_height)] = ns
+    def save_chunked(self, file_path, grid, objects, chunk_size=64):
+        world = chunked_world.ChunkedWorld.create(file_path, grid.width, grid.height, chunk_size)
+        try:
+            world.write_grid(grid, objects, self.get_node_to_object(objects))
+            world.next_object_id = max(objects, default=-1) + 1
+            world.unnamed_obj_count = self.get_unnamed_obj_count(objects, 1)
+            world.flush()
+        finally:
+            world.close()
 
-            obj_dict = {'indices': indices, 'types': types, 'neighbors': neighbors}
+    def save_json(self, file_path, grid, objects, progress=None):
+        grid_height = len(grid)
+        grid_width = len(grid[0])
 
-            objects_dict[obj.name] = obj_dict
-        out['objects'] = objects_dict
+        # objects are serialized and written one at a time, the output matches
+        # json.dump(out, outfile, indent=4) on the full dictionary byte for byte
+        by_name = {}
+        for object_id, obj in objects.items():
+            by_name[obj.name] = obj
 
-        
         with open(file_path, 'w') as outfile:
-            json.dump(out, outfile, indent=4)
\ No newline at end of file
+            outfile.write('{\n')
+            outfile.write(f'    "grid_width": {json.dumps(grid_width)},\n')
+            outfile.write(f'    "grid_height": {json.dumps(grid_height)},\n')
+            outfile.write('    "objects": {')
+
+            for count, (name, obj) in enumerate(by_name.items()):
+                obj_dict = self.get_object_dict(grid, obj)
+                obj_json = json.dumps(obj_dict, indent=4).replace('\n', '\n        ')
+                if count > 0:
+                    outfile.write(',')
+                outfile.write(f'\n        {json.dumps(name)}: {obj_json}')
+                if progress != None:
+                    progress(count+1, len(by_name))
+
+            if len(by_name) > 0:
+                outfile.write('\n    ')
+            outfile.write('}\n}')
+
+    def get_object_dict(self, grid, obj):
+        grid_height = len(grid)
+        grid_width = len(grid[0])
+
+        indices = []
+        types = []
+        neighbors = {}
+        for idx in obj.nodes:
+            indices.append(utils.flip_y(idx, grid_width, grid_height))
+            types.append(utils.get_node_by_index(grid, idx).type)
+
+            ns = list(utils.get_node_by_index(grid, idx).neighbors.keys())
+            for i in range(len(ns)):
+                ns[i] = utils.flip_y(ns[i], grid_width, grid_height)
+            neighbors[utils.flip_y(idx, grid_width, grid_height)] = ns
+
+        return {'indices': indices, 'types': types, 'neighbors': neighbors}
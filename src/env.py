@@ -1,7 +1,17 @@
 from json import load
+from collections import deque
+import numpy as np
+import os
+import warnings
 from colors import ACT_H_VOXEL, ACT_V_VOXEL, EMPTY_VOXEL, FIXED_VOXEL, RIGID_VOXEL, SOFT_VOXEL
 import utils
 import data_manager
+import chunked_world
+import load_cache
+import robot_import
+import saving
+import scene_geometry
+import profiler
 
 class Env:
     def __init__(self):
@@ -9,7 +19,6 @@ class Env:
         self.grid_height = 10
 
         self.grid = utils.make_blank_grid(self.grid_width, self.grid_height)
-        utils.set_ids(self.grid)
 
         self.mode = utils.VOXELS
         self.selector = utils.CELL_SOFT
@@ -17,6 +26,7 @@ class Env:
         self.objects = {}
         self.node_to_object = {}
         self.unnamed_obj_count = 1
+        self.next_object_id = 0
 
         self.hovered_object_id = None
         self.selected_object_id = None
@@ -24,37 +34,259 @@ class Env:
         self.just_altered = None
         self.need_to_update_objects = False
 
-        self.dm = data_manager.DataManager()
+        # border bars and hoverable edges of the grid, shared with the viewer
+        self.boundary_mask = scene_geometry.BoundaryMask()
 
-    def update(self, hovered, selected, mouse_pressed, mouse_held, key_presses, mode_data):
+        # stage timing, replaced by the main loop's profiler
+        self.profiler = profiler.FrameProfiler()
+
+        # chunked world the grid is a window into, if one is open
+        self.world = None
+
+        self.dm = data_manager.DataManager(cache=load_cache.LoadCache())
+        self.saver = saving.BackgroundSaver()
+
+        # objects changed since the last save and the file it went to, for delta saves
+        self.dirty_objects = set()
+        self.saved_file = None
+        self.saved_names = {}
+        self.delta_count = 0
+        self.compact_every = 16
+
+    def update(self, hovered, selected, mouse_pressed, mouse_held, key_presses, mode_data, stroke=None):
         
         self.need_to_update_objects = False
         self.just_altered = None
 
-        if mouse_pressed:
-            self.handle_mouse_press(hovered)
-        if mouse_held:
-            self.handle_mouse_held(hovered)
+        with self.profiler.stage('edit'):
+            if mouse_pressed:
+                self.handle_mouse_press(hovered)
+            if mouse_held:
+                self.handle_mouse_held(hovered, stroke)
 
         # self.handle_key_presses(key_presses)
         self.update_mode(mode_data)
 
-        if self.need_to_update_objects:
-            self.update_objects()
+        # objects are maintained incrementally by the edit functions, need_to_update_objects
+        # only signals that they changed this frame
 
-        self.update_active_objects(hovered, selected)
+        with self.profiler.stage('update_active_objects'):
+            self.update_active_objects(hovered, selected)
 
     def load(self, file_name):
+        if file_name.endswith(chunked_world.CHUNKED_EXTENSION):
+            self.open_world(file_name)
+            return
+
         loaded_state = self.dm.load(file_name)
         if loaded_state == None:
             return
 
+        self.close_world()
         self.grid_width, self.grid_height, self.grid, self.objects, self.node_to_object, self.unnamed_obj_count = loaded_state
+        self.next_object_id = max(self.objects, default=-1) + 1
+        self.hovered_object_id = None
+        self.selected_object_id = None
+
+        # files can hold objects that are not connected or edges between two objects, the
+        # incremental edits assume every object is one connected component. One relabel
+        # merges and splits them like the editor would.
+        loaded_objects = self.objects
+        with self.profiler.stage('update_objects'):
+            self.update_objects()
+        self.reset_save_state(file_name)
+
+        if len(self.objects) != len(loaded_objects) or any(not object_id in loaded_objects or loaded_objects[object_id].nodes != obj.nodes for object_id, obj in self.objects.items()):
+            # the editor no longer matches the file, the next save writes it in full
+            self.saved_file = None
+
+    def save(self, file_name, delta=False):
+        self.prepare_save(file_name, delta=delta)()
+
+    def save_in_background(self, file_name, delta=False):
+        if self.world != None and os.path.abspath(file_name) == os.path.abspath(self.world.file_path):
+            # flushing a chunked world in place only writes the edited chunks
+            self.save(file_name)
+            self.saver.finished.append((file_name, None))
+            return
+
+        # a queued save of the same file is replaced by this one, so a delta record it holds
+        # would be lost. The replacing save writes the full file instead.
+        if file_name in self.saver.pending:
+            delta = False
+        self.saver.request(file_name, lambda: self.prepare_save(file_name, copy=True, delta=delta))
+
+    def prepare_save(self, file_name, copy=False, delta=False):
+
+        # returns a function that writes file_name. With copy it works on copies of the state,
+        # so it can run on another thread while editing continues.
+        if self.world != None:
+            self.commit_view()
+            if os.path.abspath(file_name) == os.path.abspath(self.world.file_path):
+                return lambda progress=None: self.world.flush()
+            grid, objects = self.dm.read_world(self.world)[2:4]
+            return lambda progress=None: self.dm.save(file_name, grid, objects, progress=progress)
+
+        # with delta, saving again to the file that was last loaded or saved only appends the
+        # objects that changed since to its delta file, every compact_every saves it is
+        # rewritten. evogym does not read delta files, so delta saves are opt-in (the GUI's Delta
+        # checkbox).
+        record = self.get_delta_record(file_name) if delta else None
+        if record != None:
+            self.delta_count += 1
+        else:
+            self.delta_count = 0
+            grid, objects = self.grid, self.objects
+            if copy:
+                grid, objects = grid.copy(), {object_id: obj.copy() for object_id, obj in objects.items()}
+        self.saved_names = {object_id: obj.name for object_id, obj in self.objects.items()}
+        self.dirty_objects = set()
+
+        def write(progress=None):
+            try:
+                if record != None:
+                    # the record holds the changes since the save before it, which has to
+                    # have completed. A queued delta save after a failed one is refused.
+                    if self.saved_file == None:
+                        raise RuntimeError('the previous save failed, save again to write the full file')
+                    self.dm.append_delta(file_name, record)
+                else:
+                    self.dm.save(file_name, grid, objects, progress=progress)
+            except BaseException:
+                # the next save has to write the full file
+                self.saved_file = None
+                raise
+            self.saved_file = self.get_saved_key(file_name)
+        return write
+
+    def get_saved_key(self, file_name):
+        try:
+            stat = os.stat(file_name)
+            delta_path = self.dm.get_delta_path(file_name)
+            delta_size = os.path.getsize(delta_path) if os.path.exists(delta_path) else 0
+        except OSError:
+            return None
+        return os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size, delta_size
+
+    def get_delta_record(self, file_name):
+        if self.saved_file == None or self.delta_count >= self.compact_every:
+            return None
+        if self.get_saved_key(file_name) != self.saved_file:
+            return None
+
+        # only JSON files are read with their delta file applied, evogym exports, binary and
+        # chunked files are always written in full
+        if self.dm.get_format(file_name) != 'json':
+            return None
+        path, mtime, size, delta_size = self.saved_file
+        if delta_size > size//2:
+            return None
+
+        # renamed objects are removed under their old name and written under the new one
+        removed = []
+        changed = set(self.dirty_objects)
+        for object_id, name in self.saved_names.items():
+            if not object_id in self.objects or self.objects[object_id].name != name:
+                removed.append(name)
+        for object_id, obj in self.objects.items():
+            if self.saved_names.get(object_id) != obj.name:
+                changed.add(object_id)
+
+        objects = [self.objects[object_id] for object_id in sorted(changed) if object_id in self.objects]
+        return self.dm.get_delta_record(self.grid, objects, removed)
+
+    def reset_save_state(self, file_name=None):
+
+        # the current state matches file_name, or no file if None
+        self.saved_file = self.get_saved_key(file_name) if file_name != None else None
+        self.saved_names = {object_id: obj.name for object_id, obj in self.objects.items()}
+        self.dirty_objects = set()
+        self.delta_count = 0
+        if file_name != None and os.path.exists(self.dm.get_delta_path(file_name)):
+            self.delta_count = len(self.dm.read_delta(file_name))
+
+    def get_save_status(self,):
+        finished = self.saver.poll()
+        return self.saver.current, self.saver.progress, len(self.saver.pending), finished
+
+    def get_scene_version(self,):
+
+        # changes with every edit, load, resize and import. The main loop compares it across
+        # idle waits, since GUI callbacks can change the scene without any window input.
+        return (id(self.grid), self.grid.width, self.grid.height, self.boundary_mask.version, id(self.objects), len(self.objects))
+
+    ### chunked worlds ###
+
+    def open_world(self, file_name):
+        try:
+            world = chunked_world.ChunkedWorld(file_name)
+        except (OSError, ValueError) as e:
+            warnings.warn(f'Could not open world {file_name}: {e}')
+            return
+
+        self.close_world()
+        self.world = world
+        self.page_view(0, 0, 64, 64, commit=False)
+        self.reset_save_state()
+
+    def close_world(self,):
+        if self.world != None:
+            self.world.close()
+            self.world = None
+
+    def commit_view(self,):
+        self.world.write_grid(self.grid, self.objects, self.node_to_object)
+        self.world.next_object_id = self.next_object_id
+        self.world.unnamed_obj_count = self.unnamed_obj_count
+
+    def page_view(self, x0, y0, x1, y1, commit=True):
+        if commit:
+            self.commit_view()
+
+        x0, y0, width, height = self.world.clip(x0, y0, x1, y1)
+        self.grid, self.objects, self.node_to_object = self.world.read_grid(x0, y0, width, height)
+        self.world.evict(x0, y0, width, height)
+
+        self.grid_width, self.grid_height = self.grid.width, self.grid.height
+        self.next_object_id = self.world.next_object_id
+        self.unnamed_obj_count = self.world.unnamed_obj_count
         self.hovered_object_id = None
         self.selected_object_id = None
 
-    def save(self, file_name):
-        self.dm.save(file_name, self.grid, self.objects)
+    def update_view(self, x0, y0, x1, y1):
+
+        # page in a new window once the visible cells get close to the edge of the current one,
+        # returns True if node indices changed
+        if self.world == None:
+            return False
+
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, self.world.width), min(y1, self.world.height)
+        ox, oy = self.grid.origin_x, self.grid.origin_y
+        lx, ly = ox if ox == 0 else ox+1, oy if oy == 0 else oy+1
+        hx = ox+self.grid_width if ox+self.grid_width == self.world.width else ox+self.grid_width-1
+        hy = oy+self.grid_height if oy+self.grid_height == self.world.height else oy+self.grid_height-1
+        if x0 >= lx and y0 >= ly and x1 <= hx and y1 <= hy:
+            return False
+
+        margin_x, margin_y = max(8, (x1-x0)//2), max(8, (y1-y0)//2)
+        self.page_view(x0-margin_x, y0-margin_y, x1+margin_x, y1+margin_y)
+        return True
+
+    def on_view_border(self, index):
+
+        # cells on the outer ring of a window may have connections to cells that are not paged in
+        if self.world == None:
+            return False
+        x, y = self.grid.coords(index)
+        if x == 0 and self.grid.origin_x > 0:
+            return True
+        if y == 0 and self.grid.origin_y > 0:
+            return True
+        if x == self.grid_width-1 and self.grid.origin_x+self.grid_width < self.world.width:
+            return True
+        if y == self.grid_height-1 and self.grid.origin_y+self.grid_height < self.world.height:
+            return True
+        return False
 
     def update_mode(self, mode_data):
         self.mode = mode_data['mode']
@@ -80,29 +312,143 @@ class Env:
 
     def update_objects(self,):
 
+        # full relabel, object ids and names are carried over through node_to_object
         new_objects = utils.get_objects(self.grid)
 
-        for object_id, obj in new_objects.items():
+        objects = {}
+        for obj in new_objects.values():
+            object_id = None
             for node_id in obj.nodes:
-                if obj.name != None:
+                old_id = self.node_to_object.get(node_id)
+                if old_id != None and old_id in self.objects and not old_id in objects:
+                    object_id = old_id
+                    obj.name = self.objects[old_id].name
                     break
-                for curr_obj_id, curr_obj in self.objects.items():
-                    if node_id in curr_obj.nodes:
-                        obj.name = curr_obj.name
-                        break
-            if obj.name == None:
-                obj.name = f'new_object_{self.unnamed_obj_count}'
-                self.unnamed_obj_count += 1
+            if object_id == None:
+                object_id = self.new_object_id()
+                obj.name = self.new_object_name()
+            objects[object_id] = obj
 
-        self.objects = {}
-        for object_id, obj in new_objects.items():
-            self.objects[object_id] = obj.copy()
+        self.objects = objects
 
         self.node_to_object = {}
         for object_id, obj in self.objects.items():
             for node_id in obj.nodes:
                 self.node_to_object[node_id] = object_id
 
+    def new_object_id(self,):
+        object_id = self.next_object_id
+        self.next_object_id += 1
+        return object_id
+
+    def new_object_name(self,):
+        name = f'new_object_{self.unnamed_obj_count}'
+        self.unnamed_obj_count += 1
+        return name
+
+    def merge_objects(self, index, others):
+
+        # attach index to the objects of its connected neighbors, the largest object survives
+        object_ids = []
+        for other in others:
+            object_id = self.node_to_object[other]
+            if not object_id in object_ids:
+                object_ids.append(object_id)
+
+        if len(object_ids) == 0:
+            target_id = self.new_object_id()
+            self.objects[target_id] = utils.Object()
+            self.objects[target_id].name = self.new_object_name()
+        else:
+            target_id = max(object_ids, key=lambda object_id: len(self.objects[object_id].nodes))
+
+        target = self.objects[target_id]
+        for object_id in object_ids:
+            if object_id == target_id:
+                continue
+            for node_id in self.objects[object_id].nodes:
+                target.nodes[node_id] = True
+                self.node_to_object[node_id] = target_id
+            del self.objects[object_id]
+            if self.world != None:
+                # the object may continue outside of the paged in window
+                self.world.merge_ids(object_id, target_id)
+
+        if index != None and not index in target.nodes:
+            target.nodes[index] = True
+            self.node_to_object[index] = target_id
+        self.dirty_objects.add(target_id)
+        return target_id
+
+    def split_object(self, object_id, seeds):
+
+        # seeds are nodes of object_id that may no longer be connected to each other. A
+        # breadth first search runs from each seed in lockstep and searches that meet are
+        # merged. Once a search runs out of nodes it has found a complete piece, and we stop
+        # as soon as a single search is left, so only the pieces that split off are visited.
+        seeds = list(dict.fromkeys(seeds))
+        if len(seeds) < 2:
+            return
+
+        owner = {}
+        root = list(range(len(seeds)))
+        frontiers = [deque([seed]) for seed in seeds]
+        found = [[seed] for seed in seeds]
+        for i, seed in enumerate(seeds):
+            owner[seed] = i
+
+        def find(i):
+            while root[i] != i:
+                root[i] = root[root[i]]
+                i = root[i]
+            return i
+
+        live = list(range(len(seeds)))
+        done = []
+        while len(live) > 1:
+            for i in list(live):
+                if root[i] != i:
+                    continue
+                if len(frontiers[i]) == 0:
+                    live.remove(i)
+                    done.append(i)
+                    continue
+                node = frontiers[i].popleft()
+                for other in self.grid.connected_neighbors(node):
+                    j = owner.get(other)
+                    if j == None:
+                        owner[other] = i
+                        found[i].append(other)
+                        frontiers[i].append(other)
+                        continue
+                    j = find(j)
+                    if j != i:
+                        root[j] = i
+                        frontiers[i].extend(frontiers[j])
+                        found[i].extend(found[j])
+                        live.remove(j)
+
+        # pieces that reach the edge of a paged in window may still be connected outside of it
+        def touches_border(i):
+            return any(self.on_view_border(node_id) for node_id in found[i])
+
+        if len(live) == 0:
+            done.sort(key=lambda i: (touches_border(i), len(found[i])))
+            done.pop()
+        if self.world != None:
+            done = [i for i in done if not touches_border(i)]
+
+        obj = self.objects[object_id]
+        for i in done:
+            new_id = self.new_object_id()
+            self.dirty_objects.add(new_id)
+            self.objects[new_id] = utils.Object()
+            self.objects[new_id].name = self.new_object_name()
+            for node_id in found[i]:
+                del obj.nodes[node_id]
+                self.objects[new_id].nodes[node_id] = True
+                self.node_to_object[node_id] = new_id
+
     # def handle_key_presses(self, key_presses):
     #     if key_presses['z']:
     #         self.selector = utils.CELL_EMPTY
@@ -119,129 +465,76 @@ class Env:
 
     def change_gs(self, new_width, new_height):
 
-        old_width = self.grid_width
-        if new_width < old_width:
-            for i in range(new_width, old_width):
-                self.remove_col(new_width, with_cleanup=True)
-        if new_width > old_width:
-            for i in range(old_width, new_width):
-                self.add_col(i, with_cleanup=True)
-
-        old_height = self.grid_height
-        if new_height < old_height:
-            for i in range(0, old_height-new_height):
-                self.remove_row(0, with_cleanup=True)
-        if new_height > old_height:
-            for i in range(0, new_height-old_height):
-                self.add_row(0, with_cleanup=True)
-
-        self.grid_height = len(self.grid)
-        self.grid_width = len(self.grid[0])
-
-        self.hovered_object_id = None
-        self.selected_object_id = None
-
-        # print(self.grid_width, self.grid_height)
-
-    def remove_col(self, col_idx, with_cleanup=True):
-
-        # print(f'Removing col {col_idx}')
-
-        for y in range(self.grid_height):
-            if self.grid[y][col_idx].type != utils.CELL_EMPTY:
-                # print('Removing: ', self.grid[y][col_idx].id)
-                self.remove_node(self.grid[y][col_idx].id)
-                self.update_objects()
-        for y in range(self.grid_height):
-            del self.grid[y][col_idx]
-
-        if with_cleanup:    
-            self.grid_height = len(self.grid)
-            self.grid_width = len(self.grid[0])
-            self.update_indices()
-
-    def add_col(self, col_idx, with_cleanup=True):
-
-        # print(f'Adding col {col_idx}')
+        if self.world != None:
+            warnings.warn('Resizing chunked worlds is not supported.')
+            return False
 
-        for y in range(self.grid_height):
-            self.grid[y].insert(col_idx, utils.Node(0))
+        # columns are added/removed on the right and rows on the top
+        remap = self.grid.crop(0, self.grid_height - new_height, new_width, new_height)
 
-        if with_cleanup:    
-            self.grid_height = len(self.grid)
-            self.grid_width = len(self.grid[0])
-            self.update_indices()
+        self.grid_height = self.grid.height
+        self.grid_width = self.grid.width
 
-    def remove_row(self, row_idx, with_cleanup=True):
+        self.update_indices(remap)
+        with self.profiler.stage('update_objects'):
+            self.update_objects()
+        self.reset_save_state()
 
-    
-        # print(f'Removing row {row_idx}')
+        self.hovered_object_id = None
+        self.selected_object_id = None
+        return True
+
+    def import_robots(self, robots):
+
+        # robots are (name, body, connections, (x, y)) in evogym's layout, see robot_import.
+        # Raises ValueError and leaves the editor untouched if a robot cannot be placed.
+        if self.world != None:
+            raise ValueError('importing robots into chunked worlds is not supported')
+
+        grid = self.grid.copy()
+        pieces = robot_import.place_robots(grid, robots)
+        self.grid = grid
+
+        # the new objects get their names from the robots, ids and the rest of the objects
+        # are settled by one relabel
+        names = [obj.name for obj in self.objects.values()]
+        imported = []
+        for obj in robot_import.get_objects(pieces, names).values():
+            object_id = self.new_object_id()
+            self.objects[object_id] = obj
+            for node_id in obj.nodes:
+                self.node_to_object[node_id] = object_id
+            imported.append(object_id)
+        with self.profiler.stage('update_objects'):
+            self.update_objects()
 
-        for x in range(self.grid_width):
-            if self.grid[row_idx][x].type != utils.CELL_EMPTY:
-                # print('Removing: ', self.grid[row_idx][x].id)
-                self.remove_node(self.grid[row_idx][x].id)
-                self.update_objects()
-        del self.grid[row_idx]
+        self.dirty_objects.update(imported)
+        self.need_to_update_objects = True
+        return imported
 
-        if with_cleanup:    
-            self.grid_height = len(self.grid)
-            self.grid_width = len(self.grid[0])
-            self.update_indices()
+    def import_robot_files(self, paths, spacing=1):
 
-    def add_row(self, row_idx, with_cleanup=True):
+        # robot archives or directories of them, laid out in rows from the top left corner
+        robots = robot_import.arrange_robots(robot_import.iter_robots(paths), self.grid_width, self.grid_height, spacing)
+        return self.import_robots(robots)
 
-        # print(f'Add row {row_idx}')
+    def update_indices(self, remap):
 
-        self.grid.insert(row_idx, [])
-        for x in range(self.grid_width):
-            self.grid[row_idx].append(utils.Node(0))
+        # connectivity lives in the grid arrays, so only node_to_object needs remapping. Objects
+        # are rebuilt from it afterwards by update_objects, which keeps their ids and names.
+        old_nodes = np.fromiter(self.node_to_object.keys(), dtype=np.int64, count=len(self.node_to_object))
+        object_ids = np.fromiter(self.node_to_object.values(), dtype=np.int64, count=len(self.node_to_object))
 
-        if with_cleanup:    
-            self.grid_height = len(self.grid)
-            self.grid_width = len(self.grid[0])
-            self.update_indices()
+        new_nodes = remap[old_nodes]
+        keep = new_nodes != -1
+        self.node_to_object = dict(zip(new_nodes[keep].tolist(), object_ids[keep].tolist()))
 
-    def update_indices(self,):
-        
-        # get mapping
-        utils.set_old_ids(self.grid)
-        utils.set_ids(self.grid)
-
-        old_to_new = {}
-        for y in range(self.grid_height):
-            for x in range(self.grid_width):
-                old_to_new[self.grid[y][x].old_id] = self.grid[y][x].id
-
-        disp = []
-        for key, value in old_to_new.items():
-            disp.append((key, value))
-
-        # update neighbors
-        for y in range(self.grid_height):
-            for x in range(self.grid_width):
-                neighbors_copy = self.grid[y][x].neighbors.copy()
-                self.grid[y][x].neighbors = {}
-                for neigh in neighbors_copy:
-                    self.grid[y][x].neighbors[old_to_new[neigh]] = True 
-
-        # update objects
-        for object_id, obj in self.objects.items():
-            nodes_copy = obj.nodes.copy()
-            obj.nodes = {}
-            for node in nodes_copy:
-                obj.nodes[old_to_new[node]] = True
-
-        # update node to objects
-        self.node_to_object = {}
-        for object_id, obj in self.objects.items():
-            for node_id in obj.nodes:
-                self.node_to_object[node_id] = object_id
-        
     def handle_mouse_press(self, hovered):
 
         if hovered == None:
             return
+        if hovered[0] == 'edge' and any(self.on_view_border(int(index)) for index in hovered[1].split()):
+            return
 
         if self.mode == utils.EDGES and hovered[0] == 'edge':
             a, b = tuple(hovered[1].split())
@@ -249,67 +542,125 @@ class Env:
             self.toggle_connection(a, b)
             self.just_altered = hovered
 
-    def handle_mouse_held(self, hovered):
-        
-        if hovered == None:
+    def handle_mouse_held(self, hovered, stroke=None):
+
+        # stroke is the cells the cursor passed over since the last frame, see
+        # Viewer.get_stroke. They are painted along with the hovered cell in one batch.
+        if self.mode != utils.VOXELS:
             return
 
-        if self.mode == utils.VOXELS and hovered[0] == 'node':
-            node = self.get_node_by_index(hovered[2])
+        indices = [] if stroke == None else list(stroke)
+        if hovered != None and hovered[0] == 'node':
+            indices.append(hovered[2])
+        indices = [index for index in dict.fromkeys(indices) if not self.on_view_border(index)]
 
-            if self.selector == utils.CELL_EMPTY:
-                if node.type != utils.CELL_EMPTY:
-                    self.remove_node(hovered[2])
-            else:
-                if node.type == utils.CELL_EMPTY:
-                    self.add_node(hovered[2], self.selector)
-                    self.just_altered = hovered
-                else:
-                    if node.type != self.selector:
-                        self.edit_node(hovered[2], self.selector)
-                        self.just_altered = hovered
+        changed = self.paint_nodes(indices, self.selector)
+        if hovered != None and hovered[0] == 'node' and hovered[2] in changed and self.selector != utils.CELL_EMPTY:
+            self.just_altered = hovered
+
+    def paint_nodes(self, indices, value):
+
+        # set the cells to value, returns the ones that changed. The objects and the boundary
+        # mask are updated once for all of them.
+        types = [self.grid.get_type(index) for index in indices]
+        if value == utils.CELL_EMPTY:
+            removed = [index for index, old in zip(indices, types) if old != utils.CELL_EMPTY]
+            self.remove_nodes(removed)
+            return set(removed)
+
+        added = [index for index, old in zip(indices, types) if old == utils.CELL_EMPTY]
+        edited = [index for index, old in zip(indices, types) if old != utils.CELL_EMPTY and old != value]
+        for index in edited:
+            self.edit_node(index, value)
+        self.add_nodes(added, value)
+        return set(added) | set(edited)
 
     def toggle_connection(self, a_id, b_id):
-        a_node = self.get_node_by_index(a_id)
-        b_node = self.get_node_by_index(b_id)
+        connected = self.grid.is_connected(a_id, b_id)
+        self.grid.set_connected(a_id, b_id, not connected)
+        self.boundary_mask.update(self.grid, [a_id, b_id])
 
-        if a_id in b_node.neighbors:
-            del b_node.neighbors[a_id]
-            del a_node.neighbors[b_id]
+        if connected:
+            self.split_object(self.node_to_object[a_id], [a_id, b_id])
         else:
-            b_node.neighbors[a_id] = True
-            a_node.neighbors[b_id] = True
+            self.merge_objects(None, [a_id, b_id])
+        self.dirty_objects.add(self.node_to_object[a_id])
+        self.dirty_objects.add(self.node_to_object[b_id])
 
         self.need_to_update_objects = True
 
     def remove_node(self, index):
-        self.get_node_by_index(index).type = utils.CELL_EMPTY
-        neighbors = [self.get_left(index), self.get_right(index), self.get_up(index), self.get_down(index)]
+        self.remove_nodes([index])
 
-        for node in neighbors:
-            if node == None or node.type == utils.CELL_EMPTY:
-                continue
-            if index in node.neighbors:
-                del node.neighbors[index]
-            if node.id in self.get_node_by_index(index).neighbors:
-                del self.get_node_by_index(index).neighbors[node.id]            
+    def remove_nodes(self, indices):
+
+        # the remaining connected neighbors of the removed cells seed one split per object
+        if len(indices) == 0:
+            return
+        removed = set(indices)
+        seeds = {}
+        for index in indices:
+            object_id = self.node_to_object.pop(index)
+            others = [other for other in self.grid.connected_neighbors(index) if not other in removed]
+            seeds.setdefault(object_id, []).extend(others)
+            self.grid.set_type(index, utils.CELL_EMPTY)
+            self.grid.clear_connections(index)
+            del self.objects[object_id].nodes[index]
+        self.boundary_mask.update(self.grid, indices)
+
+        for object_id, others in seeds.items():
+            self.dirty_objects.add(object_id)
+            if len(self.objects[object_id].nodes) == 0:
+                del self.objects[object_id]
+            else:
+                self.split_object(object_id, others)
 
         self.need_to_update_objects = True
 
     def add_node(self, index, value):
-        self.get_node_by_index(index).type = value
-        neighbors = [self.get_left(index), self.get_right(index), self.get_up(index), self.get_down(index)]
+        self.add_nodes([index], value)
 
-        for node in neighbors:
-            if node == None or node.type == utils.CELL_EMPTY:
+    def add_nodes(self, indices, value):
+
+        # the new cells connect to all filled neighbors, and each group of them that is
+        # connected joins the objects it touches in one merge
+        if len(indices) == 0:
+            return
+        for index in indices:
+            self.grid.set_type(index, value)
+        added = set(indices)
+        for index in indices:
+            for other in self.grid.adjacent(index):
+                if self.grid.get_type(other) != utils.CELL_EMPTY:
+                    self.grid.set_connected(index, other, True)
+        self.boundary_mask.update(self.grid, indices)
+
+        for index in indices:
+            if index in self.node_to_object:
                 continue
-            node.neighbors[index] = True
-            self.get_node_by_index(index).neighbors[node.id] = True
+            group, others = [index], []
+            self.node_to_object[index] = None
+            for node in group:
+                for other in self.grid.adjacent(node):
+                    if not other in added:
+                        if self.grid.get_type(other) != utils.CELL_EMPTY:
+                            others.append(other)
+                    elif not other in self.node_to_object:
+                        self.node_to_object[other] = None
+                        group.append(other)
+
+            target_id = self.merge_objects(index, others)
+            target = self.objects[target_id]
+            for node in group:
+                target.nodes[node] = True
+                self.node_to_object[node] = target_id
 
         self.need_to_update_objects = True
 
     def edit_node(self, index, value):
-        self.get_node_by_index(index).type = value
+        self.grid.set_type(index, value)
+        self.boundary_mask.touch()
+        self.dirty_objects.add(self.node_to_object[index])
 
     def get_node_by_index(self, index):
         x, y = index%self.grid_width, index//self.grid_width
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Conversion between editor objects and the arrays evogym builds robots and world objects
+# from (EvoWorld.add_from_array, the robot .npz files of its examples):
+#
+#   body         (h, w) voxel types cropped to the object's bounding box, row 0 at the top,
+#                cells that are not part of the object are empty
+#   connections  (2, n) pairs of connected voxels as row-major indices into body
+#   position     (x, y) of the bottom left corner of body in world coordinates, where y
+#                counts rows from the bottom like the JSON format
+#
+# Cell type values are the same in the editor and evogym (see utils).
+
+EXPORT_SUFFIX = '.evogym.npz'
+
+def get_object_arrays(grid, obj):
+    nodes = np.fromiter(obj.nodes, dtype=np.int64, count=len(obj.nodes))
+    xs, ys = nodes%grid.width, nodes//grid.width
+    x0, y0 = int(xs.min()), int(ys.min())
+    width, height = int(xs.max()) - x0 + 1, int(ys.max()) - y0 + 1
+
+    local = (ys-y0)*width + (xs-x0)
+    body = np.zeros(height*width, dtype=np.int64)
+    body[local] = grid.types[ys, xs]
+
+    # connected neighbors always belong to the same object
+    right = grid.right[ys, xs]
+    down = grid.down[ys, xs]
+    connections = np.concatenate([
+        np.stack([local[right], local[right]+1]),
+        np.stack([local[down], local[down]+width])], axis=1)
+    connections = connections[:, np.lexsort((connections[1], connections[0]))]
+
+    position = np.array([x0, grid.height-1 - (y0+height-1)], dtype=np.int64)
+    return body.reshape(height, width), connections, position
+
+def get_world_arrays(grid, objects):
+    names = []
+    arrays = {}
+    positions = []
+    for i, obj in enumerate(objects.values()):
+        body, connections, position = get_object_arrays(grid, obj)
+        names.append(obj.name)
+        arrays[f'body_{i}'] = body
+        arrays[f'connections_{i}'] = connections
+        positions.append(position)
+
+    arrays['names'] = np.array(names, dtype=str)
+    arrays['positions'] = np.array(positions, dtype=np.int64).reshape(-1, 2)
+    arrays['grid_size'] = np.array([grid.width, grid.height], dtype=np.int64)
+    return arrays
+
+def save_world_arrays(file_path, grid, objects, compress=True):
+
+    # object names can be anything, so arrays are keyed by position in the names list
+    arrays = get_world_arrays(grid, objects)
+    with open(file_path, 'wb') as outfile:
+        if compress:
+            np.savez_compressed(outfile, **arrays)
+        else:
+            np.savez(outfile, **arrays)
+
+def load_world_arrays(file_path):
+
+    # returns the grid size and a list of (name, body, connections, position)
+    with np.load(file_path, allow_pickle=False) as arrays:
+        names = arrays['names'].tolist()
+        positions = arrays['positions'].tolist()
+        objects = [(name, arrays[f'body_{i}'], arrays[f'connections_{i}'], tuple(positions[i])) for i, name in enumerate(names)]
+        return tuple(arrays['grid_size'].tolist()), objects
@@ -0,0 +1,291 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+# Cell types live in a (height, width) uint8 array. Connectivity is stored once per
+# pair of adjacent cells: right[y, x] connects (x, y) to (x+1, y) and down[y, x]
+# connects (x, y) to (x, y+1). The last column of right and the last row of down
+# are always False.
+
+class Grid:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.types = np.zeros((height, width), dtype=np.uint8)
+        self.right = np.zeros((height, width), dtype=bool)
+        self.down = np.zeros((height, width), dtype=bool)
+
+        # position and size of the world this grid was paged in from (see chunked_world)
+        self.origin_x = 0
+        self.origin_y = 0
+        self.world_shape = None
+
+    # list-of-lists compatibility, grid[y][x] returns a NodeView
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.height
+        if y < 0 or y >= self.height:
+            raise IndexError('grid row index out of range')
+        return GridRow(self, y)
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield GridRow(self, y)
+
+    @property
+    def size(self):
+        return self.width*self.height
+
+    def copy(self,):
+        out = Grid(self.width, self.height)
+        out.types[:] = self.types
+        out.right[:] = self.right
+        out.down[:] = self.down
+        out.origin_x, out.origin_y = self.origin_x, self.origin_y
+        out.world_shape = self.world_shape
+        return out
+
+    def index(self, x, y):
+        return y*self.width + x
+
+    def coords(self, index):
+        return index%self.width, index//self.width
+
+    def is_valid(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get_node(self, index):
+        if index < 0 or index >= self.size:
+            raise IndexError(f'node index {index} out of range')
+        return NodeView(self, index)
+
+    def get_type(self, index):
+        x, y = self.coords(index)
+        return int(self.types[y, x])
+
+    def set_type(self, index, value):
+        x, y = self.coords(index)
+        self.types[y, x] = value
+
+    def adjacent(self, index):
+        x, y = self.coords(index)
+        out = []
+        if x > 0:
+            out.append(index-1)
+        if x < self.width-1:
+            out.append(index+1)
+        if y > 0:
+            out.append(index-self.width)
+        if y < self.height-1:
+            out.append(index+self.width)
+        return out
+
+    def edge_slot(self, a, b):
+        if a > b:
+            a, b = b, a
+        ax, ay = self.coords(a)
+        if b == a+1 and ax < self.width-1:
+            return self.right, ay, ax
+        if b == a+self.width and ay < self.height-1:
+            return self.down, ay, ax
+        raise KeyError(f'nodes {a} and {b} are not adjacent')
+
+    def is_connected(self, a, b):
+        try:
+            edges, y, x = self.edge_slot(a, b)
+        except KeyError:
+            return False
+        return bool(edges[y, x])
+
+    def set_connected(self, a, b, value):
+        edges, y, x = self.edge_slot(a, b)
+        edges[y, x] = value
+
+    def connected_neighbors(self, index):
+        return [other for other in self.adjacent(index) if self.is_connected(index, other)]
+
+    def clear_connections(self, index):
+        x, y = self.coords(index)
+        self.right[y, x] = False
+        self.down[y, x] = False
+        if x > 0:
+            self.right[y, x-1] = False
+        if y > 0:
+            self.down[y-1, x] = False
+
+    def clear_cells(self, indices):
+
+        # empty many cells at once and drop every connection they have
+        xs, ys = indices%self.width, indices//self.width
+        self.types[ys, xs] = 0
+        self.right[ys, xs] = False
+        self.down[ys, xs] = False
+        self.right[ys[xs > 0], xs[xs > 0]-1] = False
+        self.down[ys[ys > 0]-1, xs[ys > 0]] = False
+
+    def crop(self, x0, y0, width, height):
+
+        # resize, crop and pad in one step: new cell (x, y) is old cell (x+x0, y+y0) and
+        # cells outside the old grid are empty. Returns an array mapping old indices to
+        # new ones (-1 if the cell was cropped away).
+        ys, xs = np.indices((self.height, self.width))
+        xs, ys = xs - x0, ys - y0
+        keep = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        remap = np.where(keep, ys*width + xs, -1).reshape(-1)
+
+        types = np.zeros((height, width), dtype=np.uint8)
+        right = np.zeros((height, width), dtype=bool)
+        down = np.zeros((height, width), dtype=bool)
+
+        lx, hx = max(x0, 0), min(x0+width, self.width)
+        ly, hy = max(y0, 0), min(y0+height, self.height)
+        if lx < hx and ly < hy:
+            src = (slice(ly, hy), slice(lx, hx))
+            dst = (slice(ly-y0, hy-y0), slice(lx-x0, hx-x0))
+            types[dst] = self.types[src]
+            right[dst] = self.right[src]
+            down[dst] = self.down[src]
+            right[:, hx-x0-1] = False
+            down[hy-y0-1, :] = False
+
+        self.width, self.height = width, height
+        self.types, self.right, self.down = types, right, down
+        return remap
+
+class GridRow:
+    __slots__ = ('grid', 'y')
+
+    def __init__(self, grid, y):
+        self.grid = grid
+        self.y = y
+
+    def __len__(self):
+        return self.grid.width
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.grid.width
+        if x < 0 or x >= self.grid.width:
+            raise IndexError('grid column index out of range')
+        return NodeView(self.grid, self.y*self.grid.width + x)
+
+    def __iter__(self):
+        start = self.y*self.grid.width
+        for index in range(start, start+self.grid.width):
+            yield NodeView(self.grid, index)
+
+class NodeView:
+    __slots__ = ('grid', 'id')
+
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.id = index
+
+    def __eq__(self, other):
+        if isinstance(other, NodeView):
+            return self.grid is other.grid and self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self.grid), self.id))
+
+    @property
+    def type(self):
+        return self.grid.get_type(self.id)
+
+    @type.setter
+    def type(self, value):
+        self.grid.set_type(self.id, value)
+
+    @property
+    def neighbors(self):
+        return NeighborsView(self.grid, self.id)
+
+class NeighborsView(MutableMapping):
+    __slots__ = ('grid', 'index')
+
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.index = index
+
+    def __getitem__(self, other):
+        if not self.grid.is_connected(self.index, other):
+            raise KeyError(other)
+        return True
+
+    def __setitem__(self, other, value):
+        self.grid.set_connected(self.index, other, bool(value))
+
+    def __delitem__(self, other):
+        if not self.grid.is_connected(self.index, other):
+            raise KeyError(other)
+        self.grid.set_connected(self.index, other, False)
+
+    def __contains__(self, other):
+        return self.grid.is_connected(self.index, other)
+
+    def __iter__(self):
+        return iter(self.grid.connected_neighbors(self.index))
+
+    def __len__(self):
+        return len(self.grid.connected_neighbors(self.index))
+
+    def copy(self,):
+        return {other: True for other in self}
+
+def label_components(grid):
+    # Two passes over the edge masks. First every horizontal run of connected cells gets
+    # a run id in row-major order. Then union-find over the vertical edges between runs
+    # hooks the larger root onto the smaller one and compresses with pointer jumping until
+    # no edge spans two trees. The surviving root of each component is its first run, so
+    # labels follow the same row-major discovery order as a flood fill.
+    filled = grid.types != 0
+    right = grid.right & filled
+    right[:, :-1] &= filled[:, 1:]
+    right[:, -1:] = False
+    down = grid.down & filled
+    down[:-1, :] &= filled[1:, :]
+    down[-1:, :] = False
+
+    # a vertical edge is redundant if its left neighbour joins the same two runs
+    redundant = np.zeros_like(down)
+    redundant[:-1, 1:] = down[:-1, :-1] & right[:-1, :-1] & right[1:, :-1]
+    down &= ~redundant
+
+    run_start = filled.copy()
+    run_start[:, 1:] &= ~right[:, :-1]
+    run_id = np.cumsum(run_start.reshape(-1), dtype=np.int64) - 1
+
+    edges = np.flatnonzero(down)
+    a, b = run_id[edges], run_id[edges + grid.width]
+    parent = np.arange(int(run_id[-1]) + 1 if grid.size > 0 else 0, dtype=np.int64)
+    while len(a) > 0:
+        pa, pb = parent[a], parent[b]
+        active = pa != pb
+        if not active.any():
+            break
+        a, b, pa, pb = a[active], b[active], pa[active], pb[active]
+        parent[np.maximum(pa, pb)] = np.minimum(pa, pb)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    is_root = parent == np.arange(len(parent))
+    run_label = (np.cumsum(is_root) - 1)[parent]
+
+    nodes = np.flatnonzero(filled)
+    node_labels = run_label[run_id[nodes]]
+
+    labels = np.full(grid.size, -1, dtype=np.int32)
+    labels[nodes] = node_labels
+    labels = labels.reshape(grid.height, grid.width)
+
+    object_count = int(is_root.sum())
+    sorted_nodes = nodes[np.argsort(node_labels, kind='stable')]
+    bounds = [0] + np.cumsum(np.bincount(node_labels, minlength=object_count)).tolist()
+    components = [sorted_nodes[bounds[i]:bounds[i+1]] for i in range(object_count)]
+    return labels, components
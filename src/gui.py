@@ -2,8 +2,10 @@ from tkinter import *
 from tkinter.ttk import *
 from ttkbootstrap import Style
 import tkinter.messagebox as mb
+import tkinter.filedialog as fd
 
 import os
+import time
 
 import utils
 
@@ -39,6 +41,12 @@ class GUI:
         ### Project Information ###
         self.pi_frame = Labelframe(self.master, text='Project Name', padding=15)
 
+        # save progress, shown under the name while a background save runs
+        self.pi_status_frame = Frame(self.pi_frame)
+        self.pi_status = Label(self.pi_status_frame, text='')
+        self.pi_status.pack(side='left', fill='x', expand='yes')
+        self.pi_progress = Progressbar(self.pi_status_frame, mode='determinate', maximum=1.0, length=100)
+
         self.pi_name = Entry(self.pi_frame)
         self.pi_name.insert('end', 'my_evironment.json')
         self.pi_name.pack(side='left', fill='x', expand='yes')
@@ -49,6 +57,15 @@ class GUI:
         self.pi_load = Button(self.pi_frame, text="Load", command=self.load_click)
         self.pi_load.pack(side='left', fill='x', expand='yes', padx=2)
 
+        self.pi_import = Button(self.pi_frame, text="Import", command=self.import_click)
+        self.pi_import.pack(side='left', fill='x', expand='yes', padx=2)
+
+        # saving again to the same .json file only appends the changed objects to a delta
+        # file, which evogym does not read
+        self.pi_delta_var = BooleanVar(value=False)
+        self.pi_delta = Checkbutton(self.pi_frame, text='Delta', variable=self.pi_delta_var)
+        self.pi_delta.pack(side='left', padx=2)
+
         self.pi_frame.pack(side='top', fill='x', pady=self.vpad, padx=self.hpad)
 
         ### Grid Size
@@ -113,6 +130,16 @@ class GUI:
 
         self.o_frame.pack(side='top', fill='x', pady=self.vpad, padx=self.hpad)
 
+        ### Profiler ###
+        # stage timing percentiles, shown while the profiler is enabled (F1), and the result of
+        # the last profiler hotkey
+        self.pf_frame = Labelframe(self.master, text='Profiler', padding=15)
+
+        self.pf_status = Label(self.pf_frame, text='', wraplength=300)
+        self.pf_status.pack(side='top', fill='x', expand='yes')
+
+        self.pf_stats = Label(self.pf_frame, text='', font='TkFixedFont', justify='left')
+
         ### Variables ###
         self.last_object_viewed = None
         self.mode_data = {'mode': utils.VOXELS, 'selector': utils.CELL_SOFT}
@@ -124,11 +151,18 @@ class GUI:
         self.save_path = 'exported'
         self.default_type = '.json'
 
+        self.save_message_time = None
+
+        self.profiler = None
+        self.profile_time = None
+
         self.save_env_func = None
+        self.save_status_func = None
         self.load_env_func = None
         self.load_viewer_func = None
         self.gs_env_func = None
         self.gs_viewer_func = None
+        self.import_env_func = None
 
         # self.pi_frame2 = Labelframe(self.master, text='Project Information', padding=15)
         # #self.pi_frame.pack(fill=X, anchor='n', expand=True)
@@ -153,12 +187,17 @@ class GUI:
         # test_button1 = Button(self.gs_frame, text="Red")
         # test_button1.pack()
 
-    def set_funcs(self, save_env_func, load_env_func, load_viewer_func, gs_env_func, gs_viewer_func):
+    def set_funcs(self, save_env_func, load_env_func, load_viewer_func, gs_env_func, gs_viewer_func, save_status_func=None, import_env_func=None):
         self.save_env_func = save_env_func
         self.load_env_func = load_env_func
         self.load_viewer_func = load_viewer_func
         self.gs_env_func = gs_env_func
         self.gs_viewer_func = gs_viewer_func
+        self.save_status_func = save_status_func
+        self.import_env_func = import_env_func
+
+    def set_profiler(self, profiler):
+        self.profiler = profiler
 
     def update_object_info(self, objects, recently_updated_objects, hovered_object_id, selected_object_id):
 
@@ -215,8 +254,7 @@ class GUI:
         self.old_mode = self.mode_data['mode']
 
     def update_gs_info(self, grid):
-        grid_height = len(grid)
-        grid_width = len(grid[0])
+        grid_width, grid_height = grid.world_shape or (grid.width, grid.height)
 
         if grid_width != self.old_gs_width or grid_height != self.old_gs_height:
             self.old_gs_width = grid_width
@@ -228,6 +266,67 @@ class GUI:
             self.gs_height_entry.delete(0, 'end')
             self.gs_height_entry.insert('end', grid_height)
 
+    def update_save_info(self,):
+        if self.save_status_func == None:
+            return
+        current, (done, total), queued, finished = self.save_status_func()
+
+        for file_name, error in finished:
+            if error != None:
+                mb.showerror(title='Error: Save Failed', message=f'Could not save {os.path.basename(file_name)}: {error}')
+            else:
+                self.pi_status.configure(text=f'Saved {os.path.basename(file_name)}')
+                self.pi_progress.pack_forget()
+                self.save_message_time = time.time()
+
+        if current != None:
+            text = f'Saving {os.path.basename(current)}...'
+            if queued > 0:
+                text += f' ({queued} more queued)'
+            self.pi_status.configure(text=text)
+            self.pi_progress.configure(value=done/total if total > 0 else 0)
+            if not self.pi_progress.winfo_manager():
+                self.pi_progress.pack(side='right', padx=(5, 0))
+            self.save_message_time = None
+        elif self.save_message_time == None or time.time() - self.save_message_time > 3:
+            # the completion message is hidden after a few seconds
+            if self.pi_status_frame.winfo_manager():
+                self.pi_status_frame.pack_forget()
+            return
+
+        if not self.pi_status_frame.winfo_manager():
+            self.pi_status_frame.pack(side='bottom', fill='x', pady=(10, 0), before=self.pi_name)
+
+    def update_profile_info(self,):
+        if self.profiler == None:
+            return
+
+        # captures and exports can run while stage timing is disabled, the panel then only
+        # shows their status
+        if not self.profiler.enabled and self.profiler.status == '':
+            if self.pf_frame.winfo_manager():
+                self.pf_frame.pack_forget()
+            return
+
+        if not self.pf_frame.winfo_manager():
+            self.pf_frame.pack(side='bottom', fill='x', pady=self.vpad, padx=self.hpad)
+        if self.pf_status.cget('text') != self.profiler.status:
+            self.pf_status.configure(text=self.profiler.status)
+
+        if not self.profiler.enabled:
+            if self.pf_stats.winfo_manager():
+                self.pf_stats.pack_forget()
+            return
+
+        if not self.pf_stats.winfo_manager():
+            self.pf_stats.pack(side='top', fill='x', expand='yes')
+            self.profile_time = None
+
+        # percentiles are refreshed twice a second
+        if self.profile_time == None or time.time() - self.profile_time > 0.5:
+            self.pf_stats.configure(text=self.profiler.get_summary())
+            self.profile_time = time.time()
+
     def load(self, file_name):
         
         if self.load_env_func == None or self.load_viewer_func == None:
@@ -241,7 +340,7 @@ class GUI:
     def save(self, file_name):
         if self.save_env_func == None:
             return
-        self.save_env_func(file_name)
+        self.save_env_func(file_name, delta=self.pi_delta_var.get())
 
     def update_gs_click(self,):
         try:
@@ -254,20 +353,23 @@ class GUI:
         if new_width < self.old_gs_width:
             if new_height < self.old_gs_height:
                 if mb.askokcancel(title='Delete Warning', message=f'Rows/columns will be deleted from the right/top. Continue?'):                
-                    self.gs_env_func(new_width, new_height)
-                    self.gs_viewer_func(new_width, new_height)
+                    self.change_gs(new_width, new_height)
             else:
                 if mb.askokcancel(title='Delete Warning', message=f'Columns will be deleted from the right. Continue?'):                
-                    self.gs_env_func(new_width, new_height)
-                    self.gs_viewer_func(new_width, new_height)
+                    self.change_gs(new_width, new_height)
 
         elif new_height < self.old_gs_height:
             if mb.askokcancel(title='Delete Warning', message=f'Rows will be deleted from the top. Continue?'):                
-                self.gs_env_func(new_width, new_height)
-                self.gs_viewer_func(new_width, new_height)
+                self.change_gs(new_width, new_height)
         else:
-            self.gs_env_func(new_width, new_height)
+            self.change_gs(new_width, new_height)
+
+    def change_gs(self, new_width, new_height):
+        if self.gs_env_func(new_width, new_height):
             self.gs_viewer_func(new_width, new_height)
+        else:
+            mb.showerror(title='Error: Cannot Resize', message=f'Chunked worlds cannot be resized from the editor.')
+            self.old_gs_width = None
 
     def load_click(self,):
         file_name = self.clean_name(self.pi_name.get())
@@ -279,6 +381,22 @@ class GUI:
         else:
             self.load(load_path)
 
+    def import_click(self,):
+        if self.import_env_func == None:
+            return
+
+        # evogym robot designs are placed in rows from the top left corner of the grid
+        paths = fd.askopenfilenames(title='Import Robots', filetypes=[('evogym robots', '*.npz')])
+        if len(paths) == 0:
+            return
+        try:
+            imported = self.import_env_func(list(paths))
+        except Exception as e:
+            mb.showerror(title='Error: Import Failed', message=f'Could not import robots: {e}')
+            return
+        self.pi_status.configure(text=f'Imported {len(imported)} objects')
+        self.save_message_time = time.time()
+
     def save_click(self):
 
         taken_names = {}
@@ -324,13 +442,28 @@ class GUI:
 
     def update(self, grid, objects, recently_updated_objects, hovered_object_id, selected_object_id, key_presses):
 
-        self.objects = {}
-        for object_id, obj in objects.items():
-            self.objects[object_id] = obj.copy()
+        # Env's objects are only read and renamed here, on the main thread between frames,
+        # so they are shared instead of copied every frame
+        self.objects = objects
 
         self.update_object_info(objects, recently_updated_objects, hovered_object_id, selected_object_id)
         self.update_gs_info(grid)
         self.update_mode(key_presses)
+        self.update_save_info()
+        self.update_profile_info()
+
+        self.master.update_idletasks()
+        self.master.update()
+
+    def update_idle(self,):
+
+        # the main loop woke up without input and the scene is unchanged, only the name
+        # being typed, the mode and the status lines are kept current while Tk is serviced
+        if self.last_object_viewed in self.objects:
+            self.objects[self.last_object_viewed].name = self.o_name.get()
+        self.update_mode({})
+        self.update_save_info()
+        self.update_profile_info()
 
         self.master.update_idletasks()
         self.master.update()
@@ -0,0 +1,151 @@
+import struct
+import zlib
+import numpy as np
+
+import colors
+import utils
+import scene_geometry
+
+# Software rendering of a grid into an RGB image, without a window or OpenGL, for previews
+# in CI and thumbnails on compute nodes (see the render command of batch.py). The layers
+# are the viewer's: cells, the hovered cell, border bars, the bars of the hovered and
+# selected objects and the hovered edge, built from the same scene_geometry quads. A
+# pixel is covered by a quad when its center is strictly inside it, like the viewer's
+# hit boxes, and every layer is filled with one vectorized scatter.
+#
+# A camera is (cam_x, cam_y, zoom) like Viewer.cam_pos_x, cam_pos_y and zoom: the grid
+# point at the center of the image and pixels per grid unit.
+#
+#   image = headless.render_image(grid, objects, 256, 256)
+#   headless.write_png('preview.png', image)
+
+# part of the image left around the grid by get_fit_camera
+FIT_MARGIN = 0.05
+
+def get_fit_camera(grid, width, height, margin=FIT_MARGIN, box=1.0):
+
+    # the camera that shows the whole grid. Above LOD_ZOOM the borders are about two pixels
+    # wide whatever the zoom, so the zoom that fits is solved for on each axis separately.
+    def fit(cells, pixels):
+        pixels = pixels*(1-2*margin)
+        zoom = (pixels - 2*cells - 2)/((box+0.02)*cells + 0.02)
+        if zoom >= scene_geometry.LOD_ZOOM:
+            return zoom
+        border = scene_geometry.get_border_thickness(0)
+        return pixels/((box+border)*cells + border)
+
+    zoom = max(min(fit(grid.width, width), fit(grid.height, height)), 1e-6)
+    border = scene_geometry.get_border_thickness(zoom)
+    pitch = border + box
+    return (grid.width*pitch + border)/2, (grid.height*pitch + border)/2, zoom
+
+def to_pixels(camera, width, height, x, y):
+    cam_x, cam_y, zoom = camera
+    return (x - cam_x)*zoom + width/2, (y - cam_y)*zoom + height/2
+
+def get_visible_area(grid, camera, width, height, border, box=1.0):
+    cam_x, cam_y, zoom = camera
+    pitch = border + box
+    x0, x1 = int((cam_x - width/(2*zoom))//pitch), int((cam_x + width/(2*zoom))//pitch) + 1
+    y0, y1 = int((cam_y - height/(2*zoom))//pitch), int((cam_y + height/(2*zoom))//pitch) + 1
+    x0, y0 = min(max(x0, 0), grid.width), min(max(y0, 0), grid.height)
+    return x0, y0, min(max(x1, x0), grid.width), min(max(y1, y0), grid.height)
+
+def fill_quads(image, camera, rects, quad_colors):
+
+    # pixel i is covered when lx < i + 0.5 < hx
+    height, width = image.shape[:2]
+    if len(rects) == 0:
+        return
+    rects = np.asarray(rects, dtype=np.float64)
+    lx, ly = to_pixels(camera, width, height, rects[:, 0], rects[:, 1])
+    hx, hy = to_pixels(camera, width, height, rects[:, 2], rects[:, 3])
+    c0 = np.clip(np.floor(lx - 0.5).astype(np.int64) + 1, 0, width)
+    c1 = np.clip(np.ceil(hx - 0.5).astype(np.int64), 0, width)
+    r0 = np.clip(np.floor(ly - 0.5).astype(np.int64) + 1, 0, height)
+    r1 = np.clip(np.ceil(hy - 0.5).astype(np.int64), 0, height)
+
+    quad_widths, quad_heights = np.maximum(c1 - c0, 0), np.maximum(r1 - r0, 0)
+    counts = quad_widths*quad_heights
+    covering = np.flatnonzero(counts)
+    if len(covering) == 0:
+        return
+
+    # one entry per covered pixel of every quad. Quads of a layer either do not overlap or
+    # have the same color, so the order of the writes does not matter.
+    counts = counts[covering]
+    quads = np.repeat(covering, counts)
+    local = np.arange(len(quads)) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = r0[quads] + local//quad_widths[quads]
+    cols = c0[quads] + local%quad_widths[quads]
+    image[rows, cols] = np.asarray(quad_colors, dtype=np.float32)[quads]
+
+def fill_cells(image, camera, grid, border, box=1.0):
+
+    # nearest cell colors, what the viewer's type texture shows when cells are smaller than
+    # its border bars
+    height, width = image.shape[:2]
+    pitch = border + box
+    xs, ys = to_pixels(camera, width, height, 0, 0)
+    zoom = camera[2]
+    world_x = (np.arange(width) + 0.5 - xs)/zoom
+    world_y = (np.arange(height) + 0.5 - ys)/zoom
+    cols, rows = np.floor(world_x/pitch).astype(np.int64), np.floor(world_y/pitch).astype(np.int64)
+    inside_x = (world_x > 0) & (world_x < grid.width*pitch)
+    inside_y = (world_y > 0) & (world_y < grid.height*pitch)
+
+    cols, rows = cols[inside_x], rows[inside_y]
+    if len(cols) == 0 or len(rows) == 0:
+        return
+    types = np.minimum(grid.types[np.ix_(rows, cols)], len(scene_geometry.TYPE_COLORS)-1)
+    image[np.ix_(inside_y, inside_x)] = scene_geometry.TYPE_COLORS[types]
+
+def render_image(grid, objects=None, width=256, height=256, camera=None, hovered=None, hovered_object_id=None, selected_object_id=None, mode=utils.VOXELS, box=1.0):
+
+    # (height, width, 3) uint8 image of the grid. camera defaults to get_fit_camera, hovered
+    # is a Viewer.currently_hovered tuple
+    if camera == None:
+        camera = get_fit_camera(grid, width, height, box=box)
+    border = scene_geometry.get_border_thickness(camera[2])
+
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[:] = colors.CLEAR_COLOR[:3]
+
+    if camera[2] < scene_geometry.LOD_ZOOM:
+        fill_cells(image, camera, grid, border, box)
+    else:
+        area = get_visible_area(grid, camera, width, height, border, box)
+        fill_quads(image, camera, *scene_geometry.get_cell_quads(grid, border, box, area))
+
+    if mode == utils.VOXELS and hovered != None and hovered[0] == 'node':
+        fill_quads(image, camera, *scene_geometry.get_cell_quad(grid, hovered[2], border, box))
+
+    if camera[2] >= scene_geometry.LOD_ZOOM:
+        mask = scene_geometry.get_boundary_mask(grid, area)
+        rects, bar_nodes = scene_geometry.get_boundary_quads(grid, mask, border, box, area)
+        fill_quads(image, camera, *scene_geometry.get_bar_quads(rects, bar_nodes, None, colors.EDGE_FULL))
+
+        highlighted = [object_id for object_id in (hovered_object_id, selected_object_id) if object_id != None and objects != None and object_id in objects]
+        if len(highlighted) > 0:
+            nodes = np.array([node for object_id in highlighted for node in objects[object_id].nodes], dtype=np.int64)
+            fill_quads(image, camera, *scene_geometry.get_bar_quads(rects, bar_nodes, nodes, scene_geometry.HIGHLIGHT_EDGE_COLOR))
+
+        if mode == utils.EDGES and hovered != None and hovered[0] == 'edge':
+            fill_quads(image, camera, *scene_geometry.get_hovered_edge_quads(grid, hovered[1], border, box))
+
+    return np.round(np.clip(image, 0, 1)*255).astype(np.uint8)
+
+def write_png(file_path, image):
+
+    # 8-bit RGB PNG with the standard library, so thumbnails need no imaging package
+    height, width = image.shape[:2]
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width*3)], axis=1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(file_path, 'wb') as outfile:
+        outfile.write(b'\x89PNG\r\n\x1a\n')
+        outfile.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        outfile.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        outfile.write(chunk(b'IEND', b''))
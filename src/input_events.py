@@ -0,0 +1,121 @@
+import time
+from collections import namedtuple
+import glfw
+
+# Window input through GLFW callbacks instead of polling. The callbacks append timestamped
+# events to a queue while the main loop waits for or polls events, and once per frame
+# InputQueue.snapshot drains the queue into an InputSnapshot that the viewer, env and gui
+# read. A key press or click that starts and ends between two frames still shows up in
+# the snapshot of the next frame, where polling the current state would miss it.
+#
+#   queue = input_events.InputQueue(window)
+#   ...
+#   inputs = queue.snapshot()
+#   inputs.keys['left'], inputs.is_held(input_events.MOUSE_LEFT), inputs.drag_path
+
+KEYS = {
+    'left': glfw.KEY_LEFT, 'up': glfw.KEY_UP, 'right': glfw.KEY_RIGHT, 'down': glfw.KEY_DOWN,
+    'w': glfw.KEY_W, 'a': glfw.KEY_A, 's': glfw.KEY_S, 'd': glfw.KEY_D,
+    'z': glfw.KEY_Z, 'x': glfw.KEY_X, 'c': glfw.KEY_C, 'v': glfw.KEY_V, 'b': glfw.KEY_B, 'n': glfw.KEY_N,
+    'f1': glfw.KEY_F1, 'f2': glfw.KEY_F2, 'f3': glfw.KEY_F3, 'f4': glfw.KEY_F4}
+KEY_NAMES = {value: key for key, value in KEYS.items()}
+
+MOUSE_LEFT = 0
+MOUSE_RIGHT = 1
+
+# kind is 'key', 'button', 'cursor' or 'scroll'. code is the key name (None for keys not
+# in KEYS) or the mouse button, action is glfw.PRESS, glfw.RELEASE or glfw.REPEAT, and x, y
+# are the cursor position or the scroll offsets.
+InputEvent = namedtuple('InputEvent', ['time', 'kind', 'code', 'action', 'x', 'y'])
+
+class InputSnapshot:
+    def __init__(self, events, keys_down, buttons_down, cursor, last_cursor, last_buttons_down=()):
+        self.time = time.perf_counter()
+        self.events = events
+
+        # a key or button counts as held for the frame it was pressed in, even if it was
+        # released again before the snapshot
+        self.pressed_keys = set()
+        self.pressed_buttons = set()
+        self.scroll = 0
+        self.cursor = cursor
+        self.cursor_path = [last_cursor]
+
+        # cursor positions while the left button was down, for painting strokes
+        dragging = MOUSE_LEFT in last_buttons_down
+        self.drag_path = [last_cursor] if dragging else []
+
+        position = last_cursor
+        for event in events:
+            if event.kind == 'key' and event.action == glfw.PRESS and event.code != None:
+                self.pressed_keys.add(event.code)
+            elif event.kind == 'button' and event.action == glfw.PRESS:
+                self.pressed_buttons.add(event.code)
+                if event.code == MOUSE_LEFT:
+                    dragging = True
+                    self.drag_path.append(position)
+            elif event.kind == 'button' and event.code == MOUSE_LEFT:
+                dragging = False
+            elif event.kind == 'cursor':
+                position = (event.x, event.y)
+                self.cursor_path.append(position)
+                if dragging:
+                    self.drag_path.append(position)
+            elif event.kind == 'scroll':
+                self.scroll += event.y
+
+        self.keys = {key: key in keys_down or key in self.pressed_keys for key in KEYS}
+        self.buttons_down = set(buttons_down)
+
+    def was_pressed(self, button):
+        return button in self.pressed_buttons
+
+    def is_held(self, button):
+        return button in self.buttons_down or button in self.pressed_buttons
+
+class InputQueue:
+    def __init__(self, window):
+        self.window = window
+        self.events = []
+
+        # state after the events queued so far
+        self.keys_down = set()
+        self.buttons_down = set()
+        self.cursor = glfw.get_cursor_pos(window)
+        self.last_cursor = self.cursor
+        self.last_buttons_down = set()
+
+        glfw.set_key_callback(window, self.on_key)
+        glfw.set_mouse_button_callback(window, self.on_mouse_button)
+        glfw.set_cursor_pos_callback(window, self.on_cursor_pos)
+        glfw.set_scroll_callback(window, self.on_scroll)
+
+    def on_key(self, window, key, scancode, action, mods):
+        name = KEY_NAMES.get(key)
+        if name != None:
+            if action == glfw.PRESS:
+                self.keys_down.add(name)
+            elif action == glfw.RELEASE:
+                self.keys_down.discard(name)
+        self.events.append(InputEvent(time.perf_counter(), 'key', name, action, None, None))
+
+    def on_mouse_button(self, window, button, action, mods):
+        if action == glfw.PRESS:
+            self.buttons_down.add(button)
+        else:
+            self.buttons_down.discard(button)
+        self.events.append(InputEvent(time.perf_counter(), 'button', button, action, None, None))
+
+    def on_cursor_pos(self, window, x, y):
+        self.cursor = (x, y)
+        self.events.append(InputEvent(time.perf_counter(), 'cursor', None, None, x, y))
+
+    def on_scroll(self, window, x, y):
+        self.events.append(InputEvent(time.perf_counter(), 'scroll', None, None, x, y))
+
+    def snapshot(self,):
+        events, self.events = self.events, []
+        inputs = InputSnapshot(events, self.keys_down, self.buttons_down, self.cursor, self.last_cursor, self.last_buttons_down)
+        self.last_cursor = self.cursor
+        self.last_buttons_down = set(self.buttons_down)
+        return inputs
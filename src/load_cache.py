@@ -0,0 +1,158 @@
+from collections import OrderedDict
+import hashlib
+import os
+import numpy as np
+
+import utils
+import data_manager
+
+# Cache of parsed environments for DataManager.load. Entries are keyed by the hash of
+# the file contents, and a path -> (mtime, size, hash) index skips hashing files that have
+# not been touched since they were last seen. Each entry keeps the grid arrays and the
+# objects as flat arrays (names, offsets, node indices) like the binary format, which is
+# cheap to hold and to turn back into a fresh copy on every hit.
+#
+# With a sidecar directory, parsed files are also written there as .npz archives named
+# after their hash, so they load quickly in later sessions too.
+
+class LoadCache:
+    def __init__(self, max_bytes=256 << 20, sidecar_dir=None):
+        self.max_bytes = max_bytes
+        self.sidecar_dir = sidecar_dir
+
+        self.entries = OrderedDict()
+        self.paths = {}
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.sidecar_hits = 0
+        self.evictions = 0
+
+        self.dm = data_manager.DataManager()
+
+    def stats(self,):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'sidecar_hits': self.sidecar_hits,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes}
+
+    def clear(self,):
+        self.entries = OrderedDict()
+        self.paths = {}
+        self.size = 0
+
+    def get_key(self, file_path):
+        stat = os.stat(file_path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+
+        path = os.path.abspath(file_path)
+        known = self.paths.get(path)
+        if known != None and known[0] == file_key:
+            return path, file_key, known[1]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as infile:
+            for block in iter(lambda: infile.read(1 << 20), b''):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        self.paths[path] = (file_key, content_hash)
+        return path, file_key, content_hash
+
+    def load(self, file_path, load_func):
+
+        # load_func parses the file on a miss, returns the same tuple as DataManager.load
+        path, file_key, content_hash = self.get_key(file_path)
+
+        entry = self.entries.get(content_hash)
+        if entry != None:
+            self.entries.move_to_end(content_hash)
+            self.hits += 1
+            return self.unpack(entry)
+
+        loaded_state = None
+        sidecar_path = self.get_sidecar_path(content_hash)
+        if sidecar_path != None and os.path.exists(sidecar_path):
+            loaded_state = self.dm.load_binary(sidecar_path)
+            if loaded_state != None:
+                self.sidecar_hits += 1
+        if loaded_state == None:
+            self.misses += 1
+            loaded_state = load_func(file_path)
+            if loaded_state == None:
+                return None
+            # the file changed while it was read, do not remember it under the old hash
+            stat = os.stat(file_path)
+            if (stat.st_mtime_ns, stat.st_size) != file_key:
+                self.paths.pop(path, None)
+                return loaded_state
+            if sidecar_path != None:
+                self.write_sidecar(sidecar_path, loaded_state)
+
+        self.insert(content_hash, self.pack(loaded_state))
+        return loaded_state
+
+    def pack(self, loaded_state):
+        grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count = loaded_state
+
+        names = []
+        offsets = [0]
+        nodes = []
+        for object_id, obj in objects.items():
+            names.append(obj.name)
+            nodes.extend(obj.nodes)
+            offsets.append(len(nodes))
+
+        entry = {
+            'grid': grid.copy(),
+            'ids': np.array(list(objects), dtype=np.int64),
+            'names': names,
+            'offsets': offsets,
+            'nodes': np.array(nodes, dtype=np.int64),
+            'unnamed_obj_count': unnamed_obj_count}
+        entry['bytes'] = grid.types.nbytes*3 + entry['ids'].nbytes + entry['nodes'].nbytes + sum(len(name) + 64 for name in names)
+        return entry
+
+    def unpack(self, entry):
+        grid = entry['grid'].copy()
+        nodes = entry['nodes'].tolist()
+        offsets = entry['offsets']
+
+        objects = {}
+        for i, (object_id, name) in enumerate(zip(entry['ids'].tolist(), entry['names'])):
+            objects[object_id] = utils.Object()
+            objects[object_id].name = name
+            objects[object_id].nodes = dict.fromkeys(nodes[offsets[i]:offsets[i+1]], True)
+
+        sizes = np.diff(np.array(offsets, dtype=np.int64))
+        node_to_object = dict(zip(nodes, np.repeat(entry['ids'], sizes).tolist()))
+        return grid.width, grid.height, grid, objects, node_to_object, entry['unnamed_obj_count']
+
+    def insert(self, content_hash, entry):
+        if entry['bytes'] > self.max_bytes:
+            return
+        self.entries[content_hash] = entry
+        self.size += entry['bytes']
+        while self.size > self.max_bytes:
+            evicted_hash, evicted = self.entries.popitem(last=False)
+            self.size -= evicted['bytes']
+            self.evictions += 1
+
+    ### sidecar ###
+
+    def get_sidecar_path(self, content_hash):
+        if self.sidecar_dir == None:
+            return None
+        return os.path.join(self.sidecar_dir, content_hash + data_manager.BINARY_EXTENSION)
+
+    def write_sidecar(self, sidecar_path, loaded_state):
+        try:
+            os.makedirs(self.sidecar_dir, exist_ok=True)
+            self.dm.save(sidecar_path, loaded_state[2], loaded_state[3], compress=False)
+        except OSError:
+            # the sidecar is only an optimization
+            pass
@@ -2,7 +2,10 @@ import utils
 import viewer
 import env
 import gui
+import scheduler
+import profiler
 
+import argparse
 import time
 from tkinter import Tk
 
@@ -14,38 +17,96 @@ main_viewer = viewer.Viewer('EvoGym Design Interface')
 gui_viewer = gui.GUI(gui_master, main_viewer.window_data)
 
 gui_viewer.set_funcs(
-    main_env.save, 
+    main_env.save_in_background, 
     main_env.load, 
     main_viewer.load, 
     main_env.change_gs,
-    main_viewer.change_gs)
+    main_viewer.change_gs,
+    main_env.get_save_status,
+    main_env.import_robot_files)
 
-def main():
+# stage timing shared by the main loop, viewer, env and gui, see profiler
+frame_profiler = profiler.FrameProfiler()
+main_viewer.profiler = frame_profiler
+main_env.profiler = frame_profiler
+gui_viewer.set_profiler(frame_profiler)
+
+def get_scene_version():
+
+    # the editor state a frame depends on that GUI callbacks can change between frames
+    return main_env.get_scene_version(), tuple(gui_viewer.mode_data.items())
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='EvoGym Design Interface')
+    parser.add_argument('--loop', default='events', choices=scheduler.LOOP_MODES, help='wait for input between frames (events) or never block (poll)')
+    parser.add_argument('--fps', type=int, default=30, help='frame rate while interacting')
+    parser.add_argument('--profile', action='store_true', help='time the stages of every frame from the start (F1 toggles it)')
+    args = parser.parse_args(args)
+
+    loop = scheduler.Scheduler(args.loop, args.fps)
+    main_viewer.set_fps(args.fps)
+    main_viewer.use_timer = not loop.paces_frames
+    frame_profiler.set_enabled(args.profile)
+    stage = frame_profiler.stage
+
+    scene_version = None
     while not main_viewer.get_window_close():
 
-        main_viewer.update_and_render(
-            main_env.grid, main_env.objects,
-            main_env.node_to_object,
-            main_env.hovered_object_id,
-            main_env.selected_object_id,
-            main_env.just_altered,
-            main_env.mode)
-
-        main_env.update(
-            main_viewer.currently_hovered,
-            main_viewer.currently_selected,
-            main_viewer.mouse_press,
-            main_viewer.mouse_held,
-            main_viewer.get_key_presses(),
-            gui_viewer.mode_data)
-
-        gui_viewer.update(
-            main_env.grid, 
-            main_env.objects,
-            main_env.need_to_update_objects,
-            main_env.hovered_object_id, 
-            main_env.selected_object_id,
-            main_viewer.get_key_presses())
+        # an idle wait that ended without window input and without a GUI callback changing
+        # the scene has nothing to draw or edit, only Tk is serviced
+        if loop.idle and not main_viewer.has_pending_input() and get_scene_version() == scene_version:
+            gui_viewer.update_idle()
+            loop.wait(False)
+            continue
+
+        frame_profiler.begin_frame()
+
+        # page in the part of a chunked world around the camera
+        with stage('update_view'):
+            if main_env.update_view(*main_viewer.get_visible_cells()):
+                main_viewer.clear_selection()
+
+        with stage('viewer'):
+            main_viewer.update_and_render(
+                main_env.grid, main_env.objects,
+                main_env.node_to_object,
+                main_env.hovered_object_id,
+                main_env.selected_object_id,
+                main_env.just_altered,
+                main_env.mode,
+                main_env.boundary_mask)
+
+        # keys of the input snapshot the viewer took for this frame
+        key_presses = main_viewer.get_key_presses()
+
+        with stage('env'):
+            main_env.update(
+                main_viewer.currently_hovered,
+                main_viewer.currently_selected,
+                main_viewer.mouse_press,
+                main_viewer.mouse_held,
+                key_presses,
+                gui_viewer.mode_data,
+                main_viewer.stroke)
+
+        # before the GUI runs Tk, whose callbacks can load, resize or import
+        scene_version = get_scene_version()
+
+        with stage('gui'):
+            gui_viewer.update(
+                main_env.grid, 
+                main_env.objects,
+                main_env.need_to_update_objects,
+                main_env.hovered_object_id, 
+                main_env.selected_object_id,
+                key_presses)
+
+        frame_profiler.handle_keys(key_presses)
+
+        with stage('wait'):
+            loop.wait(main_viewer.is_active())
+
+        frame_profiler.end_frame()
 
         #utils.get_objects(main_env.grid)
         #time.sleep(1)
@@ -53,5 +114,13 @@ def main():
         # print(main_viewer.get_key_presses())
 
     main_viewer.safe_close()
+
+    # write a cProfile capture that is still running, the GUI is gone so report it here
+    if frame_profiler.capture != None:
+        frame_profiler.toggle_capture()
+        print(frame_profiler.status)
+
+    # let saves that are still running or queued finish
+    main_env.saver.wait()
 if __name__ == "__main__":
     main()
@@ -0,0 +1,216 @@
+import cProfile
+import csv
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+# Per-stage timing of the editor's main loop. Stages are timed with
+#
+#   with profiler.stage('render_edges'):
+#       ...
+#
+# and grouped into frames by begin_frame and end_frame, one per main loop iteration.
+# Stages can nest, the viewer's render passes are inside the main loop's viewer stage. The
+# last HISTORY frames are kept for rolling percentiles (shown in the GUI's Profiler panel)
+# and can be written to CSV or to a Chrome trace (chrome://tracing, ui.perfetto.dev).
+#
+# While disabled, stage returns a shared no-op context and nothing is recorded, so the
+# instrumentation can stay in place. cProfile captures are independent of the stage
+# timing and can run while it is disabled. The result of the last hotkey action is kept in
+# status, which the GUI shows on the Profiler panel's status line.
+#
+# Hotkeys, handled by handle_keys:
+#
+#   F1  enable/disable stage timing and the Profiler panel
+#   F2  write the recorded frames to CSV
+#   F3  write the recorded frames to a Chrome trace
+#   F4  start/stop a cProfile capture, written as a .prof file (pstats, snakeviz)
+
+PROFILE_DIR = 'profiles'
+HISTORY = 300
+PERCENTILES = (50, 90, 99)
+
+HOTKEYS = {
+    'f1': 'toggle',
+    'f2': 'csv',
+    'f3': 'trace',
+    'f4': 'capture'}
+
+class NullStage:
+    def __enter__(self,):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    __slots__ = ('profiler', 'name', 'start', 'depth')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self,):
+        self.depth = self.profiler.depth
+        self.profiler.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.profiler.depth -= 1
+        if self.profiler.frame != None:
+            self.profiler.frame.append((self.name, self.start, end, self.depth))
+        return False
+
+class FrameProfiler:
+    def __init__(self, history=HISTORY, out_dir=PROFILE_DIR):
+        self.enabled = False
+        self.out_dir = out_dir
+
+        # (frame number, start, end, [(stage, start, end, depth), ...]) of the last frames
+        self.frames = deque(maxlen=history)
+        self.frame = None
+        self.frame_start = None
+        self.frame_count = 0
+        self.depth = 0
+
+        self.capture = None
+        self.keys_down = set()
+        self.status = ''
+
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            self.frames.clear()
+        self.enabled = enabled
+        self.frame = None
+        self.depth = 0
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def begin_frame(self,):
+        if not self.enabled:
+            return
+        self.frame = []
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self,):
+        if self.frame == None:
+            return
+        # stages are recorded as they end, inner ones first
+        self.frame.sort(key=lambda stage: stage[1])
+        self.frames.append((self.frame_count, self.frame_start, time.perf_counter(), self.frame))
+        self.frame_count += 1
+        self.frame = None
+
+    def get_percentiles(self, percentiles=PERCENTILES):
+
+        # stage -> milliseconds at each percentile, over the frames the stage ran in. A
+        # stage that ran more than once in a frame counts with its total.
+        totals = {'frame': []}
+        for _, start, end, stages in self.frames:
+            totals['frame'].append(end - start)
+            in_frame = {}
+            for name, stage_start, stage_end, _ in stages:
+                in_frame[name] = in_frame.get(name, 0) + stage_end - stage_start
+            for name, total in in_frame.items():
+                totals.setdefault(name, []).append(total)
+
+        out = {}
+        for name, values in totals.items():
+            if len(values) > 0:
+                out[name] = tuple(np.percentile(np.array(values)*1000, percentiles))
+        return out
+
+    def get_summary(self, percentiles=PERCENTILES):
+        header = 'stage'.ljust(22) + ''.join(f'p{p}'.rjust(8) for p in percentiles)
+        lines = [header, f'{len(self.frames)} frames, ms']
+        for name, values in self.get_percentiles(percentiles).items():
+            lines.append(name[:22].ljust(22) + ''.join(f'{value:8.2f}' for value in values))
+        return '\n'.join(lines)
+
+    def get_out_path(self, extension):
+        os.makedirs(self.out_dir, exist_ok=True)
+        return os.path.join(self.out_dir, time.strftime('profile-%Y%m%d-%H%M%S') + extension)
+
+    def write_csv(self, file_path=None):
+
+        # one row per stage and one per frame, times in milliseconds from the first frame
+        if file_path == None:
+            file_path = self.get_out_path('.csv')
+        origin = self.frames[0][1] if len(self.frames) > 0 else 0
+        with open(file_path, 'w', newline='') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(['frame', 'stage', 'depth', 'start_ms', 'duration_ms'])
+            for frame_number, start, end, stages in self.frames:
+                writer.writerow([frame_number, 'frame', -1, f'{(start - origin)*1000:.4f}', f'{(end - start)*1000:.4f}'])
+                for name, stage_start, stage_end, depth in stages:
+                    writer.writerow([frame_number, name, depth, f'{(stage_start - origin)*1000:.4f}', f'{(stage_end - stage_start)*1000:.4f}'])
+        return file_path
+
+    def write_trace(self, file_path=None):
+
+        # complete events of the Chrome trace event format, times in microseconds
+        if file_path == None:
+            file_path = self.get_out_path('.trace.json')
+        origin = self.frames[0][1] if len(self.frames) > 0 else 0
+
+        def event(name, start, end, args=None):
+            out = {'name': name, 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': (start - origin)*1e6, 'dur': (end - start)*1e6}
+            if args != None:
+                out['args'] = args
+            return out
+
+        events = []
+        for frame_number, start, end, stages in self.frames:
+            events.append(event('frame', start, end, {'frame': frame_number}))
+            for name, stage_start, stage_end, _ in stages:
+                events.append(event(name, stage_start, stage_end))
+
+        with open(file_path, 'w') as outfile:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, outfile)
+        return file_path
+
+    def toggle_capture(self,):
+
+        # returns the .prof file when a capture is stopped
+        if self.capture == None:
+            self.capture = cProfile.Profile()
+            self.capture.enable()
+            self.status = 'cProfile capture running, F4 to stop'
+            return None
+
+        self.capture.disable()
+        file_path = self.get_out_path('.prof')
+        self.capture.dump_stats(file_path)
+        self.capture = None
+        self.status = f'cProfile capture written to {file_path}'
+        return file_path
+
+    def handle_keys(self, key_presses):
+
+        # actions run once per key press, not every frame the key is held
+        for key, action in HOTKEYS.items():
+            if not key_presses.get(key):
+                self.keys_down.discard(key)
+                continue
+            if key in self.keys_down:
+                continue
+            self.keys_down.add(key)
+
+            if action == 'toggle':
+                self.set_enabled(not self.enabled)
+            elif action == 'capture':
+                self.toggle_capture()
+            elif len(self.frames) == 0:
+                self.status = 'No frames recorded, press F1 to start timing'
+            else:
+                file_path = self.write_csv() if action == 'csv' else self.write_trace()
+                self.status = f'{len(self.frames)} frames written to {file_path}'
@@ -0,0 +1,249 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+import utils
+import data_manager
+import evogym_arrays
+from grid_core import Grid, label_components
+
+# Import of evogym robot designs. A robot is a body type matrix (row 0 at the top) and a
+# (2, n) connections array of row-major index pairs into the body, as evogym's examples
+# save them (np.savez(path, body, connections) or with body/connections keys). Archives
+# written by evogym_arrays with many objects can be read too.
+#
+# Robots are streamed one at a time from the archives, each one is copied into the grid
+# with a few slice assignments and objects are found with a single labeling pass at the
+# end, so importing thousands of robots never goes through the per-cell edit functions.
+#
+#   python src/robot_import.py runs/generation_10/structure --width 200 --out exported/test_world.json
+#
+# place_robots copies robots into an existing grid at given positions, Env.import_robots
+# uses it for the editor's Import button.
+
+ROBOT_KEYS = (('body', 'connections'), ('arr_0', 'arr_1'))
+
+def find_archives(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names, key=natural_key):
+                    if name.endswith('.npz'):
+                        files.append(os.path.join(root, name))
+        else:
+            files.append(path)
+    return files
+
+def natural_key(name):
+    # 2.npz before 10.npz
+    root = os.path.splitext(name)[0]
+    return (0, int(root), '') if root.isdigit() else (1, 0, name)
+
+def iter_robots(paths):
+
+    # yields (name, body, connections), connections is None if the archive has none. Members
+    # of an archive are only read when their robot is reached.
+    for path in find_archives(paths):
+        name = os.path.basename(path)
+        name = name[:-len(evogym_arrays.EXPORT_SUFFIX)] if name.endswith(evogym_arrays.EXPORT_SUFFIX) else os.path.splitext(name)[0]
+
+        with np.load(path, allow_pickle=False) as archive:
+            if 'names' in archive.files:
+                for i, object_name in enumerate(archive['names'].tolist()):
+                    yield object_name, archive[f'body_{i}'], archive[f'connections_{i}']
+                continue
+
+            for body_key, connections_key in ROBOT_KEYS:
+                if body_key in archive.files:
+                    connections = archive[connections_key] if connections_key in archive.files else None
+                    yield name, archive[body_key], connections
+                    break
+            else:
+                raise ValueError(f'{path} has no robot body, expected one of {[keys[0] for keys in ROBOT_KEYS]}')
+
+def is_integral(values):
+    # evogym stores bodies as floats in some of its examples
+    return values.dtype.kind in 'iub' or (values.dtype.kind == 'f' and np.array_equal(values, np.round(values)))
+
+def get_robot_masks(name, body, connections):
+
+    # validates a robot and returns its types and right/down edge masks in body coordinates
+    body = np.asarray(body)
+    if body.ndim != 2 or body.size == 0:
+        raise ValueError(f'robot {name!r} body must be a non-empty 2d array, got shape {body.shape}')
+    if not is_integral(body) or body.min() < utils.CELL_EMPTY or body.max() > utils.CELL_FIXED:
+        raise ValueError(f'robot {name!r} body has voxel types outside {utils.CELL_EMPTY}..{utils.CELL_FIXED}')
+    types = body.astype(np.uint8)
+    height, width = types.shape
+    filled = types != utils.CELL_EMPTY
+
+    right = np.zeros((height, width), dtype=bool)
+    down = np.zeros((height, width), dtype=bool)
+    if connections is None:
+        # evogym connects all adjacent voxels by default
+        right[:, :-1] = filled[:, :-1] & filled[:, 1:]
+        down[:-1, :] = filled[:-1, :] & filled[1:, :]
+        return types, right, down
+
+    connections = np.asarray(connections)
+    if connections.size == 0:
+        return types, right, down
+    if connections.ndim != 2 or connections.shape[0] != 2 or not is_integral(connections):
+        raise ValueError(f'robot {name!r} connections must be a (2, n) array of voxel indices, got shape {connections.shape}')
+    a, b = connections.astype(np.int64)
+    a, b = np.minimum(a, b), np.maximum(a, b)
+
+    bad = np.flatnonzero((a < 0) | (b >= types.size))
+    if len(bad) > 0:
+        raise ValueError(f'robot {name!r} connection {a[bad[0]]}-{b[bad[0]]} is outside its {width}x{height} body')
+    horizontal = (b == a+1) & (a%width < width-1)
+    bad = np.flatnonzero(~horizontal & (b != a+width))
+    if len(bad) > 0:
+        raise ValueError(f'robot {name!r} connection {a[bad[0]]}-{b[bad[0]]} joins voxels that are not adjacent')
+    flat = filled.reshape(-1)
+    bad = np.flatnonzero(~flat[a] | ~flat[b])
+    if len(bad) > 0:
+        raise ValueError(f'robot {name!r} connection {a[bad[0]]}-{b[bad[0]]} touches an empty voxel')
+
+    right.reshape(-1)[a[horizontal]] = True
+    down.reshape(-1)[a[~horizontal]] = True
+    return types, right, down
+
+def place_masks(grid, owner, robot_id, name, types, right, down, x0, y0):
+
+    # copies a robot into the grid with its top left corner at (x0, y0) in grid coordinates
+    height, width = types.shape
+    if x0 < 0 or y0 < 0 or x0+width > grid.width or y0+height > grid.height:
+        raise ValueError(f'robot {name!r} ({width}x{height}) does not fit into the {grid.width}x{grid.height} grid at ({x0}, {y0})')
+
+    area = (slice(y0, y0+height), slice(x0, x0+width))
+    filled = types != utils.CELL_EMPTY
+    if (filled & (grid.types[area] != utils.CELL_EMPTY)).any():
+        raise ValueError(f'robot {name!r} overlaps voxels that are already in the grid')
+
+    grid.types[area][filled] = types[filled]
+    grid.right[area] |= right
+    grid.down[area] |= down
+    owner[area][filled] = robot_id
+
+def get_pieces(grid, owner, names):
+
+    # objects made of the placed robots, one per connected piece. A robot whose connections
+    # leave it in several pieces becomes several objects named name, name_1, ...
+    labels, components = label_components(grid)
+    placed = np.unique(labels[owner != -1])
+
+    pieces = []
+    counts = {}
+    flat_owner = owner.reshape(-1)
+    for label in placed.tolist():
+        nodes = components[label]
+        name = names[int(flat_owner[nodes[0]])]
+        count = counts.get(name, 0)
+        counts[name] = count + 1
+        pieces.append((name if count == 0 else f'{name}_{count}', nodes))
+    return pieces
+
+def place_robots(grid, robots):
+
+    # robots are (name, body, connections, (x, y)) with (x, y) the bottom left corner of the
+    # body in world coordinates (rows counted from the bottom, like evogym and the JSON
+    # format). Returns (name, node indices) for every new object. Raises ValueError for a
+    # robot that is invalid, leaves the grid or overlaps filled voxels, the grid may then
+    # hold the robots placed before it.
+    owner = np.full((grid.height, grid.width), -1, dtype=np.int32)
+    names = []
+    for name, body, connections, (x, y) in robots:
+        types, right, down = get_robot_masks(name, body, connections)
+        y0 = grid.height - int(y) - types.shape[0]
+        place_masks(grid, owner, len(names), name, types, right, down, int(x), y0)
+        names.append(name)
+    return get_pieces(grid, owner, names)
+
+def row_positions(sizes, width, spacing=1):
+
+    # top left corners for (name, width, height) sizes laid out in rows from the top left
+    # corner, a new row starts when the next robot does not fit
+    x, y, row_height = 0, 0, 0
+    for name, robot_width, height in sizes:
+        if robot_width > width:
+            raise ValueError(f'robot {name!r} is {robot_width} voxels wide, the world is {width}')
+        if x > 0 and x + robot_width > width:
+            x, y, row_height = 0, y + row_height + spacing, 0
+        yield x, y
+        x += robot_width + spacing
+        row_height = max(row_height, height)
+
+def arrange_robots(robots, width, height, spacing=1):
+
+    # (name, body, connections) laid out in rows from the top left corner of a width x height
+    # grid, returned as (name, body, connections, (x, y)) for place_robots
+    robots = list(robots)
+    sizes = []
+    for name, body, connections in robots:
+        shape = np.shape(body)
+        if len(shape) != 2:
+            raise ValueError(f'robot {name!r} body must be a non-empty 2d array, got shape {shape}')
+        sizes.append((name, shape[1], shape[0]))
+
+    arranged = []
+    for (name, body, connections), (x, y) in zip(robots, row_positions(sizes, width, spacing)):
+        arranged.append((name, body, connections, (x, height - y - np.shape(body)[0])))
+    return arranged
+
+def compose_world(robots, width, spacing=1):
+
+    # lays robots out in rows from the top left corner. Robots are validated as they stream
+    # in, only their masks are kept.
+    placed = [(name,) + get_robot_masks(name, body, connections) for name, body, connections in robots]
+    sizes = [(name, types.shape[1], types.shape[0]) for name, types, right, down in placed]
+    positions = list(row_positions(sizes, width, spacing))
+    height = max([y + types.shape[0] for (x, y), (name, types, right, down) in zip(positions, placed)], default=1)
+
+    grid = Grid(width, height)
+    owner = np.full((grid.height, grid.width), -1, dtype=np.int32)
+    names = []
+    for (name, types, right, down), (x0, y0) in zip(placed, positions):
+        place_masks(grid, owner, len(names), name, types, right, down, x0, y0)
+        names.append(name)
+    return grid, get_pieces(grid, owner, names)
+
+def get_objects(pieces, names_taken=()):
+    objects = {}
+    taken = set(names_taken)
+    for object_id, (name, nodes) in enumerate(pieces):
+        # object names have to be unique to save
+        unique_name, count = name, 1
+        while unique_name in taken:
+            unique_name = f'{name}_{count}'
+            count += 1
+        taken.add(unique_name)
+
+        objects[object_id] = utils.Object()
+        objects[object_id].name = unique_name
+        objects[object_id].nodes = dict.fromkeys(nodes.tolist(), True)
+    return objects
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compose evogym robot archives into a world without the GUI.')
+    parser.add_argument('paths', nargs='+', help='robot .npz files or directories of them')
+    parser.add_argument('--out', required=True, help='world file to write (.json, .npz, .egw or .evogym.npz)')
+    parser.add_argument('--width', type=int, default=100, help='world width in voxels')
+    parser.add_argument('--spacing', type=int, default=1, help='empty voxels between robots')
+    args = parser.parse_args(args)
+
+    grid, pieces = compose_world(iter_robots(args.paths), args.width, args.spacing)
+    objects = get_objects(pieces)
+
+    out_dir = os.path.dirname(args.out)
+    if out_dir != '':
+        os.makedirs(out_dir, exist_ok=True)
+    data_manager.DataManager().save(args.out, grid, objects)
+    print(f'{len(objects)} objects in a {grid.width}x{grid.height} world written to {args.out}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import threading
+
+# Saves run on a worker thread so the viewer and the GUI keep running while a large world
+# is serialized. The worker only ever sees a snapshot (copies of the grid arrays and the
+# objects, or the objects of a delta save) taken on the main thread, so editing can
+# continue during the write.
+#
+# At most one save is written at a time. Requests made while one is in flight are queued,
+# and repeated requests for the same file coalesce into a single pending save. The snapshot
+# is taken when the save is requested, so a queued save writes the state at that time even
+# if the editor loads another file or resizes the grid before it starts. A later request
+# for the same file replaces the queued snapshot.
+
+class BackgroundSaver:
+    def __init__(self):
+        self.thread = None
+        self.current = None
+        self.pending = {}
+        self.progress = (0, 0)
+        self.error = None
+
+        # (file path, error message or None) of saves finished since the last poll
+        self.finished = []
+
+    @property
+    def busy(self):
+        return self.current != None or len(self.pending) > 0
+
+    def request(self, file_path, snapshot):
+
+        # snapshot is called on this thread right away. It copies what is needed and returns
+        # a function that does the write on the worker thread
+        try:
+            write = snapshot()
+        except Exception as e:
+            self.finished.append((file_path, f'{type(e).__name__}: {e}'))
+            return
+
+        self.pending[file_path] = write
+        if self.current == None:
+            self.start_pending()
+
+    def start_pending(self,):
+        file_path = next(iter(self.pending))
+        write = self.pending.pop(file_path)
+
+        self.current = file_path
+        self.progress = (0, 0)
+        self.error = None
+        self.thread = threading.Thread(target=self.write, args=(write,), name='save')
+        self.thread.start()
+
+    def write(self, write):
+        try:
+            write(progress=self.set_progress)
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+
+    def set_progress(self, done, total):
+        self.progress = (done, total)
+
+    def poll(self,):
+
+        # call regularly from the main thread, hands back finished saves and starts the
+        # pending one
+        if self.thread != None and not self.thread.is_alive():
+            self.thread.join()
+            self.finished.append((self.current, self.error))
+            self.thread = None
+            self.current = None
+        if self.current == None and len(self.pending) > 0:
+            self.start_pending()
+
+        finished, self.finished = self.finished, []
+        return finished
+
+    def wait(self,):
+        finished = []
+        while self.busy:
+            if self.thread != None:
+                self.thread.join()
+            finished.extend(self.poll())
+        finished.extend(self.poll())
+        return finished
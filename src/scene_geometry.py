@@ -0,0 +1,295 @@
+import numpy as np
+
+import colors
+import utils
+
+# Geometry of the editor scene as axis aligned quads in world units, built with NumPy for
+# whole layers at once. A quad is (lx, ly, hx, hy) with y growing downwards like grid rows,
+# colors are RGB floats. Cell (x, y) starts at x*pitch, y*pitch where pitch is the border
+# plus the box thickness, so voxels overlap the borders around them and border bars cover
+# the gaps between cells. Nothing here touches OpenGL.
+#
+# Layers can be limited to an area (x0, y0, x1, y1) of grid cells, end exclusive, so only
+# the part of a large grid that is on screen is built.
+
+TYPE_COLORS = np.array([
+    colors.EMPTY_VOXEL,
+    colors.RIGID_VOXEL,
+    colors.SOFT_VOXEL,
+    colors.ACT_H_VOXEL,
+    colors.ACT_V_VOXEL,
+    colors.FIXED_VOXEL], dtype=np.float32)
+
+# bits of the boundary mask, one per side of a voxel that gets a border bar. The same bits
+# shifted by NEIGHBOR_SHIFT mark the sides with a voxel next to them, where an edge can be
+# hovered and toggled.
+SIDE_LEFT = 1
+SIDE_RIGHT = 2
+SIDE_UP = 4
+SIDE_DOWN = 8
+SIDES = (SIDE_LEFT, SIDE_RIGHT, SIDE_UP, SIDE_DOWN)
+NEIGHBOR_SHIFT = 4
+
+def dim(color, factor, additive):
+    return tuple(c*factor + additive for c in color)
+
+EMPTY_QUADS = (np.zeros((0, 4), dtype=np.float32), np.zeros((0, 3), dtype=np.float32))
+
+# below LOD_ZOOM cells are drawn without edges and borders keep the thickness they have at
+# LOD_ZOOM, above it borders stay about two pixels wide
+LOD_ZOOM = 5
+
+def get_border_thickness(zoom):
+    return 0.02 + 2/max(zoom, LOD_ZOOM)
+
+HOVER_EMPTY = (0.96, -0.05)
+HOVER_VOXEL = (1.05, 0.07)
+HOVER_EDGE = (1.07, 0.07)
+HIGHLIGHT_EDGE_COLOR = dim(colors.EDGE_SELECTED, 1.15, 0.07)
+
+def get_area(grid, area):
+    if area == None:
+        return 0, 0, grid.width, grid.height
+    return area
+
+def get_cell_quads(grid, border, box=1.0, area=None):
+
+    # the grid background, then empty cells, then voxels
+    pitch = border + box
+    x0, y0, x1, y1 = get_area(grid, area)
+    types = grid.types[y0:y1, x0:x1].reshape(-1)
+    ys, xs = np.divmod(np.arange(types.size), max(x1-x0, 1))
+    xs, ys = xs + x0, ys + y0
+
+    empty = types == utils.CELL_EMPTY
+    ex, ey = xs[empty]*pitch + border, ys[empty]*pitch + border
+    vx, vy = xs[~empty]*pitch, ys[~empty]*pitch
+
+    width = border + grid.width*pitch
+    height = border + grid.height*pitch
+    rects = np.concatenate([
+        np.array([[0, 0, width, height]]),
+        np.stack([ex, ey, ex+box, ey+box], axis=1),
+        np.stack([vx, vy, vx+box+border, vy+box+border], axis=1)]).astype(np.float32)
+    quad_colors = np.concatenate([
+        np.array([colors.GRID_COLOR], dtype=np.float32),
+        np.broadcast_to(np.array(colors.EMPTY_VOXEL, dtype=np.float32), (len(ex), 3)),
+        TYPE_COLORS[np.minimum(types[~empty], len(TYPE_COLORS)-1)]])
+    return rects, quad_colors
+
+def get_cell_quad(grid, index, border, box=1.0):
+
+    # a single cell with its hover color
+    pitch = border + box
+    x, y = grid.coords(index)
+    cell_type = grid.get_type(index)
+    if cell_type == utils.CELL_EMPTY:
+        lx, ly = x*pitch + border, y*pitch + border
+        rect = (lx, ly, lx+box, ly+box)
+        color = dim(colors.EMPTY_VOXEL, *HOVER_EMPTY)
+    else:
+        lx, ly = x*pitch, y*pitch
+        rect = (lx, ly, lx+box+border, ly+box+border)
+        color = dim(TYPE_COLORS[min(cell_type, len(TYPE_COLORS)-1)], *HOVER_VOXEL)
+    return np.array([rect], dtype=np.float32), np.array([color], dtype=np.float32)
+
+def get_boundary_mask(grid, area=None):
+
+    # uint8 mask of the area with a SIDE_* bit for every side of a voxel that is not
+    # connected to a voxel on that side, those sides get a border bar, and a neighbor bit for
+    # every side that has a voxel next to it. Empty cells are 0. The cells around the area
+    # are read too, the mask is the same as the matching part of the whole grid's.
+    x0, y0, x1, y1 = get_area(grid, area)
+    px0, py0 = max(x0-1, 0), max(y0-1, 0)
+    px1, py1 = min(x1+1, grid.width), min(y1+1, grid.height)
+    area_slice = (slice(py0, py1), slice(px0, px1))
+
+    filled = grid.types[area_slice] != utils.CELL_EMPTY
+    joined_right = np.zeros_like(filled)
+    joined_right[:, :-1] = grid.right[area_slice][:, :-1] & filled[:, :-1] & filled[:, 1:]
+    joined_down = np.zeros_like(filled)
+    joined_down[:-1, :] = grid.down[area_slice][:-1, :] & filled[:-1, :] & filled[1:, :]
+    joined_left = np.zeros_like(filled)
+    joined_left[:, 1:] = joined_right[:, :-1]
+    joined_up = np.zeros_like(filled)
+    joined_up[1:, :] = joined_down[:-1, :]
+
+    filled_right = np.zeros_like(filled)
+    filled_right[:, :-1] = filled[:, 1:]
+    filled_left = np.zeros_like(filled)
+    filled_left[:, 1:] = filled[:, :-1]
+    filled_down = np.zeros_like(filled)
+    filled_down[:-1, :] = filled[1:, :]
+    filled_up = np.zeros_like(filled)
+    filled_up[1:, :] = filled[:-1, :]
+
+    mask = np.zeros(filled.shape, dtype=np.uint8)
+    mask |= (~joined_left).astype(np.uint8)*SIDE_LEFT
+    mask |= (~joined_right).astype(np.uint8)*SIDE_RIGHT
+    mask |= (~joined_up).astype(np.uint8)*SIDE_UP
+    mask |= (~joined_down).astype(np.uint8)*SIDE_DOWN
+    for side, neighbor in ((SIDE_LEFT, filled_left), (SIDE_RIGHT, filled_right), (SIDE_UP, filled_up), (SIDE_DOWN, filled_down)):
+        mask |= neighbor.astype(np.uint8)*(side << NEIGHBOR_SHIFT)
+    mask[~filled] = 0
+    return mask[y0-py0:y1-py0, x0-px0:x1-px0]
+
+class BoundaryMask:
+
+    # the boundary mask of the edited grid, kept up to date by Env. add_nodes, remove_nodes and
+    # toggle_connection call update() with the cells they changed and only the mask around
+    # them is recomputed. A new or resized grid is picked up on the next get().
+    #
+    # version changes with every edit Env makes, edit_node calls touch() since a new voxel
+    # type leaves the mask as it is, so the viewer uses it as the version of the grid.
+    def __init__(self):
+        self.grid = None
+        self.types = None
+        self.mask = None
+        self.version = 0
+
+        # object id -> [(nodes, side)], the border bars of objects for highlighting
+        self.object_bars = {}
+
+    def is_current(self, grid):
+        # resizing replaces the grid's arrays
+        return self.grid is grid and self.types is grid.types
+
+    def get(self, grid):
+        if not self.is_current(grid):
+            self.grid = grid
+            self.types = grid.types
+            self.mask = get_boundary_mask(grid)
+            self.object_bars = {}
+            self.version += 1
+        return self.mask
+
+    def update(self, grid, indices):
+        if not self.is_current(grid) or len(indices) == 0:
+            return
+
+        # cells close together, like those of a painted stroke, are recomputed in one slice
+        ys, xs = np.divmod(np.asarray(indices, dtype=np.int64), grid.width)
+        x0, y0 = max(int(xs.min())-1, 0), max(int(ys.min())-1, 0)
+        x1, y1 = min(int(xs.max())+2, grid.width), min(int(ys.max())+2, grid.height)
+        if (x1-x0)*(y1-y0) <= 16*len(indices):
+            self.mask[y0:y1, x0:x1] = get_boundary_mask(grid, (x0, y0, x1, y1))
+        else:
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                x0, y0, x1, y1 = max(x-1, 0), max(y-1, 0), min(x+2, grid.width), min(y+2, grid.height)
+                self.mask[y0:y1, x0:x1] = get_boundary_mask(grid, (x0, y0, x1, y1))
+        self.object_bars = {}
+        self.version += 1
+
+    def touch(self,):
+        self.version += 1
+
+    def get_object_bars(self, grid, object_id, nodes):
+        bars = self.object_bars.get(object_id)
+        if bars == None:
+            nodes = np.fromiter(nodes, dtype=np.int64, count=len(nodes))
+            sides = self.get(grid).reshape(-1)[nodes]
+            bars = [(nodes[(sides & side) != 0], side) for side in SIDES]
+            self.object_bars[object_id] = bars
+        return bars
+
+def get_object_bar_quads(grid, bars, border, box=1.0):
+    rects = []
+    for nodes, side in bars:
+        ys, xs = np.divmod(nodes, grid.width)
+        rects.append(get_side_quads(xs, ys, side, border, box))
+    return np.concatenate(rects).astype(np.float32).reshape(-1, 4)
+
+def get_side_quads(xs, ys, side, border, box=1.0):
+    pitch = border + box
+    lx, ly = xs*pitch, ys*pitch
+    if side == SIDE_RIGHT:
+        lx = lx + pitch
+    if side == SIDE_DOWN:
+        ly = ly + pitch
+    if side in (SIDE_LEFT, SIDE_RIGHT):
+        return np.stack([lx, ly, lx+border, ly+box+2*border], axis=1)
+    return np.stack([lx, ly, lx+box+2*border, ly+border], axis=1)
+
+def get_boundary_quads(grid, mask, border, box=1.0, area=None):
+
+    # border bars of the voxels in the area of mask, returns the quads and the node each one
+    # belongs to
+    x0, y0, x1, y1 = get_area(grid, area)
+    flat = mask.reshape(-1)
+    rects = []
+    nodes = []
+    for side in SIDES:
+        ys, xs = np.divmod(np.flatnonzero(flat & side), max(x1-x0, 1))
+        xs, ys = xs + x0, ys + y0
+        rects.append(get_side_quads(xs, ys, side, border, box))
+        nodes.append(ys*grid.width + xs)
+    return np.concatenate(rects).astype(np.float32).reshape(-1, 4), np.concatenate(nodes)
+
+def get_bar_quads(rects, bar_nodes, nodes, color):
+
+    # the bars of the given nodes in one color, or all of them if nodes is None
+    if nodes is not None:
+        rects = rects[np.isin(bar_nodes, nodes)]
+    return rects, np.broadcast_to(np.array(color, dtype=np.float32), (len(rects), 3))
+
+def get_hovered_edge_quads(grid, pair, border, box=1.0, mask=None):
+
+    # the hovered edge of edge mode, pair as in utils.pair_to_string. mask is the boundary
+    # mask of the whole grid, without one the mask around the edge is computed.
+    if pair == None:
+        return EMPTY_QUADS
+    a, b = (int(node) for node in pair.split())
+    a, b = min(a, b), max(a, b)
+    if a < 0 or b >= grid.size:
+        return EMPTY_QUADS
+    x, y = grid.coords(a)
+    side = SIDE_RIGHT if b == a+1 and x < grid.width-1 else SIDE_DOWN
+    if side == SIDE_DOWN and b != a+grid.width:
+        return EMPTY_QUADS
+    if mask is None:
+        cell_mask = int(get_boundary_mask(grid, (x, y, x+1, y+1))[0, 0])
+    else:
+        cell_mask = int(mask[y, x])
+
+    # both cells are voxels
+    if not cell_mask & (side << NEIGHBOR_SHIFT):
+        return EMPTY_QUADS
+
+    edge_color = colors.EDGE_SELECTED if cell_mask & side else colors.EDGE_FULL
+    edge_color = dim(edge_color, *HOVER_EDGE)
+    rect = get_edge_quad(grid, a, b, border, box, 2)
+    return np.array([rect], dtype=np.float32), np.array([edge_color], dtype=np.float32)
+
+def get_edge_quad(grid, a, b, border, box=1.0, factor=2):
+
+    # the bar between two adjacent cells, made thicker across the edge by factor
+    a, b = min(a, b), max(a, b)
+    x, y = grid.coords(a)
+    side = SIDE_RIGHT if b == a+1 and x < grid.width-1 else SIDE_DOWN
+    rect = get_side_quads(np.array([x]), np.array([y]), side, border, box)[0].tolist()
+    return utils.make_thicker(*rect, factor)
+
+def get_type_mipmaps(grid):
+
+    # RGB images of the cell types through the TYPE_COLORS lookup table, one texel per cell,
+    # followed by the mip levels of a texture down to 1x1. Each level halves the one before
+    # (rounded down, as OpenGL expects) by averaging 2x2 blocks.
+    image = TYPE_COLORS[np.minimum(grid.types, len(TYPE_COLORS)-1)]
+    levels = [image]
+    while image.shape[0] > 1 or image.shape[1] > 1:
+        height, width = max(image.shape[0]//2, 1), max(image.shape[1]//2, 1)
+        sy, sx = (2 if image.shape[0] > 1 else 1), (2 if image.shape[1] > 1 else 1)
+        image = image[:height*sy, :width*sx].reshape(height, sy, width, sx, 3).mean(axis=(1, 3))
+        levels.append(image)
+    return [np.round(level*255).astype(np.uint8) for level in levels]
+
+def to_vertices(rects, quad_colors):
+
+    # interleaved x, y, r, g, b float32 vertices, four per quad in the order render_voxel
+    # used: (lx, ly), (lx, hy), (hx, hy), (hx, ly)
+    count = len(rects)
+    vertices = np.empty((count, 4, 5), dtype=np.float32)
+    vertices[:, :, 0] = rects[:, [0, 0, 2, 2]]
+    vertices[:, :, 1] = rects[:, [1, 3, 3, 1]]
+    vertices[:, :, 2:] = np.asarray(quad_colors, dtype=np.float32).reshape(-1, 1, 3)
+    return vertices.reshape(-1, 5)
@@ -0,0 +1,60 @@
+import time
+import glfw
+
+# How the main loop waits between iterations.
+#
+#   events  while the user is interacting (dragging, painting, holding keys, scrolling) or
+#           frames are being drawn, iterations are paced at the frame rate, and for LINGER
+#           seconds after that. Otherwise the loop blocks in glfw.wait_events_timeout until
+#           input arrives, at most IDLE_TIMEOUT so the Tk GUI is still serviced. A wait that
+#           ends without window input or a change to the scene only services Tk, the frame
+#           (view paging, viewer, env and GUI sync) is skipped, see main.
+#   poll    never blocks, events are polled every iteration and frames are paced by the
+#           viewer's timer. Kept to compare latency and CPU use against.
+
+LOOP_MODES = ('events', 'poll')
+IDLE_TIMEOUT = 0.1
+LINGER = 0.5
+
+class Scheduler:
+    def __init__(self, mode='events', fps=30, idle_timeout=IDLE_TIMEOUT, linger=LINGER):
+        if mode not in LOOP_MODES:
+            raise ValueError(f'unknown loop mode {mode!r}, expected one of {LOOP_MODES}')
+        self.mode = mode
+        self.fps = fps
+        self.idle_timeout = idle_timeout
+        self.linger = linger
+
+        self.frame_start = time.perf_counter()
+        self.last_active = None
+        self.idle = False
+
+    @property
+    def paces_frames(self):
+        # in events mode the viewer draws as soon as the scene changes
+        return self.mode == 'events'
+
+    def is_lingering(self, now):
+        return self.last_active != None and now - self.last_active < self.linger
+
+    def wait(self, active):
+
+        # call once per iteration, active if there is input or drawing in progress
+        now = time.perf_counter()
+        if active:
+            self.last_active = now
+
+        # idle if the wait blocked for input, the next iteration may then skip the frame
+        self.idle = False
+        if self.mode == 'poll':
+            glfw.poll_events()
+        elif self.is_lingering(now):
+            remaining = 1/self.fps - (now - self.frame_start)
+            if remaining > 0:
+                time.sleep(remaining)
+            glfw.poll_events()
+        else:
+            glfw.wait_events_timeout(self.idle_timeout)
+            self.idle = True
+
+        self.frame_start = time.perf_counter()
@@ -15,12 +15,7 @@ HAND_CURSOR = 1
 import random
 import numpy as np
 
-class Node:
-    def __init__(self, type):
-        self.type = type
-        self.neighbors = {}
-        self.id = None
-        self.old_id = None
+from grid_core import Grid, label_components
 
 class Object:
     def __init__(self):
@@ -39,28 +34,7 @@ def flip_y(idx, width, height):
     return y*width + x
 
 def make_blank_grid(width, height):
-    grid = []
-    for i in range(height):
-        grid.append([])
-        for j in range(width):
-            grid[-1].append(Node(0))
-            # if (i-3)^2 + (j-3)^2 > 5:
-            #     grid[-1].append(Node(0))
-            # else:
-            #     grid[-1].append(Node(random.randint(1, 5)))
-    return grid
-
-def set_ids(grid):
-    count = 0
-    for row in grid:
-        for node in row:
-            node.id = count
-            count += 1
-
-def set_old_ids(grid):
-    for row in grid:
-        for node in row:
-            node.old_id = node.id
+    return Grid(width, height)
 
 def pair_to_string(a, b):
     if a < b:
@@ -78,6 +52,25 @@ def make_thicker(lx, ly, hx, hy, factor):
         hy += (hy - avg)*(factor-1)
     return lx, ly, hx, hy
 
+def get_line(x0, y0, x1, y1):
+
+    # cells from (x0, y0) to (x1, y1) crossed by the line between their centers, one step
+    # along one axis at a time so consecutive cells share a side
+    dx, dy = abs(x1-x0), abs(y1-y0)
+    sx, sy = (1 if x1 > x0 else -1), (1 if y1 > y0 else -1)
+    x, y = x0, y0
+    out = [(x, y)]
+    ix, iy = 0, 0
+    while ix < dx or iy < dy:
+        if (1+2*ix)*dy < (1+2*iy)*dx:
+            x += sx
+            ix += 1
+        else:
+            y += sy
+            iy += 1
+        out.append((x, y))
+    return out
+
 def get_node_by_index(grid, index):
     grid_height = len(grid)
     grid_width = len(grid[0])
@@ -132,53 +125,10 @@ def is_valid(grid, x, y):
     return True
 
 def get_objects(grid):
-    grid_height = len(grid)
-    grid_width = len(grid[0])
-    objects_grid = []
-    discovered = {}
-    
-    for i in range(grid_height):
-        objects_grid.append([])
-        for j in range(grid_width):
-            objects_grid[-1].append(-1)
-
-    object_count = 0
-    for i in range(grid_height):
-        for j in range(grid_width):
-            node = grid[i][j]
-            if node.type == CELL_EMPTY or node.id in discovered:
-                continue
-            flood_fill_explore(node.id, grid, objects_grid, discovered, object_count)
-            object_count += 1
-    
+    labels, components = label_components(grid)
+
     objects = {}
-    for i in range(grid_height):
-        for j in range(grid_width):
-            object_id = objects_grid[i][j]
-            if object_id == -1:
-                continue
-            if not object_id in objects:
-                objects[object_id] = Object()
-            objects[object_id].nodes[grid[i][j].id] = True
+    for object_id, nodes in enumerate(components):
+        objects[object_id] = Object()
+        objects[object_id].nodes = dict.fromkeys(nodes.tolist(), True)
     return objects
-
-def flood_fill_explore(index, grid, objects_grid, discovered, object_count):
-    
-    grid_height = len(grid)
-    grid_width = len(grid[0])
-    x, y = index%grid_width, index//grid_width
-
-    discovered[index] = True
-    objects_grid[y][x] = object_count
-
-    nodes = [get_left(grid, index), get_right(grid, index), get_up(grid, index), get_down(grid, index)]
-    for node in nodes:
-        if node == None or node.type == CELL_EMPTY or node.id in discovered:
-            continue
-        if not index in node.neighbors:
-            continue
-        flood_fill_explore(node.id, grid, objects_grid, discovered, object_count)
-
-
-    
-
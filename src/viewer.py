@@ -13,6 +13,8 @@ try:
 except ImportError:
     pass
 
+import ctypes
+import numpy as np
 import glfw
 from OpenGL.GL import *
 from OpenGL.GLU import *
@@ -20,9 +22,28 @@ from OpenGL.GLUT import *
 
 import colors
 import utils
+import scene_geometry
+import profiler
+import input_events
 
 from evogym import Timer
 
+# neighbor offsets in the order hit boxes are tested
+DIRECTIONS = {
+    'l': (-1, 0, scene_geometry.SIDE_LEFT),
+    'r': (1, 0, scene_geometry.SIDE_RIGHT),
+    'u': (0, -1, scene_geometry.SIDE_UP),
+    'd': (0, 1, scene_geometry.SIDE_DOWN)}
+PICK_RADIUS = 2
+
+# minimum number of cells built around the visible ones
+RENDER_MARGIN = 4
+
+# below scene_geometry.LOD_ZOOM the grid is drawn as one texture without edges, zooming
+# there goes in steps of LOD_ZOOM_STEP down to MIN_ZOOM
+LOD_ZOOM_STEP = 1.25
+MIN_ZOOM = 0.05
+
 class Viewer:
 
     has_init_glfw = False
@@ -76,13 +97,20 @@ class Viewer:
         self.cam_pos_x = (self.cam_width*self.box_thickness + (self.cam_width+1)*self.border_thickness)/2
         self.cam_pos_y = (self.cam_height*self.box_thickness + (self.cam_height+1)*self.border_thickness)/2
 
-        glfw.set_scroll_callback(self.window, self.on_scroll)
+        # offset of the rendered grid when it is a window into a chunked world
+        self.origin_x = 0
+        self.origin_y = 0
+
+        # input of the current frame, see input_events
+        self.input_queue = input_events.InputQueue(self.window)
+        self.inputs = self.input_queue.snapshot()
         self.scroll = 0
 
         self.currently_hovered = None
         self.currently_selected = None
         self.mouse_press = False
         self.mouse_held = False
+        self.stroke = []
         self.right_mouse_press = False
         self.right_mouse_held = False
 
@@ -95,38 +123,71 @@ class Viewer:
         self.hand_cursor = glfw.create_standard_cursor(glfw.HAND_CURSOR)
         self.cursor_mode = utils.ARROW_CURSOR
 
-        self.timer = Timer(30)
+        self.fps = 30
+        self.timer = Timer(self.fps)
+
+        # frames are only drawn when the scene version changes or the window needs a redraw,
+        # and at most fps times a second unless the main loop paces frames itself. Window
+        # events are processed by the main loop, see scheduler.
+        self.scene_version = None
+        self.needs_redraw = True
+        self.use_timer = True
+        self.frame_drawn = False
+        glfw.set_window_refresh_callback(self.window, self.on_refresh)
+        glfw.set_framebuffer_size_callback(self.window, self.on_resize)
+
+        # vertex buffers of the render layers, name -> [buffer id, key it was built for, vertex count]
+        self.buffers = {}
+        self.buffer_grid = None
+        self.grid_version = 0
+        self.boundary = None
+
+        # shared with Env, which keeps it up to date while editing
+        self.boundary_mask = scene_geometry.BoundaryMask()
+
+        # cells of the grid the buffers are built for, see update_render_area
+        self.render_area = None
+
+        # cell type texture used when zoomed out, see render_texture
+        self.texture = None
+        self.texture_version = None
+        self.max_texture_size = None
+
+        # stage timing, replaced by the main loop's profiler
+        self.profiler = profiler.FrameProfiler()
 
     def load(self, file_name):
-        self.currently_hovered = None
-        self.currently_selected = None
+        self.clear_selection()
     
     def change_gs(self, new_width, new_height):
-        self.currently_hovered = None
-        self.currently_selected = None
+        self.clear_selection()
 
         height_diff = new_height - self.grid_height
         self.cam_pos_y += height_diff*(self.border_thickness + self.box_thickness)
         
 
+    def clear_selection(self,):
+        self.currently_hovered = None
+        self.currently_selected = None
+
+    def get_visible_cells(self,):
+        pitch = self.border_thickness + self.box_thickness
+        half_width, half_height = self.res_width/(2*self.zoom), self.res_height/(2*self.zoom)
+        x0, x1 = int((self.cam_pos_x - half_width)//pitch), int((self.cam_pos_x + half_width)//pitch) + 1
+        y0, y1 = int((self.cam_pos_y - half_height)//pitch), int((self.cam_pos_y + half_height)//pitch) + 1
+        return x0, y0, x1, y1
+
     def get_mouse_press(self,):
-        return glfw.get_mouse_button(self.window, 0)
+        return self.inputs.is_held(input_events.MOUSE_LEFT)
 
     def get_right_mouse_press(self,):
-        return glfw.get_mouse_button(self.window, 1)
+        return self.inputs.is_held(input_events.MOUSE_RIGHT)
 
     def get_mouse_pos(self,):
-        return glfw.get_cursor_pos(self.window)
+        return self.inputs.cursor
 
     def get_key_presses(self,):
-        keys = {
-            'left': glfw.KEY_LEFT, 'up': glfw.KEY_UP, 'right': glfw.KEY_RIGHT, 'down': glfw.KEY_DOWN,
-            'w': glfw.KEY_W, 'a': glfw.KEY_A, 's': glfw.KEY_S, 'd': glfw.KEY_D,
-            'z': glfw.KEY_Z, 'x': glfw.KEY_X, 'c': glfw.KEY_C, 'v': glfw.KEY_V, 'b': glfw.KEY_B, 'n': glfw.KEY_N}
-        out = {}
-        for key, value in keys.items():
-            out[key] = glfw.get_key(self.window, value)
-        return out
+        return self.inputs.keys
 
     def update_camera_pos(self,):
         if self.right_mouse_held:
@@ -149,91 +210,108 @@ class Viewer:
             if keys['down'] or keys['s']:
                 self.cam_pos_y += 2/self.zoom
 
-    def mouse_to_node(self, grid):
-        mx, my = self.get_mouse_pos()
+    def mouse_to_grid(self,):
+        return self.screen_to_grid(*self.get_mouse_pos())
+
+    def screen_to_grid(self, mx, my):
+
+        # a window position in camera coordinates and the cell it is over, through the inverse
+        # of to_camera
         mx, my = mx/self.res_width*2-1, -(my/self.res_height*2-1)
 
-        grid_height = len(grid)
-        grid_width = len(grid[0])
+        pitch = self.border_thickness + self.box_thickness
+        wx = mx*self.res_width/(2*self.zoom) + self.cam_pos_x - self.origin_x
+        wy = -my*self.res_height/(2*self.zoom) + self.cam_pos_y - self.origin_y
+        return mx, my, int(wx//pitch), int(wy//pitch)
+
+    def get_stroke(self, grid):
+
+        # cells the cursor passed over while the left button was held this frame. The gaps
+        # between the cursor positions are filled in, so a fast drag paints without holes.
+        cells = [self.screen_to_grid(x, y)[2:] for x, y in self.inputs.drag_path]
+        stroke = []
+        for (x0, y0), (x1, y1) in zip(cells[:-1], cells[1:]):
+            for x, y in utils.get_line(x0, y0, x1, y1):
+                if grid.is_valid(x, y):
+                    stroke.append(grid.index(x, y))
+        return list(dict.fromkeys(stroke))
+
+    def get_pick_cells(self, grid, cx, cy):
+
+        # cells around (cx, cy) in row-major order. Hit boxes, even the thickened edge zones,
+        # reach less than a cell beyond their own cell, so cells further away can not be hit
+        # and the first hit among these is the first hit in the whole grid.
+        x0, x1 = max(cx-PICK_RADIUS, 0), min(cx+PICK_RADIUS, grid.width-1)
+        y0, y1 = max(cy-PICK_RADIUS, 0), min(cy+PICK_RADIUS, grid.height-1)
+        for y in range(y0, y1+1):
+            for x in range(x0, x1+1):
+                yield x, y
 
-        for i in range(grid_height):
-            for j in range(grid_width):
-                y = i
-                x = j
+    def mouse_to_node(self, grid):
+        mx, my, cx, cy = self.mouse_to_grid()
 
-                lx = self.border_thickness + x*(self.border_thickness + self.box_thickness)
-                ly = self.border_thickness + y*(self.border_thickness + self.box_thickness)
+        for x, y in self.get_pick_cells(grid, cx, cy):
 
-                
-                hx = lx + self.box_thickness
-                hy = ly + self.box_thickness
+            lx = self.border_thickness + x*(self.border_thickness + self.box_thickness)
+            ly = self.border_thickness + y*(self.border_thickness + self.box_thickness)
 
-                lx, ly = self.to_camera(lx, ly)
-                hx, hy = self.to_camera(hx, hy)
+            hx = lx + self.box_thickness
+            hy = ly + self.box_thickness
 
-                if mx > lx and mx < hx:
-                    if my < ly and my > hy:
-                        return grid[i][j], grid[i][j].id
+            lx, ly = self.to_camera(lx, ly)
+            hx, hy = self.to_camera(hx, hy)
+
+            if mx > lx and mx < hx:
+                if my < ly and my > hy:
+                    return grid[y][x], grid.index(x, y)
 
         return (None, None)
 
+    def get_edge_box(self, x, y, direction):
+        if direction == 'l':
+            lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
+            hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
+        if direction == 'r':
+            lx, ly = ((x+1)*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
+            hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
+        if direction == 'u':
+            lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
+            hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
+        if direction == 'd':
+            lx, ly = (x*(self.border_thickness + self.box_thickness), (y+1)*(self.border_thickness + self.box_thickness))
+            hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
+        return lx, ly, hx, hy
+
     def mouse_to_edge(self, grid):
-        mx, my = self.get_mouse_pos()
-        mx, my = mx/self.res_width*2-1, -(my/self.res_height*2-1)
+        mx, my, cx, cy = self.mouse_to_grid()
+        mask = self.boundary_mask.get(grid)
 
-        grid_height = len(grid)
-        grid_width = len(grid[0])
+        for x, y in self.get_pick_cells(grid, cx, cy):
 
-        for i in range(grid_height):
-            for j in range(grid_width):
-                y = i
-                x = j
+            # empty cells are 0, voxels have a bar or a neighbor on every side
+            cell_mask = int(mask[y, x])
+            if cell_mask == 0:
+                continue
 
-                if grid[i][j].type == utils.CELL_EMPTY:
+            for direction, (dx, dy, side) in DIRECTIONS.items():
+                if not cell_mask & (side << scene_geometry.NEIGHBOR_SHIFT):
                     continue
 
-                for direction in ['l', 'r', 'u', 'd']:
-                    
-                    if direction == 'l':
-                        other = utils.get_left(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                    if direction == 'r':
-                        other = utils.get_right(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = ((x+1)*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                    if direction == 'u':
-                        other = utils.get_up(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-                    if direction == 'd':
-                        other = utils.get_down(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), (y+1)*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-                    lx, ly, hx, hy = utils.make_thicker(lx, ly, hx, hy, 5)
-                    lx, ly = self.to_camera(lx, ly)
-                    hx, hy = self.to_camera(hx, hy)
-
-                    if mx > lx and mx < hx:
-                        if my < ly and my > hy:
-                            return utils.pair_to_string(grid[i][j].id, other.id)
-            
+                lx, ly, hx, hy = utils.make_thicker(*self.get_edge_box(x, y, direction), 5)
+                lx, ly = self.to_camera(lx, ly)
+                hx, hy = self.to_camera(hx, hy)
+
+                if mx > lx and mx < hx:
+                    if my < ly and my > hy:
+                        return utils.pair_to_string(grid.index(x, y), grid.index(x+dx, y+dy))
+
         return None
 
-    def on_scroll(self, a, b, c):
-        self.scroll += c * 0.75
+    def on_refresh(self, window):
+        self.needs_redraw = True
+
+    def on_resize(self, window, width, height):
+        self.needs_redraw = True
 
     def get_window_close(self,):
         return glfw.window_should_close(self.window)
@@ -243,14 +321,28 @@ class Viewer:
 
     def update_zoom(self, ):
         if self.scroll != 0:
-            self.zoom += self.scroll/abs(self.scroll)
+            direction = self.scroll/abs(self.scroll)
+            if self.zoom + direction < scene_geometry.LOD_ZOOM:
+                self.zoom *= LOD_ZOOM_STEP**direction
+            else:
+                self.zoom += direction
         self.scroll = 0.25
         if abs(self.scroll) < 0.3:
             self.scroll = 0
-        if self.zoom < 5:
-            self.zoom = 5
+        if self.zoom < MIN_ZOOM:
+            self.zoom = MIN_ZOOM
+
+        self.border_thickness = scene_geometry.get_border_thickness(self.zoom)
+
+    def use_texture(self, grid):
+        if self.zoom >= scene_geometry.LOD_ZOOM:
+            return False
 
-        self.border_thickness = 0.02 + 2/self.zoom
+        # the limit does not change, it is queried once instead of stalling every frame
+        if self.max_texture_size == None:
+            glfw.make_context_current(self.window)
+            self.max_texture_size = glGetIntegerv(GL_MAX_TEXTURE_SIZE)
+        return grid.width <= self.max_texture_size and grid.height <= self.max_texture_size
 
     def update_hover(self, grid):
         self.currently_hovered = None
@@ -259,6 +351,10 @@ class Viewer:
         if node != None:
             self.currently_hovered = ('node', node, node_id, node.type)
 
+        # the texture has no edges, so they cannot be hovered or toggled while it is drawn
+        if self.use_texture(grid):
+            return
+
         pair = self.mouse_to_edge(grid)
         if pair != None:
             self.currently_hovered = ('edge', pair)
@@ -299,28 +395,16 @@ class Viewer:
 
     def update_mouse_press(self,):
 
-        if self.get_mouse_press():
-            if self.mouse_held == True:
-                self.mouse_press = False
-            else:
-                self.mouse_press = True
-                self.mouse_held = True
-        else:
-            self.mouse_held = False
-            self.mouse_press = False
+        # presses are taken from the input events, so a click between two frames is not lost
+        self.mouse_press = self.inputs.was_pressed(input_events.MOUSE_LEFT)
+        self.mouse_held = self.get_mouse_press()
     
     def update_right_mouse_press(self,):
 
-        if self.get_right_mouse_press():
-            if self.right_mouse_held == True:
-                self.right_mouse_press = False
-            else:
-                self.right_mouse_press = True
-                self.right_mouse_held = True
+        self.right_mouse_press = self.inputs.was_pressed(input_events.MOUSE_RIGHT)
+        self.right_mouse_held = self.get_right_mouse_press()
+        if self.right_mouse_held:
             self.cursor_mode = utils.HAND_CURSOR
-        else:
-            self.right_mouse_held = False
-            self.right_mouse_press = False
 
     def update_cursor(self,):
         if self.cursor_mode == utils.ARROW_CURSOR:
@@ -333,295 +417,256 @@ class Viewer:
         glfw.make_context_current(self.window)
         glViewport(0, 0, self.res_width, self.res_height)
         self.reset()
-
-        self.render_grid(grid, mode==utils.VOXELS)
-        self.render_voxels(grid, mode==utils.VOXELS)
-        self.render_edges(grid, objects, hovered_object_id, selected_object_id)
-        if mode == utils.EDGES:
-            self.render_selected_edges(grid)
-
-        glfw.swap_buffers(self.window)
-        glfw.poll_events()
-
-    def update_and_render(self, grid, objects, node_to_object, hovered_object_id, selected_object_id, just_altered, mode):
-
+        self.set_projection()
+
+        stage = self.profiler.stage
+        if self.use_texture(grid):
+            with stage('render_texture'):
+                self.render_texture(grid)
+            with stage('render_hover'):
+                self.render_hover(grid, mode==utils.VOXELS)
+        else:
+            self.update_render_area(grid)
+            with stage('render_grid'):
+                self.render_grid(grid, mode==utils.VOXELS)
+            with stage('render_edges'):
+                self.render_edges(grid, objects, hovered_object_id, selected_object_id)
+            if mode == utils.EDGES:
+                with stage('render_selected_edges'):
+                    self.render_selected_edges(grid)
+
+        with stage('swap_buffers'):
+            glfw.swap_buffers(self.window)
+
+    def get_scene_version(self, grid, objects, hovered_object_id, selected_object_id, mode):
+
+        # everything a frame depends on, the grid through its buffer version
+        self.update_grid_version(grid)
+        return (
+            self.grid_version, id(objects), len(objects),
+            hovered_object_id, selected_object_id,
+            self.currently_hovered, self.currently_selected, mode,
+            self.cam_pos_x, self.cam_pos_y, self.zoom, self.origin_x, self.origin_y,
+            self.res_width, self.res_height)
+
+    def update_and_render(self, grid, objects, node_to_object, hovered_object_id, selected_object_id, just_altered, mode, boundary_mask=None):
+
+        if boundary_mask != None:
+            self.boundary_mask = boundary_mask
+        self.inputs = self.input_queue.snapshot()
+        self.scroll += self.inputs.scroll * 0.75
         self.cursor_mode = utils.ARROW_CURSOR
         self.grid_width, self.grid_height = len(grid[0]), len(grid)
         self.update_resolution()
         self.update_zoom()
+        self.origin_x = grid.origin_x*(self.border_thickness + self.box_thickness)
+        self.origin_y = grid.origin_y*(self.border_thickness + self.box_thickness)
         self.update_right_mouse_press()
         self.update_camera_pos()
-        self.update_hover(grid)
+        with self.profiler.stage('update_hover'):
+            self.update_hover(grid)
         self.update_mouse_press()
-        self.update_selected(grid, node_to_object, just_altered)
+        self.stroke = self.get_stroke(grid) if self.mouse_held and mode == utils.VOXELS else []
+        with self.profiler.stage('update_selected'):
+            self.update_selected(grid, node_to_object, just_altered)
         self.update_cursor()
 
-        if self.timer.should_step():
-            self.render(grid, objects, hovered_object_id, selected_object_id, mode)
-            self.timer.step()
+        self.frame_drawn = False
+        if not self.use_timer or self.timer.should_step():
+            with self.profiler.stage('scene_version'):
+                scene_version = self.get_scene_version(grid, objects, hovered_object_id, selected_object_id, mode)
+            if self.needs_redraw or scene_version != self.scene_version:
+                self.needs_redraw = False
+                self.scene_version = scene_version
+                with self.profiler.stage('render'):
+                    self.render(grid, objects, hovered_object_id, selected_object_id, mode)
+                self.timer.step()
+                self.frame_drawn = True
 
-    def reset(self,):
-        glClearColor(*colors.CLEAR_COLOR)
-        glClear(GL_COLOR_BUFFER_BIT)
-
-    def render_edges(self, grid, objects, hovered_object_id, selected_object_id):
-        
-        grid_height = len(grid)
-        grid_width = len(grid[0])
-
-        for i in range(grid_height):
-            for j in range(grid_width):
-                y = i 
-                x = j
+    def set_fps(self, fps):
+        self.fps = fps
+        self.timer = Timer(fps)
 
-                if grid[i][j].type == utils.CELL_EMPTY:
-                    continue
+    def has_pending_input(self,):
 
-                hovered = hovered_object_id != None and grid[i][j].id in objects[hovered_object_id].nodes 
-                hovered = hovered or (selected_object_id != None and grid[i][j].id in objects[selected_object_id].nodes)
-
-                for direction in ['l', 'r', 'u', 'd']:
-
-                    if direction == 'l':
-                        other = utils.get_left(grid, grid[i][j].id)
-                        if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                    if direction == 'r':
-                        other = utils.get_right(grid, grid[i][j].id)
-                        if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                            continue
-                        lx, ly = ((x+1)*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                    if direction == 'u':
-                        other = utils.get_up(grid, grid[i][j].id)
-                        if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-                    if direction == 'd':
-                        other = utils.get_down(grid, grid[i][j].id)
-                        if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), (y+1)*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-
-                    dim_factor = 1.15
-                    dim_additive = 0.07
-                    voxel_color = colors.EDGE_FULL
-                    if hovered:
-                        voxel_color = colors.EDGE_SELECTED
-                        voxel_color = (voxel_color[0]*dim_factor+dim_additive, voxel_color[1]*dim_factor+dim_additive, voxel_color[2]*dim_factor+dim_additive)
-
-                    glColor3f(*voxel_color)
-                    
-                    self.render_voxel(*self.to_camera(lx, ly), *self.to_camera(hx, hy))
-
-        repeat_nodes = []
-        if hovered_object_id != None:
-            for node in objects[hovered_object_id].nodes:
-                repeat_nodes.append(node)
-        if selected_object_id != None:
-            for node in objects[selected_object_id].nodes:
-                repeat_nodes.append(node)
-
-        for index in repeat_nodes:
-            x, y = index%grid_width, index//grid_width
-            i, j = y, x 
-
-            if grid[i][j].type == utils.CELL_EMPTY:
-                    continue
+        # window events arrived since the last frame, or the window has to be drawn again
+        return self.needs_redraw or len(self.input_queue.events) > 0
 
-            hovered = hovered_object_id != None and grid[i][j].id in objects[hovered_object_id].nodes 
-            hovered = hovered or (selected_object_id != None and grid[i][j].id in objects[selected_object_id].nodes)
-
-            for direction in ['l', 'r', 'u', 'd']:
-
-                if direction == 'l':
-                    other = utils.get_left(grid, grid[i][j].id)
-                    if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                        continue
-                    lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                    hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                if direction == 'r':
-                    other = utils.get_right(grid, grid[i][j].id)
-                    if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                        continue
-                    lx, ly = ((x+1)*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                    hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                if direction == 'u':
-                    other = utils.get_up(grid, grid[i][j].id)
-                    if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                        continue
-                    lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                    hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-                if direction == 'd':
-                    other = utils.get_down(grid, grid[i][j].id)
-                    if other != None and other.type != utils.CELL_EMPTY and grid[i][j].id in other.neighbors:
-                        continue
-                    lx, ly = (x*(self.border_thickness + self.box_thickness), (y+1)*(self.border_thickness + self.box_thickness))
-                    hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-
-                dim_factor = 1.15
-                dim_additive = 0.07
-                voxel_color = colors.EDGE_FULL
-                if hovered:
-                    voxel_color = colors.EDGE_SELECTED
-                    voxel_color = (voxel_color[0]*dim_factor+dim_additive, voxel_color[1]*dim_factor+dim_additive, voxel_color[2]*dim_factor+dim_additive)
-
-                glColor3f(*voxel_color)
-                
-                self.render_voxel(*self.to_camera(lx, ly), *self.to_camera(hx, hy))
-
-    def render_selected_edges(self, grid):
-        
-        grid_height = len(grid)
-        grid_width = len(grid[0])
+    def is_active(self,):
 
-        for i in range(grid_height):
-            for j in range(grid_width):
-                y = i 
-                x = j
+        # input that moves or edits the scene is in progress, or a frame was just drawn
+        if self.frame_drawn or self.mouse_held or self.right_mouse_held:
+            return True
+        return any(self.get_key_presses().values())
 
-                if grid[i][j].type == utils.CELL_EMPTY:
-                    continue
+    def reset(self,):
+        glClearColor(*colors.CLEAR_COLOR)
+        glClear(GL_COLOR_BUFFER_BIT)
 
-                for direction in ['l', 'r', 'u', 'd']:
-                    
-                    if direction == 'l':
-                        other = utils.get_left(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                    if direction == 'r':
-                        other = utils.get_right(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = ((x+1)*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.border_thickness, ly+self.box_thickness+self.border_thickness*2)
-
-                    if direction == 'u':
-                        other = utils.get_up(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-                    if direction == 'd':
-                        other = utils.get_down(grid, grid[i][j].id)
-                        if other == None or other.type == utils.CELL_EMPTY:
-                            continue
-                        lx, ly = (x*(self.border_thickness + self.box_thickness), (y+1)*(self.border_thickness + self.box_thickness))
-                        hx, hy = (lx+self.box_thickness+self.border_thickness*2, ly+self.border_thickness)
-
-                    if not grid[i][j].id in other.neighbors:
-                        edge_color = colors.EDGE_SELECTED
-                    else:
-                        edge_color = colors.EDGE_FULL
-
-                    dim_factor = 1.07
-                    dim_additive = 0.07
-                    if self.currently_hovered != None and self.currently_hovered[0] == 'edge' and self.currently_hovered[1] == utils.pair_to_string(other.id, grid[i][j].id):
-                        edge_color = (edge_color[0]*dim_factor+dim_additive, edge_color[1]*dim_factor+dim_additive, edge_color[2]*dim_factor+dim_additive)
-
-                        glColor3f(*edge_color)
-
-                        lx, ly, hx, hy = utils.make_thicker(lx, ly, hx, hy, 2)
-                        self.render_voxel(*self.to_camera(lx, ly), *self.to_camera(hx, hy))
+    def set_projection(self,):
+
+        # the same mapping as to_camera, so vertex buffers can stay in world units
+        half_width, half_height = self.res_width/(2*self.zoom), self.res_height/(2*self.zoom)
+        cx, cy = self.cam_pos_x - self.origin_x, self.cam_pos_y - self.origin_y
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        glOrtho(cx - half_width, cx + half_width, cy + half_height, cy - half_height, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+
+    def update_grid_version(self, grid):
+
+        # Env changes the boundary mask's version with every edit, and get() with a new or
+        # resized grid. Zooming changes the border thickness and with it every quad.
+        self.boundary_mask.get(grid)
+        state = (self.boundary_mask.version, self.border_thickness)
+        if state != self.buffer_grid:
+            self.buffer_grid = state
+            self.grid_version += 1
+            self.boundary = None
+            self.render_area = None
+
+    def update_render_area(self, grid):
+
+        # buffers hold the visible cells plus a margin of half a screen, they are only
+        # rebuilt once the visible cells leave that area
+        x0, y0, x1, y1 = self.get_visible_cells()
+        x0, x1 = x0 - grid.origin_x, x1 - grid.origin_x
+        y0, y1 = y0 - grid.origin_y, y1 - grid.origin_y
+        visible = self.clip_area(grid, x0, y0, x1, y1)
+
+        area = self.render_area
+        if area == None or not (area[0] <= visible[0] and area[1] <= visible[1] and visible[2] <= area[2] and visible[3] <= area[3]):
+            margin_x, margin_y = max((x1-x0)//2, RENDER_MARGIN), max((y1-y0)//2, RENDER_MARGIN)
+            self.render_area = self.clip_area(grid, x0-margin_x, y0-margin_y, x1+margin_x, y1+margin_y)
+            self.boundary = None
+
+    def clip_area(self, grid, x0, y0, x1, y1):
+        x0, y0 = min(max(x0, 0), grid.width), min(max(y0, 0), grid.height)
+        return x0, y0, min(max(x1, x0), grid.width), min(max(y1, y0), grid.height)
+
+    def get_boundary(self, grid):
+        if self.boundary == None:
+            x0, y0, x1, y1 = self.render_area
+            mask = self.boundary_mask.get(grid)[y0:y1, x0:x1]
+            self.boundary = scene_geometry.get_boundary_quads(grid, mask, self.border_thickness, self.box_thickness, self.render_area)
+        return self.boundary
+
+    def set_buffer(self, name, key, build):
+
+        # build returns (quads, colors), it only runs when key differs from the one the
+        # buffer was last filled for
+        buffer = self.buffers.get(name)
+        if buffer == None:
+            buffer = self.buffers[name] = [glGenBuffers(1), None, 0]
+        if buffer[1] != key:
+            vertices = scene_geometry.to_vertices(*build())
+            if len(vertices) > 0:
+                glBindBuffer(GL_ARRAY_BUFFER, buffer[0])
+                glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_DYNAMIC_DRAW)
+                glBindBuffer(GL_ARRAY_BUFFER, 0)
+            buffer[1], buffer[2] = key, len(vertices)
+
+    def draw_buffer(self, name):
+        vbo, key, count = self.buffers[name]
+        if count == 0:
+            return
+
+        # interleaved x, y, r, g, b floats
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 20, ctypes.c_void_p(0))
+        glColorPointer(3, GL_FLOAT, 20, ctypes.c_void_p(8))
+        glDrawArrays(GL_QUADS, 0, count)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
 
     def render_grid(self, grid, render_hover):
-        grid_height = len(grid)
-        grid_width = len(grid[0])
-
-        pwidth = self.border_thickness + grid_width*(self.border_thickness + self.box_thickness)
-        pheight = self.border_thickness + grid_height*(self.border_thickness + self.box_thickness)
 
-        glColor3f(*colors.GRID_COLOR)
+        # background, empty cells and voxels, then the hovered cell on top of them
+        self.set_buffer('cells', (self.grid_version, self.render_area),
+            lambda: scene_geometry.get_cell_quads(grid, self.border_thickness, self.box_thickness, self.render_area))
+        self.draw_buffer('cells')
+        self.render_hover(grid, render_hover)
+
+    def render_hover(self, grid, render_hover):
+        hovered_node = None
+        if render_hover and self.currently_hovered != None and self.currently_hovered[0] == 'node':
+            hovered_node = self.currently_hovered[2]
+        self.set_buffer('hover', (self.grid_version, hovered_node),
+            lambda: scene_geometry.get_cell_quad(grid, hovered_node, self.border_thickness, self.box_thickness) if hovered_node != None else scene_geometry.EMPTY_QUADS)
+        self.draw_buffer('hover')
+
+    def render_texture(self, grid):
+
+        # the whole grid as one quad, each texel is the color of a cell. Mip levels average
+        # cells that are smaller than a pixel.
+        if self.texture == None:
+            self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        if self.texture_version != self.grid_version:
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            levels = scene_geometry.get_type_mipmaps(grid)
+            for level, image in enumerate(levels):
+                glTexImage2D(GL_TEXTURE_2D, level, GL_RGB, image.shape[1], image.shape[0], 0, GL_RGB, GL_UNSIGNED_BYTE, image)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels)-1)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            self.texture_version = self.grid_version
+
+        pitch = self.border_thickness + self.box_thickness
+        width, height = grid.width*pitch, grid.height*pitch
+
+        glEnable(GL_TEXTURE_2D)
+        glColor3f(1.0, 1.0, 1.0)
         glBegin(GL_QUADS)
-
-        glVertex2f(*self.to_camera(0, 0))
-        glVertex2f(*self.to_camera(pwidth, 0))
-        glVertex2f(*self.to_camera(pwidth, pheight))
-        glVertex2f(*self.to_camera(0, pheight))
-
+        glTexCoord2f(0, 0)
+        glVertex2f(0, 0)
+        glTexCoord2f(0, 1)
+        glVertex2f(0, height)
+        glTexCoord2f(1, 1)
+        glVertex2f(width, height)
+        glTexCoord2f(1, 0)
+        glVertex2f(width, 0)
         glEnd()
+        glDisable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, 0)
 
-        for i in range(grid_height):
-            for j in range(grid_width):
-                y = i
-                x = j
-
-                if grid[i][j].type != utils.CELL_EMPTY:
-                    continue
-                
-                voxel_color = colors.EMPTY_VOXEL
-                
-                dim_factor = 0.96
-                dim_additive = -0.05
-                if self.currently_hovered != None and self.currently_hovered[0] == 'node' and self.currently_hovered[2] == grid[i][j].id and render_hover:
-                    voxel_color = (voxel_color[0]*dim_factor+dim_additive, voxel_color[1]*dim_factor+dim_additive, voxel_color[2]*dim_factor+dim_additive)
-
-                glColor3f(*voxel_color)
-
-                lx, ly = (x*(self.border_thickness + self.box_thickness)+self.border_thickness, y*(self.border_thickness + self.box_thickness)+self.border_thickness)
-                hx, hy = (lx+self.box_thickness, ly+self.box_thickness)
-                self.render_voxel(*self.to_camera(lx, ly), *self.to_camera(hx, hy))
+    def render_edges(self, grid, objects, hovered_object_id, selected_object_id):
 
-    def render_voxels(self, grid, render_hover):
-        grid_height = len(grid)
-        grid_width = len(grid[0])
+        # bars of the hovered and selected objects are drawn again on top in their own color
+        self.set_buffer('edges', (self.grid_version, self.render_area),
+            lambda: scene_geometry.get_bar_quads(*self.get_boundary(grid), None, colors.EDGE_FULL))
+        self.draw_buffer('edges')
 
-        for i in range(grid_height):
-            for j in range(grid_width):
-                y = i # grid_height - (i+1)
-                x = j
+        highlighted = tuple(object_id for object_id in (hovered_object_id, selected_object_id) if object_id != None and object_id in objects)
+        self.set_buffer('highlight', (self.grid_version, self.boundary_mask.version, id(objects), highlighted),
+            lambda: self.get_highlight_quads(grid, objects, highlighted))
+        self.draw_buffer('highlight')
 
-                if grid[i][j].type == utils.CELL_EMPTY:
-                    continue
+    def get_highlight_quads(self, grid, objects, highlighted):
+        if len(highlighted) == 0:
+            return scene_geometry.EMPTY_QUADS
+        bars = [bar for object_id in highlighted for bar in self.boundary_mask.get_object_bars(grid, object_id, objects[object_id].nodes)]
+        rects = scene_geometry.get_object_bar_quads(grid, bars, self.border_thickness, self.box_thickness)
+        return rects, np.broadcast_to(np.array(scene_geometry.HIGHLIGHT_EDGE_COLOR, dtype=np.float32), (len(rects), 3))
 
-                
-                if grid[i][j].type == utils.CELL_RIGID:
-                    voxel_color = colors.RIGID_VOXEL
-                if grid[i][j].type == utils.CELL_SOFT:
-                    voxel_color = colors.SOFT_VOXEL
-                if grid[i][j].type == utils.CELL_ACT_H:
-                    voxel_color = colors.ACT_H_VOXEL
-                if grid[i][j].type == utils.CELL_ACT_V:
-                    voxel_color = colors.ACT_V_VOXEL
-                if grid[i][j].type == utils.CELL_FIXED:
-                    voxel_color = colors.FIXED_VOXEL
-
-                dim_factor = 1.05
-                dim_additive = 0.07
-                if self.currently_hovered != None and self.currently_hovered[0] == 'node' and self.currently_hovered[2] == grid[i][j].id and render_hover:
-                    voxel_color = (voxel_color[0]*dim_factor+dim_additive, voxel_color[1]*dim_factor+dim_additive, voxel_color[2]*dim_factor+dim_additive)
-
-                glColor3f(*voxel_color)
-                
-                lx, ly = (x*(self.border_thickness + self.box_thickness), y*(self.border_thickness + self.box_thickness))
-                hx, hy = (lx+self.box_thickness+self.border_thickness, ly+self.box_thickness+self.border_thickness)
-                self.render_voxel(*self.to_camera(lx, ly), *self.to_camera(hx, hy))
+    def render_selected_edges(self, grid):
 
-    def render_voxel(self, lx, ly, hx, hy):
-        glBegin(GL_QUADS)
-        glVertex2f(lx, ly)
-        glVertex2f(lx, hy)
-        glVertex2f(hx, hy)
-        glVertex2f(hx, ly)
-        glEnd()
+        # the hovered edge, thicker than the bars around it
+        pair = None
+        if self.currently_hovered != None and self.currently_hovered[0] == 'edge':
+            pair = self.currently_hovered[1]
+        self.set_buffer('selected_edge', (self.grid_version, pair),
+            lambda: scene_geometry.get_hovered_edge_quads(grid, pair, self.border_thickness, self.box_thickness, self.boundary_mask.get(grid)))
+        self.draw_buffer('selected_edge')
 
     def to_camera(self, x, y):
+        x, y = x + self.origin_x, y + self.origin_y
         px, py = 2*(x-self.cam_pos_x)*self.zoom/self.res_width, -2*(y-self.cam_pos_y)*self.zoom/self.res_height
         return (px, py)
 
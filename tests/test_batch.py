@@ -0,0 +1,90 @@
+import json
+import os
+import pytest
+
+import batch
+import data_manager
+from worlds import build_env, get_state, load_state
+
+def make_library(tmp_path):
+    library = tmp_path / 'exported'
+    library.mkdir()
+    for seed in range(3):
+        env = build_env(seed)
+        data_manager.DataManager().save(str(library / f'world_{seed}.json'), env.grid, env.objects)
+    (library / 'broken.json').write_text('{"grid_width": 3, "grid_height": 1, "objects": {')
+    return library
+
+def options(library, **kwargs):
+    out = {'to': None, 'out': None, 'base': str(library), 'size': (32, 32)}
+    out.update(kwargs)
+    return out
+
+def run(command, library, journal_path=None, resume=False, **kwargs):
+    files = batch.find_files([str(library)])
+    return batch.run(command, files, options(library, **kwargs), jobs=2, journal_path=journal_path, resume=resume, progress=False)
+
+def test_validate(tmp_path):
+    library = make_library(tmp_path)
+    summary = run('validate', library)
+    assert (summary['files'], summary['ok'], summary['failed']) == (4, 3, 1)
+    broken = [result for result in summary['results'] if not result['ok']]
+    assert broken[0]['path'].endswith('broken.json') and 'Could not load' in broken[0]['errors'][0]
+
+def test_check_state_reports_problems():
+    env = build_env(0)
+    objects = {object_id: obj.copy() for object_id, obj in env.objects.items()}
+    first, second = list(objects.values())[:2]
+    second.name = first.name
+    errors = batch.check_state(env.grid, objects)
+    assert errors == [f'object name {first.name!r} is used 2 times']
+
+def test_convert(tmp_path):
+    library = make_library(tmp_path)
+    out = tmp_path / 'converted'
+    summary = run('convert', library, to='.npz', out=str(out))
+    assert summary['ok'] == 3
+    env = build_env(1)
+    assert load_state(str(out / 'world_1.npz')) == get_state(env.grid, env.objects)
+
+def test_colliding_outputs_are_refused(tmp_path):
+    library = make_library(tmp_path)
+    env = build_env(0)
+    data_manager.DataManager().save(str(library / 'world_0.npz'), env.grid, env.objects)
+    summary = run('convert', library, to='.egw', out=str(tmp_path / 'out'))
+    refused = sorted(os.path.basename(result['path']) for result in summary['results'] if any('would also be written' in error for error in result['errors']))
+    assert refused == ['world_0.json', 'world_0.npz']
+
+def test_resume(tmp_path):
+    library = make_library(tmp_path)
+    journal_path = str(tmp_path / 'journal.jsonl')
+    first = run('stats', library, journal_path)
+    with open(journal_path) as infile:
+        entries = [json.loads(line) for line in infile]
+    assert all(entry['command'] == 'stats' and entry['options']['size'] == [32, 32] for entry in entries)
+
+    # finished files are skipped, changed files are processed again
+    env = build_env(2)
+    env.remove_node(next(iter(env.node_to_object)))
+    data_manager.DataManager().save(str(library / 'world_2.json'), env.grid, env.objects)
+    second = run('stats', library, journal_path, resume=True)
+    assert second['files'] == first['files']
+    with open(journal_path) as infile:
+        rerun = [json.loads(line)['path'] for line in infile][len(entries):]
+    assert [os.path.basename(path) for path in rerun] == ['world_2.json']
+
+def test_resume_with_other_options(tmp_path):
+    library = make_library(tmp_path)
+    journal_path = str(tmp_path / 'journal.jsonl')
+    run('convert', library, journal_path, to='.npz', out=str(tmp_path / 'out'))
+    summary = run('convert', library, journal_path, resume=True, to='.egw', out=str(tmp_path / 'out'))
+    assert summary['ok'] == 3
+    assert all(os.path.exists(tmp_path / 'out' / f'world_{seed}.egw') for seed in range(3))
+
+def test_resume_needs_a_journal(tmp_path, capsys):
+    library = make_library(tmp_path)
+    with pytest.raises(SystemExit):
+        batch.main(['validate', str(library), '--resume'])
+    assert '--resume needs --report or --journal' in capsys.readouterr().err
+    with pytest.raises(ValueError):
+        batch.run('validate', [], options(library), resume=True)
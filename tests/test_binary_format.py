@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import data_manager
+from env import Env
+from worlds import build_env, get_state, load_state
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('seed', range(3))
+def test_save_and_load(tmp_path, compress, seed):
+    env = build_env(seed)
+    file_path = str(tmp_path / 'world.npz')
+    data_manager.DataManager().save(file_path, env.grid, env.objects, compress=compress)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_convert(tmp_path):
+    env = build_env(0)
+    dm = data_manager.DataManager()
+    json_path, binary_path, back_path = (str(tmp_path / name) for name in ('a.json', 'a.npz', 'b.json'))
+    dm.save(json_path, env.grid, env.objects)
+
+    # JSON to binary and back gives the same file
+    assert dm.convert(json_path, binary_path)
+    assert dm.convert(binary_path, back_path)
+    assert load_state(binary_path) == get_state(env.grid, env.objects)
+    with open(json_path) as a, open(back_path) as b:
+        assert a.read() == b.read()
+
+def test_format_is_detected_from_content(tmp_path):
+    env = build_env(1)
+    file_path = str(tmp_path / 'world.bin')
+    data_manager.DataManager().save_binary(file_path, env.grid, env.objects)
+    assert data_manager.DataManager().get_format(file_path) == 'binary'
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_empty_world(tmp_path):
+    env = Env()
+    file_path = str(tmp_path / 'empty.npz')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_broken_entry_is_named(tmp_path):
+    env = build_env(0)
+    file_path = str(tmp_path / 'world.npz')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    with np.load(file_path) as archive:
+        state = dict(archive)
+    state['object_offsets'] = state['object_offsets'][:-1]
+    np.savez(file_path, **state)
+
+    with pytest.warns(UserWarning, match='entry "object_offsets"'):
+        assert data_manager.DataManager().load(file_path) == None
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pytest
+
+import utils
+import data_manager
+from chunked_world import ChunkedWorld
+from env import Env
+from worlds import build_env, get_state, load_state
+
+def place(world, cells):
+
+    # cells are (x, y, object id, name), written through a grid of the whole world
+    grid, objects, node_to_object = world.read_grid(0, 0, world.width, world.height)
+    for x, y, object_id, name in cells:
+        index = grid.index(x, y)
+        if object_id == None:
+            grid.set_type(index, utils.CELL_EMPTY)
+            objects[node_to_object.pop(index)].nodes.pop(index)
+            continue
+        grid.set_type(index, utils.CELL_RIGID)
+        objects.setdefault(object_id, utils.Object()).name = name
+        objects[object_id].nodes[index] = True
+        node_to_object[index] = object_id
+        world.next_object_id = max(world.next_object_id, object_id+1)
+    objects = {object_id: obj for object_id, obj in objects.items() if len(obj.nodes) > 0}
+    world.write_grid(grid, objects, node_to_object)
+
+def read_names(file_path):
+    world = ChunkedWorld(file_path)
+    try:
+        grid, objects, node_to_object = world.read_grid(0, 0, world.width, world.height)
+        return sorted((obj.name, sorted(obj.nodes)) for obj in objects.values())
+    finally:
+        world.close()
+
+@pytest.mark.parametrize('seed', range(3))
+def test_save_and_load(tmp_path, seed):
+    env = build_env(seed)
+    file_path = str(tmp_path / 'world.egw')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_edit_in_place(tmp_path):
+    file_path = str(tmp_path / 'world.egw')
+    ChunkedWorld.create(file_path, 100, 20, chunk_size=8).close()
+
+    env = Env()
+    env.load(file_path)
+    env.add_nodes([env.grid.index(x, 3) for x in range(10)], utils.CELL_SOFT)
+    env.save(file_path)
+    env.close_world()
+    assert read_names(file_path) == [('new_object_1', [3*100 + x for x in range(10)])]
+
+def test_interrupted_flush_keeps_the_previous_version(tmp_path):
+    file_path = str(tmp_path / 'world.egw')
+    ChunkedWorld.create(file_path, 40, 10, chunk_size=8).close()
+    world = ChunkedWorld(file_path)
+    place(world, [(1, 1, 0, 'a'), (12, 1, 1, 'b'), (30, 8, 2, 'c')])
+    world.flush()
+    before = read_names(file_path)
+    with open(file_path, 'rb') as infile:
+        head = infile.read(world.data_offset)
+
+    # edit existing chunks, add a new one and change the names
+    place(world, [(1, 1, None, None), (2, 1, 0, 'a'), (12, 1, None, None), (20, 5, 3, 'd')])
+    world.flush()
+    world.close()
+    after = read_names(file_path)
+    assert after == [('a', [42]), ('c', [350]), ('d', [220])]
+
+    # a crash before the index and header were written leaves the previous world
+    with open(file_path, 'r+b') as outfile:
+        outfile.write(head)
+    assert read_names(file_path) == before
+
+def test_slots_are_reused(tmp_path):
+    file_path = str(tmp_path / 'world.egw')
+    ChunkedWorld.create(file_path, 16, 16, chunk_size=8).close()
+    world = ChunkedWorld(file_path)
+    for step in range(6):
+        place(world, [(step, 0, 0, 'a')])
+        world.flush()
+        if step == 1:
+            size = os.path.getsize(file_path)
+    world.close()
+
+    # two copies of the chunk alternate, only the name table grows
+    assert os.path.getsize(file_path) - size < 4*world.chunk_bytes
+    assert read_names(file_path) == [('a', list(range(6)))]
+
+def test_name_table_is_pruned(tmp_path):
+    file_path = str(tmp_path / 'world.egw')
+    ChunkedWorld.create(file_path, 24, 4, chunk_size=8).close()
+    world = ChunkedWorld(file_path)
+    place(world, [(0, 0, 0, 'a'), (10, 0, 1, 'b')])
+    world.flush()
+    place(world, [(10, 0, None, None)])
+    world.merge_ids(0, 5)
+    world.names[5] = 'merged'
+    world.flush()
+    world.close()
+
+    world = ChunkedWorld(file_path)
+    assert world.names == {5: 'merged'} and world.aliases == {0: 5}
+    world.close()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import numpy as np
+import pytest
+
+import utils
+import data_manager
+from env import Env
+from worlds import build_env, get_state, load_state
+
+def test_delta_saves(tmp_path):
+    file_path = str(tmp_path / 'world.json')
+    delta_path = file_path + data_manager.DELTA_SUFFIX
+    env = build_env(1)
+    env.save(file_path)
+    assert not os.path.exists(delta_path)
+
+    # add an object, remove part of another and rename a third
+    env.add_nodes([index for index in range(env.grid.width) if env.grid.types.reshape(-1)[index] == utils.CELL_EMPTY], utils.CELL_RIGID)
+    first = next(iter(env.objects.values()))
+    env.remove_node(next(iter(first.nodes)))
+    last = env.objects[max(env.objects)]
+    last.name = 'renamed'
+    env.save(file_path, delta=True)
+    assert os.path.exists(delta_path)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+    # a second delta on top of the first
+    env.remove_nodes(list(last.nodes))
+    env.save(file_path, delta=True)
+    assert len(data_manager.DataManager().read_delta(file_path)) == 2
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+    # a fresh editor continues appending to the delta file it loaded with
+    reloaded = Env()
+    reloaded.load(file_path)
+    assert get_state(reloaded.grid, reloaded.objects) == get_state(env.grid, env.objects)
+    empty = np.flatnonzero(reloaded.grid.types.reshape(-1) == utils.CELL_EMPTY)
+    reloaded.add_node(int(empty[-1]), utils.CELL_SOFT)
+    reloaded.save(file_path, delta=True)
+    assert len(data_manager.DataManager().read_delta(file_path)) == 3
+    assert load_state(file_path) == get_state(reloaded.grid, reloaded.objects)
+
+def test_delta_compaction(tmp_path):
+    file_path = str(tmp_path / 'world.json')
+    delta_path = file_path + data_manager.DELTA_SUFFIX
+    env = build_env(2)
+    env.compact_every = 2
+    env.save(file_path)
+
+    written = []
+    for step in range(3):
+        empty = np.flatnonzero(env.grid.types.reshape(-1) == utils.CELL_EMPTY)
+        env.add_node(int(empty[0]), utils.CELL_SOFT)
+        env.save(file_path, delta=True)
+        written.append(os.path.exists(delta_path))
+        assert load_state(file_path) == get_state(env.grid, env.objects)
+
+    # the third save rewrites the full file and removes the deltas
+    assert written == [True, True, False]
+
+def test_full_saves_without_delta(tmp_path):
+    file_path = str(tmp_path / 'world.json')
+    env = build_env(0)
+    env.save(file_path)
+    env.remove_node(next(iter(env.node_to_object)))
+    env.save(file_path)
+    assert not os.path.exists(file_path + data_manager.DELTA_SUFFIX)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_deltas_of_another_base_are_ignored(tmp_path):
+    file_path = str(tmp_path / 'world.json')
+    delta_path = file_path + data_manager.DELTA_SUFFIX
+    env = build_env(0)
+    env.save(file_path)
+    env.remove_node(next(iter(env.node_to_object)))
+    env.save(file_path, delta=True)
+    stale = str(tmp_path / 'stale.delta')
+    shutil.copy(delta_path, stale)
+
+    # a full save interrupted after replacing the file but before removing the delta file
+    env.add_node(int(np.flatnonzero(env.grid.types.reshape(-1) == utils.CELL_EMPTY)[0]), utils.CELL_RIGID)
+    env.save(file_path)
+    shutil.copy(stale, delta_path)
+    with pytest.warns(UserWarning, match='another version'):
+        assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_records_are_stamped_with_their_base(tmp_path):
+    file_path = str(tmp_path / 'world.json')
+    env = build_env(1)
+    env.save(file_path)
+    env.remove_node(next(iter(env.node_to_object)))
+    env.save(file_path, delta=True)
+
+    stat = os.stat(file_path)
+    records = data_manager.DataManager().read_delta(file_path)
+    assert [record['base'] for record in records] == [[stat.st_size, stat.st_mtime_ns]]
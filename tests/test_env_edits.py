@@ -0,0 +1,142 @@
+import json
+import numpy as np
+import pytest
+
+import utils
+import evogym_arrays
+from env import Env
+
+def make_env(width=16, height=12):
+    env = Env()
+    env.change_gs(width, height)
+    return env
+
+def check_objects(env):
+
+    # the incrementally maintained objects have to match a full relabel of the grid
+    expected = set(frozenset(obj.nodes) for obj in utils.get_objects(env.grid).values())
+    assert set(frozenset(obj.nodes) for obj in env.objects.values()) == expected
+    assert len(env.objects) == len(expected)
+
+    filled = np.flatnonzero(env.grid.types.reshape(-1) != utils.CELL_EMPTY)
+    assert sorted(env.node_to_object) == filled.tolist()
+    for object_id, obj in env.objects.items():
+        assert all(env.node_to_object[node] == object_id for node in obj.nodes)
+
+def filled_cells(env):
+    return np.flatnonzero(env.grid.types.reshape(-1) != utils.CELL_EMPTY).tolist()
+
+def empty_cells(env):
+    return np.flatnonzero(env.grid.types.reshape(-1) == utils.CELL_EMPTY).tolist()
+
+def adjacent_filled_pairs(env):
+    pairs = []
+    for index in filled_cells(env):
+        for other in env.grid.adjacent(index):
+            if index < other and env.grid.get_type(other) != utils.CELL_EMPTY:
+                pairs.append((index, other))
+    return pairs
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_edits_match_relabel(seed):
+    rng = np.random.default_rng(seed)
+    env = make_env()
+
+    for step in range(150):
+        op = rng.integers(4)
+        if op == 0 and len(empty_cells(env)) > 0:
+            cells = rng.choice(empty_cells(env), size=min(int(rng.integers(1, 6)), len(empty_cells(env))), replace=False)
+            env.add_nodes(cells.tolist(), int(rng.integers(1, 6)))
+        elif op == 1 and len(filled_cells(env)) > 0:
+            cells = rng.choice(filled_cells(env), size=min(int(rng.integers(1, 4)), len(filled_cells(env))), replace=False)
+            env.remove_nodes(cells.tolist())
+        elif op == 2 and len(adjacent_filled_pairs(env)) > 0:
+            pairs = adjacent_filled_pairs(env)
+            a, b = pairs[int(rng.integers(len(pairs)))]
+            env.toggle_connection(a, b)
+        elif op == 3:
+            x0, y0 = int(rng.integers(env.grid_width)), int(rng.integers(env.grid_height))
+            x1, y1 = int(rng.integers(env.grid_width)), int(rng.integers(env.grid_height))
+            line = [env.grid.index(x, y) for x, y in utils.get_line(x0, y0, x1, y1)]
+            env.paint_nodes(list(dict.fromkeys(line)), int(rng.integers(0, 6)))
+        check_objects(env)
+
+def test_single_edits():
+    env = make_env(5, 3)
+    row = [env.grid.index(x, 1) for x in range(5)]
+
+    for index in row:
+        env.add_node(index, utils.CELL_SOFT)
+    check_objects(env)
+    assert len(env.objects) == 1
+
+    # cutting the middle edge splits the row, reconnecting merges it again
+    env.toggle_connection(row[2], row[3])
+    check_objects(env)
+    assert len(env.objects) == 2
+    env.toggle_connection(row[2], row[3])
+    check_objects(env)
+    assert len(env.objects) == 1
+
+    env.remove_node(row[1])
+    check_objects(env)
+    assert len(env.objects) == 2
+
+    env.remove_nodes(row[:1] + row[2:])
+    check_objects(env)
+    assert env.objects == {}
+
+def test_load_normalizes_objects(tmp_path):
+
+    # "a" and "b" share an edge, "c" is made of two separate voxels
+    file_path = str(tmp_path / 'world.json')
+    with open(file_path, 'w') as outfile:
+        json.dump({'grid_width': 5, 'grid_height': 1, 'objects': {
+            'a': {'indices': [0, 1], 'types': [1, 1], 'neighbors': {'0': [1], '1': [0, 2]}},
+            'b': {'indices': [2], 'types': [2], 'neighbors': {'2': [1]}},
+            'c': {'indices': [4, 3], 'types': [3, 3], 'neighbors': {'3': [], '4': []}}}}, outfile)
+
+    env = Env()
+    env.load(file_path)
+    check_objects(env)
+    assert sorted((obj.name, sorted(obj.nodes)) for obj in env.objects.values())[:2] == [('a', [0, 1, 2]), ('c', [3])]
+    assert env.saved_file == None
+
+    env.remove_node(1)
+    check_objects(env)
+    assert all(len(obj.nodes) > 0 for obj in env.objects.values())
+    evogym_arrays.save_world_arrays(str(tmp_path / 'world.evogym.npz'), env.grid, env.objects)
+
+def test_load_keeps_consistent_files_resumable(tmp_path):
+    file_path = str(tmp_path / 'world.json')
+    env = make_env()
+    env.add_nodes([0, 1, 17, 40], utils.CELL_SOFT)
+    env.save(file_path)
+
+    loaded = Env()
+    loaded.load(file_path)
+    check_objects(loaded)
+    assert loaded.saved_file != None
+
+def test_scene_version(tmp_path):
+
+    # the main loop skips frames while this stays the same, every change has to show up
+    env = make_env(6, 4)
+    versions = [env.get_scene_version()]
+    assert env.get_scene_version() == versions[-1]
+
+    env.add_nodes([0, 1], utils.CELL_SOFT)
+    versions.append(env.get_scene_version())
+    env.edit_node(0, utils.CELL_RIGID)
+    versions.append(env.get_scene_version())
+    env.toggle_connection(0, 1)
+    versions.append(env.get_scene_version())
+    env.change_gs(7, 4)
+    versions.append(env.get_scene_version())
+
+    file_path = str(tmp_path / 'world.json')
+    env.save(file_path)
+    assert env.get_scene_version() == versions[-1]
+    env.load(file_path)
+    versions.append(env.get_scene_version())
+    assert len(set(versions)) == len(versions)
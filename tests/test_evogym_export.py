@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import utils
+import data_manager
+import evogym_arrays
+from env import Env
+from worlds import build_env, get_state, load_state
+
+def test_object_arrays():
+
+    # an L shape in the bottom left corner of a 4x3 grid, the vertical edge is cut
+    env = Env()
+    env.change_gs(4, 3)
+    env.add_nodes([env.grid.index(0, 1), env.grid.index(0, 2), env.grid.index(1, 2)], utils.CELL_RIGID)
+    env.edit_node(env.grid.index(1, 2), utils.CELL_ACT_H)
+    env.toggle_connection(env.grid.index(0, 1), env.grid.index(0, 2))
+    obj = env.objects[env.node_to_object[env.grid.index(0, 2)]]
+
+    body, connections, position = evogym_arrays.get_object_arrays(env.grid, obj)
+    assert body.tolist() == [[1, 3]]
+    assert connections.tolist() == [[0], [1]]
+    assert position.tolist() == [0, 0]
+
+@pytest.mark.parametrize('seed', range(3))
+def test_save_and_load(tmp_path, seed):
+    env = build_env(seed)
+    file_path = str(tmp_path / f'world{evogym_arrays.EXPORT_SUFFIX}')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+
+    grid_size, objects = evogym_arrays.load_world_arrays(file_path)
+    assert grid_size == (env.grid.width, env.grid.height)
+    assert [name for name, body, connections, position in objects] == [obj.name for obj in env.objects.values()]
+    assert data_manager.DataManager().get_format(file_path) == 'evogym'
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_editor_loads_exports(tmp_path):
+    env = build_env(1)
+    file_path = str(tmp_path / f'world{evogym_arrays.EXPORT_SUFFIX}')
+    env.save(file_path)
+
+    loaded = Env()
+    loaded.load(file_path)
+    assert get_state(loaded.grid, loaded.objects) == get_state(env.grid, env.objects)
+
+    # exports are always written in full
+    loaded.remove_node(next(iter(loaded.node_to_object)))
+    loaded.save(file_path, delta=True)
+    assert load_state(file_path) == get_state(loaded.grid, loaded.objects)
+
+def test_broken_export(tmp_path):
+    env = build_env(0)
+    file_path = str(tmp_path / f'world{evogym_arrays.EXPORT_SUFFIX}')
+    arrays = evogym_arrays.get_world_arrays(env.grid, env.objects)
+    del arrays['body_0']
+    np.savez(file_path, **arrays)
+    with pytest.warns(UserWarning, match='Could not load'):
+        assert data_manager.DataManager().load(file_path) == None
@@ -0,0 +1,95 @@
+import struct
+import zlib
+import numpy as np
+
+import colors
+import utils
+import headless
+import scene_geometry
+from worlds import build_env
+
+def to_color(color):
+    return np.round(np.asarray(color[:3], dtype=np.float64)*255).astype(np.uint8).tolist()
+
+def cell_pixel(grid, camera, width, height, x, y):
+
+    # the pixel at the center of cell (x, y)
+    border = scene_geometry.get_border_thickness(camera[2])
+    pitch = border + 1.0
+    px, py = headless.to_pixels(camera, width, height, border + x*pitch + 0.5, border + y*pitch + 0.5)
+    return int(py), int(px)
+
+def read_png(file_path):
+    with open(file_path, 'rb') as infile:
+        data = infile.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+
+    chunks = {}
+    offset = 8
+    while offset < len(data):
+        length, tag = struct.unpack('>I4s', data[offset:offset+8])
+        body = data[offset+8:offset+8+length]
+        assert struct.unpack('>I', data[offset+8+length:offset+12+length])[0] == zlib.crc32(tag + body) & 0xffffffff
+        chunks[tag] = body
+        offset += length + 12
+
+    width, height = struct.unpack('>II', chunks[b'IHDR'][:8])
+    rows = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width*3 + 1)
+    assert (rows[:, 0] == 0).all()
+    return rows[:, 1:].reshape(height, width, 3)
+
+def test_render_image():
+    env = build_env(0)
+    image = headless.render_image(env.grid, env.objects, 320, 200)
+    assert image.shape == (200, 320, 3) and image.dtype == np.uint8
+
+    # the margin around the grid is the background, cells show the colors of their types
+    assert image[0, 0].tolist() == to_color(colors.CLEAR_COLOR)
+    camera = headless.get_fit_camera(env.grid, 320, 200)
+    assert camera[2] >= scene_geometry.LOD_ZOOM
+    for x in range(env.grid.width):
+        for y in range(env.grid.height):
+            cell_type = env.grid.get_type(env.grid.index(x, y))
+            pixel = image[cell_pixel(env.grid, camera, 320, 200, x, y)].tolist()
+            if cell_type == utils.CELL_EMPTY:
+                assert pixel == to_color(colors.CLEAR_COLOR)
+            else:
+                assert pixel == to_color(scene_geometry.TYPE_COLORS[cell_type])
+
+def test_render_image_highlights():
+    env = build_env(1)
+    image = headless.render_image(env.grid, env.objects, 256, 256)
+
+    object_id = next(iter(env.objects))
+    node = next(iter(env.objects[object_id].nodes))
+    highlighted = headless.render_image(env.grid, env.objects, 256, 256,
+        hovered=('node', None, node, env.grid.get_type(node)), hovered_object_id=object_id)
+    assert (highlighted != image).any()
+
+    # nothing is highlighted outside of the voxel and the bars around the object
+    camera = headless.get_fit_camera(env.grid, 256, 256)
+    assert highlighted[0, 0].tolist() == image[0, 0].tolist()
+    other = next(index for index in range(env.grid.width*env.grid.height) if not index in env.objects[object_id].nodes and env.grid.get_type(index) == utils.CELL_EMPTY)
+    pixel = cell_pixel(env.grid, camera, 256, 256, other%env.grid.width, other//env.grid.width)
+    assert highlighted[pixel].tolist() == image[pixel].tolist()
+
+def test_render_image_zoomed_out():
+
+    # below LOD_ZOOM every pixel takes the color of the nearest cell
+    grid = utils.make_blank_grid(400, 300)
+    grid.types[:150, :200] = utils.CELL_RIGID
+    image = headless.render_image(grid, {}, 100, 80)
+    camera = headless.get_fit_camera(grid, 100, 80)
+    assert camera[2] < scene_geometry.LOD_ZOOM
+
+    colors_found = set(map(tuple, image.reshape(-1, 3).tolist()))
+    assert tuple(to_color(scene_geometry.TYPE_COLORS[utils.CELL_RIGID])) in colors_found
+    assert tuple(to_color(colors.CLEAR_COLOR)) in colors_found
+    assert len(colors_found) == 2
+
+def test_write_png(tmp_path):
+    env = build_env(2)
+    image = headless.render_image(env.grid, env.objects, 64, 48)
+    file_path = str(tmp_path / 'preview.png')
+    headless.write_png(file_path, image)
+    assert (read_png(file_path) == image).all()
@@ -0,0 +1,58 @@
+import json
+import pytest
+
+import data_manager
+from env import Env
+from worlds import build_env, get_state, load_state
+
+@pytest.mark.parametrize('seed', range(3))
+def test_save_and_load(tmp_path, seed):
+    env = build_env(seed)
+    file_path = str(tmp_path / 'world.json')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+def test_writer_matches_json_dump(tmp_path):
+    env = build_env(1)
+    dm = data_manager.DataManager()
+    file_path = str(tmp_path / 'world.json')
+    dm.save(file_path, env.grid, env.objects)
+
+    expected = {
+        'grid_width': env.grid.width,
+        'grid_height': env.grid.height,
+        'objects': {obj.name: dm.get_object_dict(env.grid, obj) for obj in env.objects.values()}}
+    with open(file_path) as infile:
+        assert infile.read() == json.dumps(expected, indent=4)
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1<<16])
+def test_reader_streams_objects(tmp_path, chunk_size):
+    env = build_env(2)
+    file_path = str(tmp_path / 'world.json')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    with open(file_path) as infile:
+        expected = json.load(infile)
+
+    seen = []
+    with open(file_path) as infile:
+        state = data_manager.JsonStreamReader(infile, chunk_size).read(lambda state, name, obj_data: seen.append((name, obj_data)))
+    assert state == {'grid_width': expected['grid_width'], 'grid_height': expected['grid_height'], 'objects': len(seen)}
+    assert seen == list(expected['objects'].items())
+
+def test_empty_world(tmp_path):
+    env = Env()
+    file_path = str(tmp_path / 'empty.json')
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    assert load_state(file_path) == get_state(env.grid, env.objects)
+
+@pytest.mark.parametrize('text', [
+    '{"grid_width": 3, "grid_height": 1, "objects": {}',
+    '{"grid_width": 3, "grid_height": 1, "objects": {}} {}',
+    '{"grid_width": 3, "objects": {}}',
+    '{"grid_width": 3, "grid_height": 1, "objects": {"a": {"indices": [0], "types": [1], "neighbors": {"0": []}}'])
+def test_incomplete_files_are_rejected(tmp_path, text):
+    file_path = str(tmp_path / 'world.json')
+    with open(file_path, 'w') as outfile:
+        outfile.write(text)
+    with pytest.warns(UserWarning, match='Could not load'):
+        assert data_manager.DataManager().load(file_path) == None
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import utils
+from grid_core import Grid, label_components
+
+def random_grid(width, height, fill, connect, seed):
+    rng = np.random.default_rng(seed)
+    grid = Grid(width, height)
+    grid.types[:] = np.where(rng.random((height, width)) < fill, rng.integers(1, 6, (height, width)), 0)
+    grid.right[:] = rng.random((height, width)) < connect
+    grid.down[:] = rng.random((height, width)) < connect
+    grid.right[:, -1] = False
+    grid.down[-1, :] = False
+    return grid
+
+def flood_fill_labels(grid):
+
+    # reference labeling, objects numbered in the row-major order their first cell is found
+    labels = np.full((grid.height, grid.width), -1, dtype=np.int32)
+    count = 0
+    for y in range(grid.height):
+        for x in range(grid.width):
+            if grid.types[y, x] == 0 or labels[y, x] != -1:
+                continue
+            labels[y, x] = count
+            stack = [(x, y)]
+            while len(stack) > 0:
+                cx, cy = stack.pop()
+                neighbors = []
+                if cx+1 < grid.width and grid.right[cy, cx]:
+                    neighbors.append((cx+1, cy))
+                if cx > 0 and grid.right[cy, cx-1]:
+                    neighbors.append((cx-1, cy))
+                if cy+1 < grid.height and grid.down[cy, cx]:
+                    neighbors.append((cx, cy+1))
+                if cy > 0 and grid.down[cy-1, cx]:
+                    neighbors.append((cx, cy-1))
+                for nx, ny in neighbors:
+                    if grid.types[ny, nx] != 0 and labels[ny, nx] == -1:
+                        labels[ny, nx] = count
+                        stack.append((nx, ny))
+            count += 1
+    return labels
+
+@pytest.mark.parametrize('fill, connect', [(0.3, 0.5), (0.7, 0.7), (0.9, 0.9), (1.0, 1.0), (0.6, 0.0)])
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_flood_fill(fill, connect, seed):
+    grid = random_grid(23, 17, fill, connect, seed)
+    labels, components = label_components(grid)
+
+    assert np.array_equal(labels, flood_fill_labels(grid))
+    assert len(components) == labels.max() + 1
+    for label, nodes in enumerate(components):
+        assert np.array_equal(np.sort(nodes), np.flatnonzero(labels.reshape(-1) == label))
+
+def test_edges_to_empty_cells_are_ignored():
+    grid = Grid(3, 1)
+    grid.types[0] = [1, 0, 1]
+    grid.right[0, :2] = True
+    labels, components = label_components(grid)
+    assert labels.tolist() == [[0, -1, 1]]
+    assert [nodes.tolist() for nodes in components] == [[0], [2]]
+
+def test_empty_grids():
+    # slicing the last column or row of an edge mask has to work without columns or rows
+    labels, components = label_components(Grid(4, 3))
+    assert (labels == -1).all() and components == []
+    labels, components = label_components(Grid(0, 0))
+    assert labels.shape == (0, 0) and components == []
+    labels, components = label_components(Grid(0, 3))
+    assert labels.shape == (3, 0) and components == []
+    labels, components = label_components(Grid(3, 0))
+    assert labels.shape == (0, 3) and components == []
+
+def test_large_filled_grid():
+    # a single object much larger than the recursion limit
+    grid = random_grid(1000, 1000, 1.0, 1.0, 0)
+    labels, components = label_components(grid)
+    assert len(components) == 1 and (labels == 0).all()
+
+    objects = utils.get_objects(grid)
+    assert len(objects) == 1 and len(objects[0].nodes) == grid.size
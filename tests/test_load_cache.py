@@ -0,0 +1,110 @@
+import os
+
+import utils
+import data_manager
+from load_cache import LoadCache
+from worlds import build_env, get_state
+
+def save_world(file_path, seed):
+    env = build_env(seed)
+    data_manager.DataManager().save(file_path, env.grid, env.objects)
+    return get_state(env.grid, env.objects)
+
+def cached_state(dm, file_path):
+    loaded_state = dm.load(file_path)
+    assert loaded_state != None
+    return get_state(loaded_state[2], loaded_state[3])
+
+def test_hits_and_misses(tmp_path):
+    cache = LoadCache()
+    dm = data_manager.DataManager(cache)
+    json_path = str(tmp_path / 'world.json')
+    binary_path = str(tmp_path / ('world' + data_manager.BINARY_EXTENSION))
+    expected = save_world(json_path, 0)
+    save_world(binary_path, 0)
+
+    assert cached_state(dm, json_path) == expected
+    assert cached_state(dm, json_path) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # a different file with different contents is parsed once
+    assert cached_state(dm, binary_path) == expected
+    assert cache.misses == 2
+    assert cache.stats()['entries'] == 2
+
+def test_identical_contents_share_an_entry(tmp_path):
+    cache = LoadCache()
+    dm = data_manager.DataManager(cache)
+    paths = [str(tmp_path / name) for name in ('a.json', 'b.json')]
+    for path in paths:
+        save_world(path, 1)
+
+    cached_state(dm, paths[0])
+    cached_state(dm, paths[1])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_changed_file_is_parsed_again(tmp_path):
+    cache = LoadCache()
+    dm = data_manager.DataManager(cache)
+    file_path = str(tmp_path / 'world.json')
+    save_world(file_path, 2)
+    cached_state(dm, file_path)
+
+    expected = save_world(file_path, 3)
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cached_state(dm, file_path) == expected
+    assert cache.misses == 2
+
+def test_hits_return_independent_copies(tmp_path):
+    dm = data_manager.DataManager(LoadCache())
+    file_path = str(tmp_path / 'world.json')
+    expected = save_world(file_path, 4)
+
+    grid, objects = dm.load(file_path)[2:4]
+    grid.types[:] = utils.CELL_EMPTY
+    for obj in objects.values():
+        obj.name = 'renamed'
+        obj.nodes.clear()
+    assert cached_state(dm, file_path) == expected
+
+def test_sidecar(tmp_path):
+    sidecar_dir = str(tmp_path / 'sidecar')
+    file_path = str(tmp_path / 'world.json')
+    expected = save_world(file_path, 5)
+
+    cached_state(data_manager.DataManager(LoadCache(sidecar_dir=sidecar_dir)), file_path)
+    assert len(os.listdir(sidecar_dir)) == 1
+
+    # a new session finds the parsed file in the sidecar directory
+    cache = LoadCache(sidecar_dir=sidecar_dir)
+    assert cached_state(data_manager.DataManager(cache), file_path) == expected
+    assert (cache.sidecar_hits, cache.misses) == (1, 0)
+
+def test_eviction(tmp_path):
+    paths = [str(tmp_path / f'world{seed}.json') for seed in range(3)]
+    for seed, path in enumerate(paths):
+        save_world(path, seed)
+
+    # room for two of the worlds, the least recently used one is dropped
+    cache = LoadCache()
+    dm = data_manager.DataManager(cache)
+    cached_state(dm, paths[0])
+    entry_bytes = cache.size
+    cache.max_bytes = entry_bytes*2 + entry_bytes//2
+    cached_state(dm, paths[1])
+    cached_state(dm, paths[0])
+    cached_state(dm, paths[2])
+    assert cache.evictions == 1
+    assert cache.size <= cache.max_bytes
+
+    cached_state(dm, paths[0])
+    assert cache.hits == 2
+    cached_state(dm, paths[1])
+    assert cache.misses == 4
+
+    # an entry larger than the whole cache is not kept
+    cache.clear()
+    cache.max_bytes = entry_bytes//2
+    cached_state(dm, paths[0])
+    assert cache.stats()['entries'] == 0
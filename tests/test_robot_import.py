@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import utils
+import robot_import
+from env import Env
+from grid_core import Grid
+
+# a 2x2 robot with an actuator, connected everywhere but between the two bottom voxels
+BODY = np.array([[1, 2], [3, 0]])
+CONNECTIONS = np.array([[0, 0], [1, 2]])
+
+def test_place_robots_at_offsets():
+    grid = Grid(8, 5)
+    pieces = robot_import.place_robots(grid, [
+        ('a', BODY, CONNECTIONS, (0, 0)),
+        ('b', BODY, None, (5, 3))])
+
+    # bottom left corners, rows counted from the bottom
+    assert grid.types[3:5, 0:2].tolist() == BODY.tolist()
+    assert grid.types[0:2, 5:7].tolist() == BODY.tolist()
+    assert grid.types.sum() == 2*BODY.sum()
+    assert sorted(name for name, nodes in pieces) == ['a', 'b']
+    assert all(len(nodes) == 3 for name, nodes in pieces)
+
+def test_split_robot_becomes_several_objects():
+    grid = Grid(4, 4)
+    pieces = robot_import.place_robots(grid, [('a', BODY, np.array([[0], [1]]), (1, 1))])
+    assert sorted((name, len(nodes)) for name, nodes in pieces) == [('a', 2), ('a_1', 1)]
+
+@pytest.mark.parametrize('position', [(-1, 0), (0, -1), (7, 0), (0, 4)])
+def test_out_of_bounds(position):
+    with pytest.raises(ValueError, match='does not fit'):
+        robot_import.place_robots(Grid(8, 5), [('a', BODY, None, position)])
+
+def test_overlap():
+    with pytest.raises(ValueError, match='overlaps'):
+        robot_import.place_robots(Grid(8, 5), [('a', BODY, None, (0, 0)), ('b', BODY, None, (1, 0))])
+
+    # empty voxels of the body may cover filled cells
+    grid = Grid(8, 5)
+    robot_import.place_robots(grid, [('a', np.array([[1, 1], [0, 1]]), None, (0, 0)), ('b', np.array([[1]]), None, (0, 0))])
+    assert grid.types[4, 0] == 1
+
+@pytest.mark.parametrize('connections, message', [
+    (np.array([[0], [3]]), 'not adjacent'),
+    (np.array([[0], [9]]), 'outside'),
+    (np.array([[1], [3]]), 'empty voxel'),
+    (np.array([0, 1]), r'\(2, n\)')])
+def test_invalid_connections(connections, message):
+    with pytest.raises(ValueError, match=message):
+        robot_import.place_robots(Grid(8, 5), [('a', BODY, connections, (0, 0))])
+
+def test_env_import(tmp_path):
+    env = Env()
+    env.add_nodes([env.grid.index(x, 9) for x in range(10)], utils.CELL_FIXED)
+    ground = env.objects[0].name
+
+    np.savez(tmp_path / 'a.npz', body=BODY, connections=CONNECTIONS)
+    np.savez(tmp_path / ground, BODY, CONNECTIONS)
+    imported = env.import_robot_files([str(tmp_path)])
+
+    # laid out in rows from the top left, names taken by existing objects are made unique
+    assert sorted(env.objects[object_id].name for object_id in imported) == ['a', f'{ground}_1']
+    assert env.grid.types[0:2, 0:2].tolist() == BODY.tolist()
+    assert env.grid.types[0:2, 3:5].tolist() == BODY.tolist()
+    assert set(imported) <= env.dirty_objects
+    assert set(frozenset(obj.nodes) for obj in env.objects.values()) == set(frozenset(obj.nodes) for obj in utils.get_objects(env.grid).values())
+
+def test_env_import_failure_leaves_editor_untouched():
+    env = Env()
+    env.add_node(0, utils.CELL_RIGID)
+    types, objects = env.grid.types.copy(), {object_id: sorted(obj.nodes) for object_id, obj in env.objects.items()}
+
+    with pytest.raises(ValueError):
+        env.import_robots([('a', BODY, None, (0, 8)), ('b', BODY, None, (0, 9))])
+    assert np.array_equal(env.grid.types, types)
+    assert {object_id: sorted(obj.nodes) for object_id, obj in env.objects.items()} == objects
+
+def test_compose_world(tmp_path):
+    for i in range(5):
+        np.savez(tmp_path / f'{i}.npz', BODY, CONNECTIONS)
+    grid, pieces = robot_import.compose_world(robot_import.iter_robots([str(tmp_path)]), width=7)
+    assert (grid.width, grid.height) == (7, 8)
+    assert [name for name, nodes in pieces] == ['0', '1', '2', '3', '4']
@@ -0,0 +1,79 @@
+import threading
+
+import utils
+import data_manager
+import saving
+from env import Env
+
+def blocking_save(saver):
+
+    # occupies the worker until the returned event is set
+    release = threading.Event()
+    saver.request('blocking', lambda: (lambda progress=None: release.wait()))
+    return release
+
+def get_objects(file_path):
+    loaded_state = data_manager.DataManager().load(file_path)
+    assert loaded_state != None
+    return {obj.name: sorted(obj.nodes) for obj in loaded_state[3].values()}
+
+def test_saves_run_one_at_a_time_and_coalesce():
+    saver = saving.BackgroundSaver()
+    release = blocking_save(saver)
+    written = []
+    for value in range(3):
+        saver.request('a', lambda value=value: (lambda progress=None: written.append(('a', value))))
+    saver.request('b', lambda: (lambda progress=None: written.append(('b', 0))))
+    assert saver.current == 'blocking' and list(saver.pending) == ['a', 'b']
+
+    release.set()
+    finished = saver.wait()
+    assert written == [('a', 2), ('b', 0)]
+    assert finished == [('blocking', None), ('a', None), ('b', None)]
+
+def test_errors_are_reported():
+    saver = saving.BackgroundSaver()
+
+    def snapshot():
+        raise ValueError('no snapshot')
+    saver.request('a', snapshot)
+
+    def write(progress=None):
+        raise OSError('disk full')
+    saver.request('b', lambda: write)
+    assert saver.wait() == [('a', 'ValueError: no snapshot'), ('b', 'OSError: disk full')]
+
+def test_queued_save_then_load(tmp_path):
+    env = Env()
+    env.add_nodes([0, 1], utils.CELL_RIGID)
+    names = {obj.name: sorted(obj.nodes) for obj in env.objects.values()}
+
+    other_path = str(tmp_path / 'other.json')
+    other = Env()
+    other.add_node(50, utils.CELL_SOFT)
+    other.save(other_path)
+
+    # the queued save keeps the state from when it was requested
+    release = blocking_save(env.saver)
+    save_path = str(tmp_path / 'saved.json')
+    env.save_in_background(save_path)
+    env.load(other_path)
+    env.change_gs(4, 4)
+    release.set()
+    assert env.saver.wait()[-1] == (save_path, None)
+    assert get_objects(save_path) == names
+
+def test_queued_delta_is_replaced_by_full_save(tmp_path):
+    save_path = str(tmp_path / 'saved.json')
+    env = Env()
+    env.add_node(0, utils.CELL_RIGID)
+    env.save(save_path)
+
+    release = blocking_save(env.saver)
+    env.add_node(5, utils.CELL_RIGID)
+    env.save_in_background(save_path, delta=True)
+    env.add_node(9, utils.CELL_RIGID)
+    env.save_in_background(save_path, delta=True)
+    release.set()
+    env.saver.wait()
+    assert get_objects(save_path) == {obj.name: sorted(obj.nodes) for obj in env.objects.values()}
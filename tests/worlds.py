@@ -0,0 +1,38 @@
+import numpy as np
+
+import utils
+import data_manager
+from env import Env
+
+# worlds and state comparisons shared by the tests
+
+def build_env(seed, width=14, height=9):
+
+    # a world with a few objects of mixed types, cut into pieces by removed edges
+    rng = np.random.default_rng(seed)
+    env = Env()
+    env.change_gs(width, height)
+    cells = rng.choice(width*height, size=width*height//2, replace=False)
+    for value, part in zip(range(1, 6), np.array_split(cells, 5)):
+        env.add_nodes(part.tolist(), value)
+    for _ in range(10):
+        filled = np.flatnonzero(env.grid.types.reshape(-1) != utils.CELL_EMPTY)
+        index = int(rng.choice(filled))
+        others = env.grid.connected_neighbors(index)
+        if len(others) > 0:
+            env.toggle_connection(index, others[0])
+    return env
+
+def get_state(grid, objects):
+    return (
+        grid.width, grid.height,
+        grid.types.tolist(), grid.right.tolist(), grid.down.tolist(),
+        {obj.name: frozenset(obj.nodes) for obj in objects.values()})
+
+def load_state(file_path):
+    loaded_state = data_manager.DataManager().load(file_path)
+    assert loaded_state != None
+    grid_width, grid_height, grid, objects, node_to_object, unnamed_obj_count = loaded_state
+    assert (grid_width, grid_height) == (grid.width, grid.height)
+    assert node_to_object == data_manager.DataManager().get_node_to_object(objects)
+    return get_state(grid, objects)